@@ -1,13 +1,18 @@
 from flask import Flask, jsonify
 from flask_swagger import swagger
+import os
 
 from database_migration.update import get_version
+from ekn.categories import get_registry
 from ekn.database import DatabaseManager
+from ekn.sessions import start_session_flusher
+from ekn.tasks import start_background_tasks
 from ekn.routes import (
     categories,
     change_security,
     gdpr_view,
     get_score,
+    get_score_job,
     get_current_key,
     get_vote_count,
     misc,
@@ -15,14 +20,24 @@ from ekn.routes import (
     register_service,
     register_user,
     registration,
+    submit_score_job,
     users,
     verify_credentials_route,
     version,
     vote,
+    votes,
 )
 
 # Update DB
 VERSION = get_version(DatabaseManager())
+# Compile every flavor up front
+get_registry().refresh()
+# Write this process' refreshed session keys in batches
+start_session_flusher()
+# Compact and sweep the database in the background.  Opt in, as only one
+# process per database should, e.g. not every gunicorn worker.
+if os.environ.get("EKN_BACKGROUND_TASKS") == "1":
+    start_background_tasks()
 
 app = Flask(__name__)
 
@@ -35,6 +50,7 @@ app.add_url_rule(
 )
 app.add_url_rule("/gdpr_view", view_func=gdpr_view, methods=["POST", "OPTIONS"])
 app.add_url_rule("/get_score", view_func=get_score, methods=["POST", "OPTIONS"])
+app.add_url_rule("/get_score_job", view_func=get_score_job, methods=["POST", "OPTIONS"])
 app.add_url_rule(
     "/get_current_key", view_func=get_current_key, methods=["POST", "OPTIONS"]
 )
@@ -57,6 +73,15 @@ app.add_url_rule(
 app.add_url_rule(
     "/get_total_votes", view_func=misc.get_total_votes, methods=["GET", "OPTIONS"]
 )
+app.add_url_rule(
+    "/get_cache_stats", view_func=misc.get_cache_stats, methods=["GET", "OPTIONS"]
+)
+app.add_url_rule(
+    "/get_query_stats", view_func=misc.get_query_stats, methods=["GET", "OPTIONS"]
+)
+app.add_url_rule(
+    "/get_score_stats", view_func=misc.get_score_stats, methods=["GET", "OPTIONS"]
+)
 app.add_url_rule(
     "/register_connection", view_func=register_connection, methods=["POST", "OPTIONS"]
 )
@@ -68,7 +93,15 @@ app.add_url_rule(
     view_func=registration.register_temp_user,
     methods=["POST", "OPTIONS"],
 )
+app.add_url_rule(
+    "/register_temp_users",
+    view_func=registration.register_temp_users,
+    methods=["POST", "OPTIONS"],
+)
 app.add_url_rule("/register_user", view_func=register_user, methods=["POST", "OPTIONS"])
+app.add_url_rule(
+    "/submit_score_job", view_func=submit_score_job, methods=["POST", "OPTIONS"]
+)
 app.add_url_rule(
     "/verify_credentials",
     view_func=verify_credentials_route,
@@ -76,6 +109,7 @@ app.add_url_rule(
 )
 app.add_url_rule("/version", view_func=version, methods=["GET"])
 app.add_url_rule("/vote", view_func=vote, methods=["POST", "OPTIONS"])
+app.add_url_rule("/votes", view_func=votes, methods=["POST", "OPTIONS"])
 
 
 @app.route("/")
@@ -0,0 +1,5 @@
+from app import app as flask_app
+from ekn.asgi import ASGIApp
+
+# Serve with `gunicorn -k asgi asgi:app`
+app = ASGIApp(flask_app)
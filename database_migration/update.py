@@ -8,9 +8,18 @@ from database_migration.versions import (
     v2_2_0,
     v2_2_1,
     v2_3_0,
+    v2_4_0,
+    v2_5_0,
+    v2_6_0,
+    v2_7_0,
+    v2_8_0,
+    v2_9_0,
+    v2_10_0,
+    v2_11_0,
 )
 from ekn import types
 from typing import TYPE_CHECKING
+import time
 import warnings
 
 if TYPE_CHECKING:
@@ -18,19 +27,33 @@ if TYPE_CHECKING:
 
 main_database_versions: types.DATABASE_VERSIONS = {
     "1.0.0": None,
-    "1.0.1": v1_0_1.update,
-    "1.1.0": v1_1_0.update,
-    "2.0.0": v2_0_0.update,
-    "2.0.1": v2_0_1.update,
-    "2.1.0": v2_1_0.update,
-    "2.1.1": v2_1_1.update,
-    "2.2.0": v2_2_0.update,
-    "2.2.1": v2_2_1.update,
-    "2.3.0": v2_3_0.update,
+    "1.0.1": v1_0_1.steps,
+    "1.1.0": v1_1_0.steps,
+    "2.0.0": v2_0_0.steps,
+    "2.0.1": v2_0_1.steps,
+    "2.1.0": v2_1_0.steps,
+    "2.1.1": v2_1_1.steps,
+    "2.2.0": v2_2_0.steps,
+    "2.2.1": v2_2_1.steps,
+    "2.3.0": v2_3_0.steps,
+    "2.4.0": v2_4_0.steps,
+    "2.5.0": v2_5_0.steps,
+    "2.6.0": v2_6_0.steps,
+    "2.7.0": v2_7_0.steps,
+    "2.8.0": v2_8_0.steps,
+    "2.9.0": v2_9_0.steps,
+    "2.10.0": v2_10_0.steps,
+    "2.11.0": v2_11_0.steps,
 }
 
 
 def update_database(database: "DatabaseManager") -> None:
+    """
+    Brings the database up to the latest version.
+
+    Each version is applied in its own transaction together with the new version
+    number, so an interrupted update resumes from the last version that finished.
+    """
     version = get_version(database)
     versions = list(main_database_versions.keys())
     if version not in versions:
@@ -39,8 +62,46 @@ def update_database(database: "DatabaseManager") -> None:
     index = versions.index(version)
     for v in versions[index + 1 :]:
         print(f"Updating database from v{version} to v{v}")
-        if main_database_versions[v]:  # If not None
-            main_database_versions[v](database)  # type: ignore
+        run_migration(database, v, main_database_versions[v] or [])
+        version = v
+
+
+def run_migration(
+    database: "DatabaseManager", version: str, steps: types.MIGRATION_STEPS
+) -> float:
+    """
+    Runs a version's steps in a single transaction, printing how long each took.
+
+    A step is either an SQL statement, an (SQL statement, parameters) tuple, or a
+    function which is passed the open database.  Returns the total time taken.
+    """
+    start = time.perf_counter()
+    with database as db:
+        db.execute("BEGIN")
+        try:
+            for i, step in enumerate(steps):
+                step_start = time.perf_counter()
+                if callable(step):
+                    step(db)
+                elif isinstance(step, tuple):
+                    db.execute(*step)
+                else:
+                    db.execute(step)
+                print(
+                    f"  Step {i + 1}/{len(steps)} took "
+                    + f"{time.perf_counter() - step_start:.3f}s"
+                )
+            db.execute(
+                "INSERT INTO etn_settings (setting, value) VALUES ('version', :version) "
+                + "ON CONFLICT(setting) DO UPDATE SET value=excluded.value",
+                {"version": version},
+            )
+        except BaseException:
+            db.conn.rollback()
+            raise
+    total = time.perf_counter() - start
+    print(f"Updated database to v{version} in {total:.3f}s")
+    return total
 
 
 def get_version(database: "DatabaseManager") -> str:
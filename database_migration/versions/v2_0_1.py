@@ -1,45 +1,26 @@
-from typing import TYPE_CHECKING
+from ekn.types import MIGRATION_STEPS
 
-if TYPE_CHECKING:
-    from ekn.database import DatabaseManager
+ETN_KEY = (
+    "833b334bb52dded02beb81bffea9f1e55f84db86363b32403d1e76"
+    + "254dfb798499f978c944519974faeeb98029bbc3f92fcf0eb7179d"
+    + "9b3ab95d12cc1a422319"
+)
+ETN_SALT = "dac0a578446b"
 
-
-def update(database: "DatabaseManager") -> None:
-    with database as db:
-        result = db.execute("SELECT * FROM services WHERE name='ETN'")
-        if result.fetchone():
-            db.execute(
-                "UPDATE services SET key=:key, salt=:salt WHERE name='ETN'",
-                {
-                    "key": "833b334bb52dded02beb81bffea9f1e55f84db86363b32403"
-                    + "d1e76254dfb798499f978c944519974faeeb98029bbc3f92f"
-                    + "cf0eb7179d9b3ab95d12cc1a422319",
-                    "salt": "dac0a578446b",
-                },
-            )
-        else:
-            db.execute(
-                "INSERT INTO services (name, key, salt) VALUES (?, ?, ?)",
-                (
-                    "ETN",
-                    "833b334bb52dded02beb81bffea9f1e55f84db86363b32403d1e76"
-                    + "254dfb798499f978c944519974faeeb98029bbc3f92fcf0eb7179d"
-                    + "9b3ab95d12cc1a422319",
-                    "dac0a578446b",
-                ),
-            )
-        result = db.execute("SELECT * FROM services WHERE name='ETN'")
-        ekn_service_id = result.fetchone()["id"]
-        result = db.execute("SELECT * FROM users")
-        for user in result.fetchall():
-            result = db.execute(
-                "SELECT * FROM connections WHERE service=:service AND user=:id",
-                {"service": ekn_service_id, "id": user["id"]},
-            )
-            if result.fetchone():
-                continue
-            db.execute(
-                "INSERT INTO connections (service, service_user, user) VALUES (?, ?, ?)",
-                (ekn_service_id, user["username"], user["id"]),
-            )
-        db.execute("UPDATE etn_settings SET value='2.0.1' WHERE setting='version'")
+steps: MIGRATION_STEPS = [
+    (
+        "UPDATE services SET key=:key, salt=:salt WHERE name='ETN'",
+        {"key": ETN_KEY, "salt": ETN_SALT},
+    ),
+    (
+        "INSERT INTO services (name, key, salt) SELECT 'ETN', :key, :salt "
+        + "WHERE NOT EXISTS (SELECT 1 FROM services WHERE name='ETN')",
+        {"key": ETN_KEY, "salt": ETN_SALT},
+    ),
+    # Every user gets an ETN connection under their own username.
+    "INSERT INTO connections (service, service_user, user) "
+    + "SELECT services.id, users.username, users.id FROM users "
+    + "JOIN services ON services.name='ETN' "
+    + "WHERE NOT EXISTS (SELECT 1 FROM connections "
+    + "WHERE connections.service=services.id AND connections.user=users.id)",
+]
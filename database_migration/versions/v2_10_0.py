@@ -0,0 +1,7 @@
+from ekn.types import MIGRATION_STEPS
+
+steps: MIGRATION_STEPS = [
+    "CREATE TABLE IF NOT EXISTS score_flights (key TEXT PRIMARY KEY, owner TEXT, result TEXT, "
+    + "expires REAL)",
+    "CREATE INDEX IF NOT EXISTS score_flights_expires ON score_flights (expires)",
+]
@@ -0,0 +1,15 @@
+from ekn.types import MIGRATION_STEPS
+
+steps: MIGRATION_STEPS = [
+    # Bumped whenever a vote changes, so clients can tell when scores may have changed.
+    "INSERT INTO etn_settings (setting, value) VALUES ('graph_version', '0')",
+    """CREATE TRIGGER IF NOT EXISTS votes_insert_version AFTER INSERT ON votes BEGIN
+        UPDATE etn_settings SET value=value + 1 WHERE setting='graph_version';
+    END""",
+    """CREATE TRIGGER IF NOT EXISTS votes_update_version AFTER UPDATE ON votes BEGIN
+        UPDATE etn_settings SET value=value + 1 WHERE setting='graph_version';
+    END""",
+    """CREATE TRIGGER IF NOT EXISTS votes_delete_version AFTER DELETE ON votes BEGIN
+        UPDATE etn_settings SET value=value + 1 WHERE setting='graph_version';
+    END""",
+]
@@ -1,31 +1,12 @@
-from typing import TYPE_CHECKING
+from ekn.types import MIGRATION_STEPS
 
-if TYPE_CHECKING:
-    from ekn.database import DatabaseManager
-
-
-def update(database: "DatabaseManager") -> None:
-    with database as db:
-        db.execute("ALTER TABLE users RENAME TO users_old")
-        db.commit()
-        db.execute(
-            "CREATE TABLE users (id INTEGER PRIMARY KEY AUTOINCREMENT, username TEXT, password TEXT, "
-            + "salt TEXT, security INTEGER CHECK(security in (0, 1, 2)) DEFAULT 0)"
-        )
-        db.commit()
-        result = db.execute("SELECT * FROM users_old")
-        for row in result.fetchall():
-            db.execute(
-                "INSERT INTO users (id, username, password, salt, security) VALUES (?, ?, ?, ?, ?)",
-                (
-                    row["id"],
-                    row["username"],
-                    row["password"],
-                    row["salt"],
-                    # If security was set to 1, keep it.  Otherwise set to 0.
-                    row["security"] if row["security"] == 1 else 0,
-                ),
-            )
-        db.commit()
-        db.execute("DROP TABLE users_old")
-        db.execute("UPDATE etn_settings SET value='2.1.1' WHERE setting='version'")
+steps: MIGRATION_STEPS = [
+    "ALTER TABLE users RENAME TO users_old",
+    "CREATE TABLE users (id INTEGER PRIMARY KEY AUTOINCREMENT, username TEXT, password TEXT, "
+    + "salt TEXT, security INTEGER CHECK(security in (0, 1, 2)) DEFAULT 0)",
+    # If security was set to 1, keep it.  Otherwise set to 0.
+    "INSERT INTO users (id, username, password, salt, security) "
+    + "SELECT id, username, password, salt, CASE WHEN security=1 THEN 1 ELSE 0 END "
+    + "FROM users_old",
+    "DROP TABLE users_old",
+]
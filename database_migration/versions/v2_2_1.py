@@ -1,20 +1,9 @@
-from typing import TYPE_CHECKING
+from ekn.types import MIGRATION_STEPS
 
-if TYPE_CHECKING:
-    from ekn.database import DatabaseManager
-
-
-def update(database: "DatabaseManager") -> None:
-    with database as db:
-        db.execute("ALTER TABLE votes RENAME TO votes_old")
-        db.commit()
-        db.execute(
-            "CREATE TABLE votes (user_from INTEGER, user_to INTEGER, category TEXT DEFAULT 'general', "
-            + "count INTEGER, PRIMARY KEY(user_from, user_to, category))"
-        )
-        db.commit()
-        db.execute(
-            "INSERT INTO votes SELECT user_from, user_to, category, count FROM votes_old"
-        )
-        db.execute("DROP TABLE IF EXISTS votes_old")
-        db.execute("UPDATE etn_settings SET value='2.2.1' WHERE setting='version'")
+steps: MIGRATION_STEPS = [
+    "ALTER TABLE votes RENAME TO votes_old",
+    "CREATE TABLE votes (user_from INTEGER, user_to INTEGER, category TEXT DEFAULT 'general', "
+    + "count INTEGER, PRIMARY KEY(user_from, user_to, category))",
+    "INSERT INTO votes SELECT user_from, user_to, category, count FROM votes_old",
+    "DROP TABLE IF EXISTS votes_old",
+]
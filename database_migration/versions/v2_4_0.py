@@ -0,0 +1,36 @@
+from ekn.types import MIGRATION_STEPS
+
+COUNTERS = {
+    "total_users": "SELECT COUNT(*) FROM users",
+    "real_users": "SELECT COUNT(*) FROM users WHERE temp=0",
+    "temp_users": "SELECT COUNT(*) FROM users WHERE temp=1",
+    "total_votes": "SELECT COUNT(*) FROM votes",
+}
+
+steps: MIGRATION_STEPS = [
+    "CREATE TABLE IF NOT EXISTS counters (name TEXT PRIMARY KEY, value INTEGER DEFAULT 0)",
+    *[
+        f"INSERT INTO counters (name, value) VALUES ('{name}', ({query}))"
+        for name, query in COUNTERS.items()
+    ],
+    """CREATE TRIGGER IF NOT EXISTS users_insert_counters AFTER INSERT ON users BEGIN
+        UPDATE counters SET value=value + 1 WHERE name='total_users'
+            OR (name='real_users' AND NEW.temp=0) OR (name='temp_users' AND NEW.temp=1);
+    END""",
+    """CREATE TRIGGER IF NOT EXISTS users_delete_counters AFTER DELETE ON users BEGIN
+        UPDATE counters SET value=value - 1 WHERE name='total_users'
+            OR (name='real_users' AND OLD.temp=0) OR (name='temp_users' AND OLD.temp=1);
+    END""",
+    """CREATE TRIGGER IF NOT EXISTS users_update_counters AFTER UPDATE OF temp ON users BEGIN
+        UPDATE counters SET value=value - 1
+            WHERE (name='real_users' AND OLD.temp=0) OR (name='temp_users' AND OLD.temp=1);
+        UPDATE counters SET value=value + 1
+            WHERE (name='real_users' AND NEW.temp=0) OR (name='temp_users' AND NEW.temp=1);
+    END""",
+    """CREATE TRIGGER IF NOT EXISTS votes_insert_counters AFTER INSERT ON votes BEGIN
+        UPDATE counters SET value=value + 1 WHERE name='total_votes';
+    END""",
+    """CREATE TRIGGER IF NOT EXISTS votes_delete_counters AFTER DELETE ON votes BEGIN
+        UPDATE counters SET value=value - 1 WHERE name='total_votes';
+    END""",
+]
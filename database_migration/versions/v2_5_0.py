@@ -0,0 +1,8 @@
+from ekn.types import MIGRATION_STEPS
+
+steps: MIGRATION_STEPS = [
+    "CREATE TABLE IF NOT EXISTS vote_events (seq INTEGER PRIMARY KEY AUTOINCREMENT, "
+    + "user_from INTEGER, user_to INTEGER, category TEXT, amount INTEGER, created INTEGER)",
+    # Every vote before the log existed is already in the votes table.
+    "INSERT INTO etn_settings (setting, value) VALUES ('vote_events_compacted', '0')",
+]
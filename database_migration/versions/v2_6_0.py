@@ -0,0 +1,6 @@
+from ekn.types import MIGRATION_STEPS
+
+steps: MIGRATION_STEPS = [
+    "CREATE INDEX IF NOT EXISTS session_keys_expires ON session_keys (expires)",
+    "CREATE INDEX IF NOT EXISTS users_username ON users (username)",
+]
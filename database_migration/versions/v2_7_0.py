@@ -0,0 +1,15 @@
+from ekn.types import MIGRATION_STEPS
+
+steps: MIGRATION_STEPS = [
+    # Bumped whenever a category changes, so cached flavors know to reload.
+    "INSERT INTO etn_settings (setting, value) VALUES ('categories_version', '0')",
+    """CREATE TRIGGER IF NOT EXISTS categories_insert_version AFTER INSERT ON categories BEGIN
+        UPDATE etn_settings SET value=value + 1 WHERE setting='categories_version';
+    END""",
+    """CREATE TRIGGER IF NOT EXISTS categories_update_version AFTER UPDATE ON categories BEGIN
+        UPDATE etn_settings SET value=value + 1 WHERE setting='categories_version';
+    END""",
+    """CREATE TRIGGER IF NOT EXISTS categories_delete_version AFTER DELETE ON categories BEGIN
+        UPDATE etn_settings SET value=value + 1 WHERE setting='categories_version';
+    END""",
+]
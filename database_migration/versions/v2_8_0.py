@@ -0,0 +1,5 @@
+from ekn.types import MIGRATION_STEPS
+
+steps: MIGRATION_STEPS = [
+    "CREATE INDEX IF NOT EXISTS connections_service_user ON connections (service, service_user)",
+]
@@ -0,0 +1,7 @@
+from ekn.types import MIGRATION_STEPS
+
+steps: MIGRATION_STEPS = [
+    "CREATE TABLE IF NOT EXISTS score_jobs (id TEXT PRIMARY KEY, service INTEGER, viewer INTEGER, "
+    + "request TEXT, status TEXT, result TEXT, error TEXT, created INTEGER, expires INTEGER)",
+    "CREATE INDEX IF NOT EXISTS score_jobs_expires ON score_jobs (expires)",
+]
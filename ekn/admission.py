@@ -0,0 +1,277 @@
+from collections.abc import Callable
+from ekn.aio import run_cpu_async
+from ekn.executor import CPU_WORKERS, SCORE_EXECUTOR, run_cpu
+from ekn.helpers import NETWORK_SIZE_LIMIT, get_votes, network_sizes
+from flask import Response
+from typing import Optional
+import asyncio
+import bisect
+import itertools
+import math
+import os
+import threading
+import time
+
+
+# How many scores are calculated at once, in total and for each service.
+SCORE_CONCURRENCY = int(os.environ.get("EKN_SCORE_CONCURRENCY", "0")) or CPU_WORKERS
+SERVICE_SCORE_CONCURRENCY = (
+    int(os.environ.get("EKN_SERVICE_SCORE_CONCURRENCY", "0")) or SCORE_CONCURRENCY
+)
+# How many users' worth of networks each service can be scoring at once.  A
+# service can always score one network, however large.
+SERVICE_SCORE_BUDGET = int(
+    os.environ.get("EKN_SERVICE_SCORE_BUDGET", str(4 * NETWORK_SIZE_LIMIT))
+)
+# How many scores can wait for a turn, and for how long, before being turned away.
+SCORE_QUEUE_SIZE = int(os.environ.get("EKN_SCORE_QUEUE_SIZE", "64"))
+SCORE_QUEUE_TIMEOUT = float(os.environ.get("EKN_SCORE_QUEUE_TIMEOUT", "10"))
+# The cost of scoring for a viewer whose network size isn't known yet.
+UNKNOWN_COST = NETWORK_SIZE_LIMIT // 10
+
+
+class ScoreRejected(Exception):
+    """
+    Raised when a score is turned away.
+    """
+
+
+class Ticket:
+    """
+    A score waiting for, or holding, a turn.
+    """
+
+    def __init__(self, service: str, cost: int, notify: Callable[[], None]):
+        self.service = service
+        self.cost = cost
+        # Called, with the controller's lock held, once the ticket is admitted.
+        self.notify = notify
+        self.admitted = False
+        self.started = 0.0
+
+
+class AdmissionController:
+    """
+    Limits how many scores run at once, in total and per service, and how much
+    they cost per service.  Scores which can't start straight away wait in a
+    queue, cheapest first, and are turned away if the queue is full or their
+    turn doesn't come within the timeout.
+    """
+
+    def __init__(
+        self,
+        max_running: int = SCORE_CONCURRENCY,
+        service_running: int = SERVICE_SCORE_CONCURRENCY,
+        service_budget: int = SERVICE_SCORE_BUDGET,
+        max_queue: int = SCORE_QUEUE_SIZE,
+        timeout: float = SCORE_QUEUE_TIMEOUT,
+    ):
+        self.max_running = max_running
+        self.service_running = service_running
+        self.service_budget = service_budget
+        self.max_queue = max_queue
+        self.timeout = timeout
+        self.lock = threading.Lock()
+        self.order = itertools.count()
+        # Waiting tickets as (cost, arrival, ticket), cheapest and then oldest first
+        self.waiting: list[tuple[int, int, Ticket]] = []
+        # Running scores' count and total cost, by service
+        self.services: dict[str, tuple[int, int]] = {}
+        self.running = 0
+        self.admitted = 0
+        self.rejected = 0
+        self.timed_out = 0
+        # A moving average of how long scores take, in seconds
+        self.average_time = 0.0
+
+    def _fits(self, ticket: Ticket) -> bool:
+        count, cost = self.services.get(ticket.service, (0, 0))
+        return (
+            self.running < self.max_running
+            and count < self.service_running
+            and (count == 0 or cost + ticket.cost <= self.service_budget)
+        )
+
+    def _start(self, ticket: Ticket) -> None:
+        count, cost = self.services.get(ticket.service, (0, 0))
+        self.services[ticket.service] = (count + 1, cost + ticket.cost)
+        self.running += 1
+        self.admitted += 1
+        ticket.admitted = True
+        ticket.started = time.monotonic()
+
+    def _admit_waiting(self) -> None:
+        """
+        Starts as many waiting tickets as fit, cheapest first.  Tickets which
+        don't fit yet don't hold up cheaper ones from other services.
+        """
+        still_waiting = []
+        for entry in self.waiting:
+            if self._fits(entry[2]):
+                self._start(entry[2])
+                entry[2].notify()
+            else:
+                still_waiting.append(entry)
+        self.waiting = still_waiting
+
+    def _remove(self, ticket: Ticket) -> None:
+        self.waiting = [entry for entry in self.waiting if entry[2] is not ticket]
+
+    def _submit(self, ticket: Ticket) -> Optional[bool]:
+        """
+        Queues a ticket, starting it straight away if it fits.  Returns True if
+        it started, None if it is waiting and False if the queue is full.
+        """
+        with self.lock:
+            bisect.insort(self.waiting, (ticket.cost, next(self.order), ticket))
+            self._admit_waiting()
+            if ticket.admitted:
+                return True
+            if len(self.waiting) > self.max_queue:
+                self._remove(ticket)
+                self.rejected += 1
+                return False
+            return None
+
+    def _cancel(self, ticket: Ticket, timed_out: bool = True) -> bool:
+        """
+        Takes a waiting ticket out of the queue.  Returns False if it was
+        admitted in the meantime, so must be released instead.
+        """
+        with self.lock:
+            if ticket.admitted:
+                return False
+            self._remove(ticket)
+            if timed_out:
+                self.rejected += 1
+                self.timed_out += 1
+            return True
+
+    def acquire(self, service: str, cost: int) -> Optional[Ticket]:
+        """
+        Waits for a turn to score.  Returns None if the score was turned away.
+        """
+        event = threading.Event()
+        ticket = Ticket(service, cost, event.set)
+        started = self._submit(ticket)
+        if started is not None:
+            return ticket if started else None
+        if not event.wait(self.timeout) and self._cancel(ticket):
+            return None
+        return ticket
+
+    async def acquire_async(self, service: str, cost: int) -> Optional[Ticket]:
+        """
+        Like acquire, but waits without holding a thread.
+        """
+        loop = asyncio.get_running_loop()
+        admitted = loop.create_future()
+
+        def notify() -> None:
+            loop.call_soon_threadsafe(
+                lambda: admitted.done() or admitted.set_result(None)
+            )
+
+        ticket = Ticket(service, cost, notify)
+        started = self._submit(ticket)
+        if started is not None:
+            return ticket if started else None
+        try:
+            await asyncio.wait_for(asyncio.shield(admitted), self.timeout)
+        except asyncio.TimeoutError:
+            if self._cancel(ticket):
+                return None
+        except asyncio.CancelledError:
+            # The client went away while waiting
+            if not self._cancel(ticket, timed_out=False):
+                self.release(ticket)
+            raise
+        return ticket
+
+    def release(self, ticket: Ticket) -> None:
+        """
+        Ends a ticket's turn, and starts as many waiting tickets as now fit.
+        """
+        with self.lock:
+            count, cost = self.services[ticket.service]
+            if count == 1:
+                del self.services[ticket.service]
+            else:
+                self.services[ticket.service] = (count - 1, cost - ticket.cost)
+            self.running -= 1
+            elapsed = time.monotonic() - ticket.started
+            self.average_time = 0.8 * self.average_time + 0.2 * elapsed
+            self._admit_waiting()
+
+    def retry_after(self) -> int:
+        """
+        Roughly how many seconds until the queue has room.
+        """
+        with self.lock:
+            turns = (len(self.waiting) + 1) / self.max_running
+            return max(1, math.ceil(self.average_time * turns))
+
+    def stats(self) -> dict[str, float]:
+        with self.lock:
+            return {
+                "running": self.running,
+                "queue_depth": len(self.waiting),
+                "admitted": self.admitted,
+                "rejected": self.rejected,
+                "timed_out": self.timed_out,
+                "average_time": round(self.average_time, 3),
+            }
+
+
+def estimate_cost(viewer: int, flavor: str) -> int:
+    """
+    Estimates the cost of scoring for a viewer from their network's size when
+    they were last scored.
+    """
+    size = network_sizes.get((viewer, flavor))
+    return UNKNOWN_COST if size is None else max(1, size)
+
+
+# Shared by every scoring route
+score_admission = AdmissionController()
+
+
+def admitted_score(service: str, for_id: int, from_id: int, flavor: str) -> float:
+    """
+    Calculates a score once it's given a turn.  Raises ScoreRejected if it's
+    turned away.
+    """
+    ticket = score_admission.acquire(service, estimate_cost(from_id, flavor))
+    if ticket is None:
+        raise ScoreRejected("Too many scores are being calculated.")
+    try:
+        # Scored off the request thread, so at most CPU_WORKERS scores run at once.
+        return run_cpu(SCORE_EXECUTOR, get_votes, for_id, from_id, flavor)
+    finally:
+        score_admission.release(ticket)
+
+
+async def admitted_score_async(
+    service: str, for_id: int, from_id: int, flavor: str
+) -> float:
+    """
+    Like admitted_score, but waits without holding a thread.
+    """
+    ticket = await score_admission.acquire_async(
+        service, estimate_cost(from_id, flavor)
+    )
+    if ticket is None:
+        raise ScoreRejected("Too many scores are being calculated.")
+    try:
+        return await run_cpu_async(SCORE_EXECUTOR, get_votes, for_id, from_id, flavor)
+    finally:
+        score_admission.release(ticket)
+
+
+def busy_response(controller: AdmissionController = score_admission) -> Response:
+    """
+    The response to send when a score is turned away.
+    """
+    response = Response("Too many scores are being calculated, try again later.", 503)
+    response.headers["Retry-After"] = str(controller.retry_after())
+    return response
@@ -0,0 +1,82 @@
+from collections.abc import Callable
+from concurrent.futures import ThreadPoolExecutor
+from ekn.database import DatabaseManager
+from ekn.executor import get_pool
+from ekn.queries import run
+from typing import Any, Optional, TypeVar
+import asyncio
+import os
+import sqlite3
+import threading
+
+
+T = TypeVar("T")
+
+# How many threads run blocking work, such as database access and Flask views,
+# for the event loop.
+IO_WORKERS = int(os.environ.get("EKN_IO_WORKERS", "32"))
+
+io_pool: Optional[ThreadPoolExecutor] = None
+io_pool_lock = threading.Lock()
+
+
+def get_io_pool() -> ThreadPoolExecutor:
+    global io_pool
+    with io_pool_lock:
+        if io_pool is None:
+            io_pool = ThreadPoolExecutor(IO_WORKERS, thread_name_prefix="io")
+        return io_pool
+
+
+async def run_sync(function: Callable[..., T], *args: Any) -> T:
+    """
+    Runs a blocking function on the IO thread pool without blocking the event loop.
+    """
+    return await asyncio.wrap_future(get_io_pool().submit(function, *args))
+
+
+async def run_cpu_async(kind: str, function: Callable[..., T], *args: Any) -> T:
+    """
+    Like ekn.executor.run_cpu, but awaits the result.  "inline" work runs on the
+    IO thread pool, as running it on the event loop would stall every request.
+    """
+    if kind == "inline":
+        return await run_sync(function, *args)
+    return await asyncio.wrap_future(get_pool(kind).submit(function, *args))
+
+
+def _in_database(
+    function: Callable[..., T], read_only: bool, args: tuple[Any, ...]
+) -> T:
+    with DatabaseManager(read_only=read_only) as db:
+        return function(db, *args)
+
+
+async def in_database(
+    function: Callable[..., T], *args: Any, read_only: bool = False
+) -> T:
+    """
+    Runs `function(db, *args)` with an open database on the IO thread pool.
+    SQLite connections can only be used by the thread that opened them, so the
+    database is opened, used and closed within one call.
+    """
+    return await run_sync(_in_database, function, read_only, args)
+
+
+def _fetch(db: DatabaseManager, name: str, params: dict) -> list[sqlite3.Row]:
+    return run(db, name, params).fetchall()
+
+
+async def query(name: str, params: dict, read_only: bool = True) -> list[sqlite3.Row]:
+    """
+    Runs one of ekn.queries' named statements and returns every row.
+    """
+    return await in_database(_fetch, name, params, read_only=read_only)
+
+
+def shutdown_io_pool() -> None:
+    global io_pool
+    with io_pool_lock:
+        if io_pool is not None:
+            io_pool.shutdown()
+        io_pool = None
@@ -0,0 +1,286 @@
+from collections.abc import Awaitable, Callable
+from ekn.admission import ScoreRejected, admitted_score_async, busy_response
+from ekn.aio import query, run_sync, shutdown_io_pool
+from ekn.conditional import (
+    SCORE_CACHE_CONTROL,
+    data_versions,
+    etag_matches,
+    make_etag,
+    not_modified,
+    with_etag,
+)
+from ekn.executor import shutdown_pools
+from ekn.helpers import verify_service
+from ekn.jobs import FINISHED, MAX_WAIT, POLL_INTERVAL, read_job
+from ekn.routes.voting import authorize_score
+from ekn.singleflight import coalesce_score_async
+from flask import Response
+from typing import Any, Optional
+from urllib.parse import parse_qs
+import asyncio
+import io
+import json
+import math
+import sys
+import time
+
+ASGI_MESSAGE = dict[str, Any]
+WSGI_APP = Callable[[dict, Callable], Any]
+
+
+class Request:
+    """
+    An HTTP request read from an ASGI connection, with its WSGI environ.
+    """
+
+    def __init__(self, scope: ASGI_MESSAGE, body: bytes):
+        self.method: str = scope["method"]
+        self.path: str = scope["path"]
+        self.body = body
+        self.environ = wsgi_environ(scope, body)
+
+    def get_params(self, params: list[str]) -> Optional[list[Any]]:
+        """
+        Reads parameters from a JSON or url encoded body, like
+        ekn.helpers.get_params.  Returns None for any other body, for Flask to
+        deal with.
+        """
+        content_type = self.environ.get("CONTENT_TYPE", "").split(";")[0].strip()
+        if content_type == "application/json" or (
+            content_type.startswith("application/") and content_type.endswith("+json")
+        ):
+            try:
+                message = json.loads(self.body)
+            except ValueError:
+                return None
+            if not isinstance(message, dict):
+                return None
+            return [message.get(param) for param in params]
+        if content_type == "application/x-www-form-urlencoded":
+            form = parse_qs(self.body.decode("utf8", "replace"), keep_blank_values=True)
+            return [form[param][0] if param in form else None for param in params]
+        return None
+
+
+def wsgi_environ(scope: ASGI_MESSAGE, body: bytes) -> dict[str, Any]:
+    server = scope.get("server") or ("localhost", 80)
+    environ = {
+        "REQUEST_METHOD": scope["method"],
+        "SCRIPT_NAME": scope.get("root_path", ""),
+        "PATH_INFO": scope["path"].encode("utf8").decode("latin-1"),
+        "QUERY_STRING": scope["query_string"].decode("latin-1"),
+        "SERVER_NAME": str(server[0]),
+        "SERVER_PORT": str(server[1]),
+        "SERVER_PROTOCOL": f"HTTP/{scope.get('http_version', '1.1')}",
+        "CONTENT_LENGTH": str(len(body)),
+        "wsgi.version": (1, 0),
+        "wsgi.url_scheme": scope.get("scheme", "http"),
+        "wsgi.input": io.BytesIO(body),
+        "wsgi.errors": sys.stderr,
+        "wsgi.multithread": True,
+        "wsgi.multiprocess": False,
+        "wsgi.run_once": False,
+    }
+    if scope.get("client"):
+        environ["REMOTE_ADDR"] = scope["client"][0]
+    for name, value in scope["headers"]:
+        name = name.decode("latin-1").upper().replace("-", "_")
+        value = value.decode("latin-1")
+        if name == "CONTENT_TYPE":
+            environ["CONTENT_TYPE"] = value
+        elif name != "CONTENT_LENGTH":
+            key = f"HTTP_{name}"
+            environ[key] = f"{environ[key]},{value}" if key in environ else value
+    return environ
+
+
+def call_wsgi(wsgi_app: WSGI_APP, environ: dict) -> tuple[int, list, bytes]:
+    """
+    Runs a WSGI app and returns its status code, headers and body.
+    """
+    started: dict[str, Any] = {}
+
+    def start_response(status: str, headers: list, exc_info: Any = None) -> None:
+        started["status"] = int(status.split(" ", 1)[0])
+        started["headers"] = headers
+
+    chunks = wsgi_app(environ, start_response)
+    try:
+        body = b"".join(chunks)
+    finally:
+        if hasattr(chunks, "close"):
+            chunks.close()
+    return started["status"], started["headers"], body
+
+
+def with_cors(response: Response) -> Response:
+    """
+    Adds the headers ekn.decs.allow_cors(hosts=["*"]) would.
+    """
+    response.headers["Access-Control-Allow-Origin"] = "*"
+    response.headers["Access-Control-Allow-Headers"] = "Content-type, If-None-Match"
+    response.headers["Access-Control-Expose-Headers"] = "ETag"
+    response.headers["Vary"] = "Origin"
+    return response
+
+
+async def get_score(request: Request) -> Optional[Response]:
+    """
+    /get_score, with the score calculated on the scoring executor while the
+    request waits without holding a thread.
+    """
+    if request.method == "OPTIONS":
+        return with_cors(Response())
+    params = request.get_params(
+        [
+            "service_name",
+            "service_key",
+            "for",
+            "from",
+            "password",
+            "password_type",
+            "flavor",
+        ]
+    )
+    if params is None:
+        return None
+    service, key, _for, _from, password, password_type, flavor = params
+
+    checked = await run_sync(
+        authorize_score, service, key, _for, _from, password, password_type, flavor
+    )
+    if isinstance(checked, Response):
+        return with_cors(checked)
+    for_id, from_id, flavor = checked
+
+    versions = data_versions(await query("data_versions", {}))
+    etag = make_etag("score", *versions, for_id, from_id, _for, _from, flavor)
+    if etag_matches(
+        request.environ.get("HTTP_IF_NONE_MATCH"), etag, request.method
+    ):
+        return with_cors(not_modified(etag, SCORE_CACHE_CONTROL))
+    try:
+        score = await coalesce_score_async(
+            (service, for_id, from_id, flavor, *versions),
+            admitted_score_async,
+            service,
+            for_id,
+            from_id,
+            flavor,
+        )
+    except ScoreRejected:
+        return with_cors(busy_response())
+    response = {"for": _for, "from": _from, "score": score, "flavor": flavor}
+    return with_cors(
+        with_etag(Response(json.dumps(response), 200), etag, SCORE_CACHE_CONTROL)
+    )
+
+
+async def get_score_job(request: Request) -> Optional[Response]:
+    """
+    /get_score_job, polling for the job to finish without holding a thread.
+    Requests which don't wait, or aren't valid, are answered by Flask.
+    """
+    params = request.get_params(["service_name", "service_key", "job", "wait"])
+    if params is None or request.method != "POST":
+        return None
+    service, key, job_id, wait = params
+    try:
+        wait = float(wait or 0)
+    except (TypeError, ValueError):
+        return None
+    if not math.isfinite(wait) or wait <= 0:
+        return None
+    service_obj = await run_sync(verify_service, service, key)
+    if not service_obj:
+        return None
+
+    deadline = time.monotonic() + min(wait, MAX_WAIT)
+    while True:
+        job = await run_sync(read_job, job_id, service_obj["id"])
+        remaining = deadline - time.monotonic()
+        if job is None or job["status"] in FINISHED or remaining <= 0:
+            break
+        await asyncio.sleep(min(remaining, POLL_INTERVAL))
+    if job is None:
+        return with_cors(Response("Job does not exist.", 404))
+    return with_cors(Response(json.dumps(job), 200))
+
+
+# Routes with async handlers.  A handler can return None to have Flask answer.
+ASYNC_ROUTES: dict[str, Callable[[Request], Awaitable[Optional[Response]]]] = {
+    "/get_score": get_score,
+    "/get_score_job": get_score_job,
+}
+
+
+class ASGIApp:
+    """
+    Serves a Flask app over ASGI.  Routes in ASYNC_ROUTES are answered on the
+    event loop; every other route runs its Flask view on the IO thread pool.
+    """
+
+    def __init__(self, wsgi_app: WSGI_APP):
+        self.wsgi_app = wsgi_app
+
+    async def __call__(
+        self,
+        scope: ASGI_MESSAGE,
+        receive: Callable[[], Awaitable[ASGI_MESSAGE]],
+        send: Callable[[ASGI_MESSAGE], Awaitable[None]],
+    ) -> None:
+        if scope["type"] == "lifespan":
+            await self.lifespan(receive, send)
+            return
+        if scope["type"] != "http":
+            return
+
+        body = b""
+        while True:
+            message = await receive()
+            if message["type"] == "http.disconnect":
+                return
+            body += message.get("body", b"")
+            if not message.get("more_body"):
+                break
+
+        request = Request(scope, body)
+        response = None
+        handler = ASYNC_ROUTES.get(request.path)
+        if handler is not None and request.method in ("POST", "OPTIONS"):
+            response = await handler(request)
+        if response is not None:
+            status = response.status_code
+            headers = response.headers.to_wsgi_list()
+            data = response.get_data()
+        else:
+            status, headers, data = await run_sync(
+                call_wsgi, self.wsgi_app, request.environ
+            )
+
+        await send(
+            {
+                "type": "http.response.start",
+                "status": status,
+                "headers": [
+                    (name.encode("latin-1"), value.encode("latin-1"))
+                    for name, value in headers
+                ],
+            }
+        )
+        await send({"type": "http.response.body", "body": data})
+
+    async def lifespan(
+        self,
+        receive: Callable[[], Awaitable[ASGI_MESSAGE]],
+        send: Callable[[ASGI_MESSAGE], Awaitable[None]],
+    ) -> None:
+        while True:
+            message = await receive()
+            if message["type"] == "lifespan.startup":
+                await send({"type": "lifespan.startup.complete"})
+            elif message["type"] == "lifespan.shutdown":
+                shutdown_io_pool()
+                shutdown_pools()
+                await send({"type": "lifespan.shutdown.complete"})
+                return
@@ -0,0 +1,51 @@
+from ekn.database import DatabaseManager
+from ekn.helpers import check_password, verify_service
+from ekn.queries import run
+from ekn.sessions import refresh_session_key
+from ekn.types import PASSWORD_TYPE
+from flask import Response
+from typing import NamedTuple, Optional
+import sqlite3
+
+
+class AuthContext(NamedTuple):
+    service: sqlite3.Row
+    # The acting user, as returned by the "auth_user" query
+    user: sqlite3.Row
+    password_type: str
+    # The user being voted on or looked up, if they're connected to the service
+    target_id: Optional[int]
+
+
+def authenticate(
+    db: DatabaseManager,
+    service: str,
+    key: str,
+    username: str,
+    password: str,
+    password_type: PASSWORD_TYPE = None,
+    target: Optional[str] = None,
+) -> AuthContext | Response:
+    """
+    Verifies a service, and a user acting through it, and finds the `target`
+    service username, all on an open database.  Queues a new session key for
+    the user if theirs has expired.  Returns the response to send if
+    verification fails.
+    """
+    service_obj = verify_service(service, key, db)
+    if not service_obj:
+        return Response("Service name or key is incorrect.", 403)
+
+    rows = run(
+        db,
+        "auth_user",
+        {"service_id": service_obj["id"], "username": username, "target": target},
+    ).fetchall()
+    if not rows or not check_password(rows[0], password, password_type):
+        return Response("Username or Password is incorrect.", 403)
+    user = rows[0]
+    refresh_session_key(user, user["session_expires"])
+
+    return AuthContext(
+        service_obj, user, password_type or "raw_password", user["target_id"]
+    )
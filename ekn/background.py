@@ -0,0 +1,31 @@
+from collections.abc import Callable
+from ekn.database import DatabaseManager
+import sqlite3
+import threading
+import time
+
+
+def start_periodic_task(
+    name: str,
+    interval: float,
+    task: Callable[[DatabaseManager], object],
+    path: str = "database.db",
+) -> threading.Thread:
+    """
+    Starts a daemon thread which runs `task` with an open database every
+    `interval` seconds.
+    """
+
+    def runner() -> None:
+        database = DatabaseManager(path)
+        while True:
+            time.sleep(interval)
+            try:
+                with database as db:
+                    task(db)
+            except sqlite3.Error as e:
+                print(f"Database Error in {name}: {e}")
+
+    thread = threading.Thread(target=runner, name=name, daemon=True)
+    thread.start()
+    return thread
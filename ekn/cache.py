@@ -0,0 +1,68 @@
+from collections import OrderedDict
+from collections.abc import Callable, Hashable
+from typing import Any, Optional
+import threading
+import time
+
+
+class TTLCache:
+    """
+    A bounded cache which drops its least recently used entry when full, and
+    forgets entries `ttl` seconds after they were added.  Counts hits and misses.
+    """
+
+    def __init__(self, max_size: int, ttl: float):
+        self.max_size = max_size
+        self.ttl = ttl
+        self.lock = threading.Lock()
+        self.entries: OrderedDict[Hashable, tuple[float, Any]] = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key: Hashable) -> Optional[Any]:
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is None or entry[0] <= time.monotonic():
+                if entry is not None:
+                    del self.entries[key]
+                self.misses += 1
+                return None
+            self.entries.move_to_end(key)
+            self.hits += 1
+            return entry[1]
+
+    def set(self, key: Hashable, value: Any) -> None:
+        with self.lock:
+            self.entries[key] = (time.monotonic() + self.ttl, value)
+            self.entries.move_to_end(key)
+            while len(self.entries) > self.max_size:
+                self.entries.popitem(last=False)
+
+    def invalidate(self, match: Optional[Callable[[Hashable], bool]] = None) -> None:
+        """
+        Forgets every entry whose key matches, or every entry if no match is given.
+        """
+        with self.lock:
+            if match is None:
+                self.entries.clear()
+                return
+            for key in [key for key in self.entries if match(key)]:
+                del self.entries[key]
+
+    def invalidate_values(self, match: Callable[[Any], bool]) -> None:
+        """
+        Forgets every entry whose value matches.
+        """
+        with self.lock:
+            for key in [key for key, (_, value) in self.entries.items() if match(value)]:
+                del self.entries[key]
+
+    def stats(self) -> dict[str, float]:
+        with self.lock:
+            lookups = self.hits + self.misses
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": self.hits / lookups if lookups else 0.0,
+                "size": len(self.entries),
+            }
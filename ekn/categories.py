@@ -0,0 +1,113 @@
+from ekn.database import DatabaseManager
+from ekn.queries import run
+from ekn.types import STORAGE_ROW
+from typing import NamedTuple, Optional
+import json
+import threading
+import time
+
+
+# Seconds between checks for changed categories.
+CHECK_INTERVAL = 5
+
+
+class Flavor(NamedTuple):
+    name: str
+    type: str
+    # The categories whose votes make up the network, or None for every category.
+    categories: Optional[tuple[str, ...]]
+    secondary_of: Optional[str]
+    description: Optional[str]
+
+
+def compile_flavor(row: STORAGE_ROW) -> Flavor:
+    """
+    Resolves a categories row into the categories scoring it reads.
+    """
+    categories: Optional[tuple[str, ...]] = None
+    if row["type"] == "normal":
+        categories = (row["category"],)
+    elif row["type"] == "secondary":
+        categories = (row["secondary_of"],)
+    elif row["type"] == "composite":
+        categories = (*json.loads(row["composite_of"]), row["category"])
+    return Flavor(
+        row["category"],
+        row["type"],
+        categories,
+        row["secondary_of"],
+        row["description"],
+    )
+
+
+class CategoryRegistry:
+    """
+    Every flavor in a database, compiled once and reloaded when the categories
+    table changes.
+    """
+
+    def __init__(self, path: str = "database.db"):
+        self.database = DatabaseManager(path, read_only=True)
+        self.lock = threading.Lock()
+        self.flavors: dict[str, Flavor] = {}
+        self.version: Optional[str] = None
+        self.checked = 0.0
+
+    def refresh(self) -> None:
+        """
+        Reloads the flavors if the categories have changed since the last check.
+        Only checks every CHECK_INTERVAL seconds unless invalidated.
+        """
+        with self.lock:
+            if self.version and time.monotonic() - self.checked < CHECK_INTERVAL:
+                return
+            with self.database as db:
+                result = db.execute(
+                    "SELECT value FROM etn_settings WHERE setting='categories_version'"
+                )
+                version = result.fetchone()["value"]
+                if version != self.version:
+                    self.flavors = {
+                        row["category"]: compile_flavor(row)
+                        for row in run(db, "categories").fetchall()
+                    }
+                    self.version = version
+            self.checked = time.monotonic()
+
+    def invalidate(self) -> None:
+        with self.lock:
+            self.version = None
+
+    def get(self, name: str) -> Optional[Flavor]:
+        self.refresh()
+        return self.flavors.get(name)
+
+    def names(self) -> list[str]:
+        self.refresh()
+        return list(self.flavors)
+
+    def names_version(self) -> tuple[list[str], Optional[str]]:
+        """
+        Like names, along with the categories version they were loaded at.
+        """
+        self.refresh()
+        with self.lock:
+            return list(self.flavors), self.version
+
+
+registries: dict[str, CategoryRegistry] = {}
+registries_lock = threading.Lock()
+
+
+def get_registry(path: str = "database.db") -> CategoryRegistry:
+    """
+    Gets the shared category registry for a database.
+    """
+    with registries_lock:
+        if path not in registries:
+            registries[path] = CategoryRegistry(path)
+        return registries[path]
+
+
+def get_flavor(name: str, path: str = "database.db") -> Optional[Flavor]:
+    return get_registry(path).get(name)
@@ -0,0 +1,77 @@
+from collections.abc import Callable
+from ekn.categories import CHECK_INTERVAL
+from ekn.database import DatabaseManager
+from ekn.queries import run
+from flask import Response, request
+from typing import Any, Iterable, Optional
+from werkzeug.http import parse_etags
+import hashlib
+import sqlite3
+
+
+# Category changes take up to CHECK_INTERVAL seconds to be seen anyway.
+CATEGORIES_CACHE_CONTROL = f"public, max-age={CHECK_INTERVAL}"
+COUNTER_CACHE_CONTROL = "public, max-age=10"
+# Scores depend on who is asking, and are cheap to revalidate.
+SCORE_CACHE_CONTROL = "private, no-cache"
+
+
+def make_etag(*parts: Any) -> str:
+    """
+    An entity tag, without quotes, for a response built from `parts`.
+    """
+    return hashlib.sha256(":".join(map(str, parts)).encode()).hexdigest()[:32]
+
+
+def data_versions(rows: Iterable[sqlite3.Row]) -> tuple[str, str]:
+    """
+    Gets (graph version, categories version) from the "data_versions" query.
+    The graph version changes whenever a vote does.
+    """
+    versions = {row["setting"]: row["value"] for row in rows}
+    return versions.get("graph_version", ""), versions.get("categories_version", "")
+
+
+def get_data_versions() -> tuple[str, str]:
+    with DatabaseManager(read_only=True) as db:
+        return data_versions(run(db, "data_versions").fetchall())
+
+
+def etag_matches(
+    if_none_match: Optional[str], etag: str, method: str = "GET"
+) -> bool:
+    """
+    Whether an If-None-Match header names the entity tag.  "*" only matches
+    GET and HEAD requests, as other methods can't be answered with a 304.
+    """
+    if not if_none_match:
+        return False
+    etags = parse_etags(if_none_match)
+    if etags.star_tag and method not in ("GET", "HEAD"):
+        return False
+    return etags.contains_weak(etag)
+
+
+def with_etag(response: Response, etag: str, cache_control: str) -> Response:
+    response.set_etag(etag)
+    response.headers["Cache-Control"] = cache_control
+    return response
+
+
+def not_modified(etag: str, cache_control: str) -> Response:
+    return with_etag(Response(status=304), etag, cache_control)
+
+
+def conditional(
+    etag: str, cache_control: str, make: Callable[[], Response]
+) -> Response:
+    """
+    Answers with 304 Not Modified if the request's If-None-Match names the
+    entity tag, and otherwise with `make()`, tagged if it succeeded.
+    """
+    if etag_matches(request.headers.get("If-None-Match"), etag, request.method):
+        return not_modified(etag, cache_control)
+    response = make()
+    if response.status_code != 200:
+        return response
+    return with_etag(response, etag, cache_control)
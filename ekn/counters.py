@@ -0,0 +1,40 @@
+from database_migration.versions.v2_4_0 import COUNTERS
+from ekn.database import DatabaseManager
+import sys
+
+
+def get_counter(db: DatabaseManager, name: str) -> int:
+    """
+    Gets one of the aggregate counters kept up to date by the database triggers.
+    """
+    result = db.execute("SELECT value FROM counters WHERE name=:name", {"name": name})
+    row = result.fetchone()
+    if not row:
+        return 0
+    return row["value"]
+
+
+def repair_counters(db: DatabaseManager) -> dict[str, tuple[int, int]]:
+    """
+    Recomputes every counter from scratch.
+
+    Returns {name: (old value, new value)} for each counter.
+    """
+    changes: dict[str, tuple[int, int]] = {}
+    for name, query in COUNTERS.items():
+        old = get_counter(db, name)
+        new = db.execute(query).fetchone()[0]
+        db.execute(
+            "INSERT INTO counters (name, value) VALUES (:name, :value) "
+            + "ON CONFLICT(name) DO UPDATE SET value=excluded.value",
+            {"name": name, "value": new},
+        )
+        changes[name] = (old, new)
+    return changes
+
+
+if __name__ == "__main__":
+    # Usage: python -m ekn.counters [database path]
+    with DatabaseManager(*sys.argv[1:2]) as db:
+        for name, (old, new) in repair_counters(db).items():
+            print(f"{name}: {old} -> {new}")
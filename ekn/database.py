@@ -1,30 +1,102 @@
+from collections.abc import Iterable
 from database_migration.update import update_database
 from ekn import types
+from pathlib import Path
 import os
 import sqlite3
 import threading
+import uuid
+
+
+# Connections which keep in-memory databases alive between uses, by path.
+memory_databases: dict[str, sqlite3.Connection] = {}
+memory_databases_lock = threading.Lock()
+
+# Writers to the same database take turns, by path.  Reentrant so a thread
+# can still open a second writer while it holds one.
+writer_locks: dict[str, threading.RLock] = {}
+writer_locks_lock = threading.Lock()
 
 
 class DatabaseManager:
-    def __init__(self, path="database.db"):
+    def __init__(self, path="database.db", read_only=False):
+        """
+        `path` is either a file path, or an SQLite URI such as
+        `file::memory:?cache=shared` or `file:name?mode=memory&cache=shared`.
+        In-memory databases are created on first use and kept until dropped.
+
+        Read only managers never wait for writers, so they are used for scoring
+        and other lookups.  Writers to the same path are serialized.
+        """
         self.path = path
+        self.uri = path.startswith("file:")
+        self.in_memory = self.uri and (":memory:" in path or "mode=memory" in path)
+        self.read_only = read_only
         self.lock = threading.Lock()
+        with writer_locks_lock:
+            self.writer_lock = writer_locks.setdefault(path, threading.RLock())
         self.connected = False
         self.conn = None
         self.cur = None
-        update_database(self)
+        if read_only:
+            if not self.in_memory and not os.path.isfile(self._file_path()):
+                # Readers can't create the database, so a writer does it first.
+                DatabaseManager(path)
+        else:
+            update_database(self)
         self._get_ekn_service()
 
     def open(self) -> None:
         self.lock.acquire()
+        if not self.read_only:
+            self.writer_lock.acquire()
         while not self.connected:
             self._open()
 
+    @classmethod
+    def memory(cls) -> "DatabaseManager":
+        """
+        Creates a new, empty in-memory database.
+        """
+        return cls(f"file:ekn-{uuid.uuid4().hex}?mode=memory&cache=shared")
+
+    def drop(self) -> None:
+        """
+        Frees an in-memory database once every connection to it is closed.
+        """
+        with memory_databases_lock:
+            conn = memory_databases.pop(self.path, None)
+        if conn:
+            conn.close()
+
+    def _file_path(self) -> str:
+        if not self.uri:
+            return self.path
+        return self.path[len("file:") :].split("?")[0]
+
+    def _connect(self) -> sqlite3.Connection:
+        if not self.read_only or self.in_memory:
+            return sqlite3.connect(self.path, uri=self.uri)
+        if self.uri:
+            separator = "&" if "?" in self.path else "?"
+            return sqlite3.connect(f"{self.path}{separator}mode=ro", uri=True)
+        return sqlite3.connect(f"{Path(self.path).absolute().as_uri()}?mode=ro", uri=True)
+
     def _open(self) -> None:
         try:
-            if not os.path.isfile(self.path):
+            if self.in_memory:
+                with memory_databases_lock:
+                    if self.path not in memory_databases:
+                        memory_databases[self.path] = self._connect()
+                        self._create_database()
+            elif not os.path.isfile(self._file_path()) and not self.read_only:
                 self._create_database()
-            self.conn = sqlite3.connect(self.path)
+            self.conn = self._connect()
+            if self.read_only:
+                self.conn.execute("PRAGMA query_only=ON")
+            elif not self.in_memory:
+                # Lets readers carry on while a write is being committed.
+                self.conn.execute("PRAGMA journal_mode=WAL")
             self.conn.row_factory = sqlite3.Row
             self.cur = self.conn.cursor()
             self.connected = True
@@ -40,6 +112,8 @@ class DatabaseManager:
         self.conn = None
         self.cur = None
         self.connected = False
+        if not self.read_only:
+            self.writer_lock.release()
         self.lock.release()
 
     def __enter__(self):
@@ -50,7 +124,7 @@ class DatabaseManager:
         self.close()
 
     def _create_database(self) -> None:
-        conn = sqlite3.connect(self.path)
+        conn = self._connect()
         cur = conn.cursor()
         cur.execute(
             "CREATE TABLE IF NOT EXISTS votes (user_from INTEGER, user_to INTEGER, category TEXT DEFAULT 'general', count INTEGER)"
@@ -100,7 +174,7 @@ class DatabaseManager:
         print("Created database!")
 
     def _get_ekn_service(self) -> None:
-        conn = sqlite3.connect(self.path)
+        conn = self._connect()
         conn.row_factory = sqlite3.Row
         cur = conn.cursor()
         result = cur.execute("SELECT * FROM services WHERE name='ETN'")
@@ -117,5 +191,12 @@ class DatabaseManager:
             return self.cur.execute(sql, params)
         return self.cur.execute(sql)
 
+    def executemany(
+        self, sql: str, params: Iterable[types.SQL_PARAM | dict]
+    ) -> sqlite3.Cursor:
+        if not self.connected:
+            raise RuntimeError("Cannot run executemany on a closed database!")
+        return self.cur.executemany(sql, params)
+
     def commit(self):
         self.conn.commit()
@@ -27,7 +27,11 @@ def allow_cors(
                     host = hosts[0]
                 response.headers.add("Access-Control-Allow-Origin", host)
             if response.headers.get("Access-Control-Allow-Headers") is None:
-                response.headers.add("Access-Control-Allow-Headers", "Content-type")
+                response.headers.add(
+                    "Access-Control-Allow-Headers", "Content-type, If-None-Match"
+                )
+            if response.headers.get("Access-Control-Expose-Headers") is None:
+                response.headers.add("Access-Control-Expose-Headers", "ETag")
             if response.headers.get("Vary"):
                 vary = response.headers.get("Vary")
                 assert vary is not None
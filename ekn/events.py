@@ -0,0 +1,126 @@
+from collections.abc import Iterable
+from ekn.background import start_periodic_task
+from ekn.database import DatabaseManager
+from ekn.queries import run
+from typing import Optional
+import json
+import sqlite3
+import sys
+import threading
+import time
+
+
+COMPACTION_INTERVAL = 5  # Seconds
+
+
+def append_vote_events(
+    db: DatabaseManager, events: Iterable[tuple[int, int, str, int]]
+) -> None:
+    """
+    Appends (user_from, user_to, category, amount) events to the vote log.
+
+    The votes table only sees these once they've been compacted.
+    """
+    now = int(time.time())
+    db.executemany(
+        "INSERT INTO vote_events (user_from, user_to, category, amount, created) "
+        + "VALUES (?, ?, ?, ?, ?)",
+        [event + (now,) for event in events],
+    )
+
+
+def get_compacted_seq(db: DatabaseManager) -> int:
+    """
+    Gets the sequence number of the last event folded into the votes table.
+    """
+    result = db.execute(
+        "SELECT value FROM etn_settings WHERE setting='vote_events_compacted'"
+    )
+    row = result.fetchone()
+    return int(row["value"]) if row else 0
+
+
+def get_edge_count(
+    db: DatabaseManager, user_from: int, user_to: int, category: Optional[str] = None
+) -> int:
+    """
+    Gets the current number of votes from one user to another, including any
+    events which haven't been compacted yet.  Counts every category if no
+    category is given.
+    """
+    params = {"from": user_from, "to": user_to, "cat": category or None}
+    return run(db, "edge_count", params).fetchone()[0]
+
+
+def get_edge_counts(
+    db: DatabaseManager, user_from: int, users_to: Iterable[int]
+) -> dict[int, dict[str, int]]:
+    """
+    Gets the current number of votes from one user to each of many, by
+    category, in one query.  Users without votes are left out.
+    """
+    params = {"from": user_from, "to": json.dumps(list(users_to))}
+    counts: dict[int, dict[str, int]] = {}
+    for row in run(db, "edge_counts", params).fetchall():
+        counts.setdefault(row["user_to"], {})[row["category"]] = row["count"]
+    return counts
+
+
+def get_vote_events(
+    db: DatabaseManager, since: int = 0, limit: int = 1000
+) -> list[sqlite3.Row]:
+    """
+    Gets up to `limit` events with a sequence number greater than `since`, oldest
+    first.  Pass the last `seq` seen as `since` to read the next page.
+    """
+    result = run(db, "vote_events_since", {"since": since, "limit": limit})
+    return result.fetchall()
+
+
+def compact_vote_events(db: DatabaseManager) -> int:
+    """
+    Folds every event which hasn't been compacted yet into the votes table.
+
+    Returns the number of events folded.
+    """
+    began = not db.conn.in_transaction
+    if began:
+        # Take the write lock first so two workers can't fold the same events.
+        db.execute("BEGIN IMMEDIATE")
+    done = get_compacted_seq(db)
+    result = db.execute(
+        "SELECT COALESCE(MAX(seq), 0), COUNT(*) FROM vote_events WHERE seq > :seq",
+        {"seq": done},
+    )
+    upto, pending = result.fetchone()
+    if pending:
+        db.execute(
+            """INSERT INTO votes (user_from, user_to, category, count)
+            SELECT user_from, user_to, category, SUM(amount) FROM vote_events
+            WHERE seq > :done AND seq <= :upto
+            GROUP BY user_from, user_to, category
+            ON CONFLICT(user_from, user_to, category) DO UPDATE SET count=votes.count + excluded.count""",
+            {"done": done, "upto": upto},
+        )
+        db.execute(
+            "UPDATE etn_settings SET value=:seq WHERE setting='vote_events_compacted'",
+            {"seq": str(upto)},
+        )
+    if began:
+        db.commit()
+    return pending
+
+
+def start_compactor(
+    interval: float = COMPACTION_INTERVAL, path: str = "database.db"
+) -> threading.Thread:
+    """
+    Starts a daemon thread which compacts the vote log every `interval` seconds.
+    """
+    return start_periodic_task("vote-compactor", interval, compact_vote_events, path)
+
+
+if __name__ == "__main__":
+    # Usage: python -m ekn.events [database path]
+    with DatabaseManager(*sys.argv[1:2]) as db:
+        print(f"Compacted {compact_vote_events(db)} vote events")
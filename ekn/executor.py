@@ -0,0 +1,61 @@
+from collections.abc import Callable
+from concurrent.futures import Executor, ProcessPoolExecutor, ThreadPoolExecutor
+from typing import Any, TypeVar
+import multiprocessing
+import os
+import threading
+
+
+T = TypeVar("T")
+
+# How many pieces of CPU-heavy work run at once in each pool, across every
+# request thread.  0 means one per CPU.
+CPU_WORKERS = int(os.environ.get("EKN_CPU_WORKERS", "0")) or os.cpu_count() or 1
+# Where each kind of CPU-heavy work runs: "inline" on the request thread,
+# "thread" on a thread pool (for NumPy, which releases the GIL) or "process" on
+# a process pool (for pure Python, which doesn't).
+SCORE_EXECUTOR = os.environ.get("EKN_SCORE_EXECUTOR", "thread")
+HASH_EXECUTOR = os.environ.get("EKN_HASH_EXECUTOR", "inline")
+
+# Pools are started on first use, by kind.
+pools: dict[str, Executor] = {}
+pools_lock = threading.Lock()
+
+
+def get_pool(kind: str) -> Executor:
+    """
+    Gets the shared "thread" or "process" pool, starting it if needed.
+    """
+    with pools_lock:
+        if kind not in pools:
+            if kind == "thread":
+                pools[kind] = ThreadPoolExecutor(CPU_WORKERS, thread_name_prefix="cpu")
+            elif kind == "process":
+                # Spawned, not forked, as the app already has background threads.
+                pools[kind] = ProcessPoolExecutor(
+                    CPU_WORKERS, mp_context=multiprocessing.get_context("spawn")
+                )
+            else:
+                raise ValueError(f"Unknown executor: {kind}")
+        return pools[kind]
+
+
+def run_cpu(kind: str, function: Callable[..., T], *args: Any) -> T:
+    """
+    Runs `function(*args)` on the `kind` executor and waits for its result.
+    Functions run on a process pool, and their arguments and results, must be
+    picklable.
+    """
+    if kind == "inline":
+        return function(*args)
+    return get_pool(kind).submit(function, *args).result()
+
+
+def shutdown_pools() -> None:
+    """
+    Stops every pool, after the work already submitted to it finishes.
+    """
+    with pools_lock:
+        for pool in pools.values():
+            pool.shutdown()
+        pools.clear()
@@ -1,17 +1,45 @@
+from contextlib import nullcontext
+from ekn.cache import TTLCache
 from ekn.database import DatabaseManager
+from ekn.events import compact_vote_events
+from ekn.executor import HASH_EXECUTOR, run_cpu
+from ekn.queries import run
+from ekn.sessions import refresh_session_key, session_key_valid
+from ekn.storage import SQLiteStorage, Storage
 from ekn.types import PASSWORD_TYPE
 from flask import request
-from typing import Any, Optional
+from typing import Any, Optional, TYPE_CHECKING
 import numpy as np
 import hashlib
-import json
-import secrets
+import os
 import sqlite3
 import time
 
+if TYPE_CHECKING:
+    from collections.abc import Iterable, Mapping
+
 
 NETWORK_SIZE_LIMIT = 10_000
 DECAY = 0.25
+SERVICE_CACHE_SIZE = 1024
+SERVICE_CACHE_TTL = 60
+IDENTITY_CACHE_SIZE = 10_000
+IDENTITY_CACHE_TTL = 60
+NETWORK_SIZE_CACHE_SIZE = 100_000
+NETWORK_SIZE_CACHE_TTL = 600
+# How get_network finds a network: "python" follows votes one user at a time,
+# "recursive" asks the storage for the whole network at once.
+NETWORK_EXTRACTION = os.environ.get("EKN_NETWORK_EXTRACTION", "python")
+
+# Services which recently passed verify_service, by name and a digest of the key
+service_cache = TTLCache(SERVICE_CACHE_SIZE, SERVICE_CACHE_TTL)
+# Users, without their credentials, by ("service_user", service id, service
+# username).  Users who aren't found aren't cached, so new connections never need
+# to be invalidated.
+identity_cache = TTLCache(IDENTITY_CACHE_SIZE, IDENTITY_CACHE_TTL)
+# How many users were in each viewer's network, by viewer id and flavor, the
+# last time get_votes scored for them
+network_sizes = TTLCache(NETWORK_SIZE_CACHE_SIZE, NETWORK_SIZE_CACHE_TTL)
 
 
 def get_params(params: list[str]) -> Any:
@@ -29,31 +57,28 @@ def get_params(params: list[str]) -> Any:
     return ret
 
 
-def get_where_str(flavors: Optional[list[str]]) -> str:
-    if not flavors:
-        return "WHERE '1'='1'"
-
-    flavors = ', '.join([f"'{flavor}'" for flavor in flavors])
-    return f"WHERE category in ({flavors})"
-
-
 def get_network(
-    user: int, where_str: str, checking: Optional[int] = None
+    user: int,
+    flavors: Optional[list[str]],
+    checking: Optional[int] = None,
+    storage: Optional[Storage] = None,
 ) -> set[int]:
     """
     Function runs at O(n^2) time.
     """
+    if storage is None:
+        storage = SQLiteStorage(DatabaseManager(read_only=True))
+    if NETWORK_EXTRACTION == "recursive":
+        with storage:
+            return storage.get_reachable(user, flavors, checking, NETWORK_SIZE_LIMIT)
     users: set[int] = {user}
     to_process: set[int] = {user}
-    with DatabaseManager() as db:
+    with storage:
         while to_process and len(users) < NETWORK_SIZE_LIMIT:
             u = to_process.pop()
             if u == checking:
                 continue
-            result = db.execute(
-                f"SELECT * FROM votes {where_str} AND user_from=:user", {"user": u}
-            )
-            for uu in result.fetchall():
+            for uu in storage.get_votes_from(u, flavors):
                 if uu["user_to"] not in users:
                     users.add(uu["user_to"])
                     to_process.add(uu["user_to"])
@@ -72,34 +97,27 @@ def get_users_index(users: set[int], from_user: int) -> dict[int, int]:
     return indexs
 
 
-def get_votes(_for: int, _from: int, flavor: str) -> float:
+def get_votes(
+    _for: int, _from: int, flavor: str, storage: Optional[Storage] = None
+) -> float:
     """
     The time complexity of np.dot is unknown to me, but this function runs at
     least at O(n^2).
 
     Any update to this function should also be reflected in /docs/algorithm.md
     """
-    with DatabaseManager() as db:
-        result = db.execute(
-            "SELECT * FROM categories WHERE category=:flavor", {"flavor": flavor}
-        )
-        row = result.fetchone()
-        # If the checked flavor doesn't exist, then the trust is 0
-        if not row:
-            return 0.0
-        flavor_type = row["type"]
-
-    if flavor_type == "general":
-        where_str = get_where_str([])
-    elif flavor_type == "normal":
-        where_str = get_where_str([flavor])
-    elif flavor_type == "secondary":
-        where_str = get_where_str([row["secondary_of"]])
-    elif flavor_type == "composite":
-        flavors = json.loads(row["composite_of"])
-        flavors.append(flavor)
-        where_str = get_where_str(flavors)
-    users_in_network = get_network(_from, where_str, _for)
+    if storage is None:
+        storage = SQLiteStorage(DatabaseManager(read_only=True))
+    compiled = storage.get_flavor(flavor)
+    # If the checked flavor doesn't exist, then the trust is 0
+    if not compiled:
+        return 0.0
+    flavor_type = compiled.type
+
+    # No flavors means every flavor
+    flavors = list(compiled.categories) if compiled.categories else None
+    users_in_network = get_network(_from, flavors, _for, storage)
+    network_sizes.set((_from, flavor), len(users_in_network))
 
     # If the node being inspected is not in the trust network, then the trust for them is 0.0
     if _for not in users_in_network:
@@ -112,16 +130,13 @@ def get_votes(_for: int, _from: int, flavor: str) -> float:
     total_votes = 0
     user_votes: dict[int, int] = {user: 0 for user in users_in_network}
 
-    with DatabaseManager() as db:
+    with storage:
         for user in users_in_network:
             if user == _for:
                 continue
-            result = db.execute(
-                f"SELECT * FROM votes {where_str} AND user_from=:from", {"from": user}
-            )
             total = 0
             votes: dict[int, int] = {}
-            for v in result.fetchall():
+            for v in storage.get_votes_from(user, flavors):
                 if v["user_to"] in votes:
                     votes[v["user_to"]] += v["count"]
                 else:
@@ -172,19 +187,15 @@ def get_votes(_for: int, _from: int, flavor: str) -> float:
     score = round(scores[for_index] * (total_votes - for_user_votes), 2)
 
     if flavor_type == "secondary":
-        with DatabaseManager() as db:
+        with storage:
             for user in users_index:
-                result = db.execute(
-                    "SELECT * FROM votes WHERE category=:cat AND user_from=:from AND user_to=:for",
-                    {"cat": flavor, "from": user, "for": _for},
-                )
-                row = result.fetchone()
-                if not row:
+                count = storage.get_vote_count(user, _for, flavor)
+                if not count:
                     # print(f"Not row for {user}")
                     continue
                 if user == _from:
                     # print("Direct add")
-                    score += row["count"]
+                    score += count
                     continue
                 # print(f"{scores=}")
                 # print(f"{user_votes=}")
@@ -193,7 +204,7 @@ def get_votes(_for: int, _from: int, flavor: str) -> float:
                 )
 
                 # print(f"{user=} {s=}")
-                score += row["count"] * s
+                score += count * s
 
     if score > 0.0:
         return score
@@ -228,26 +239,80 @@ def verify_credentials(
         return None
 
 
+def salted_hash(value: str, salt: str) -> str:
+    """
+    Hashes a password or service key the way they are stored.
+    """
+    sha512 = hashlib.new("sha512")
+    sha512.update(f"{value}:{salt}".encode("utf8"))
+    return sha512.hexdigest()
+
+
+def hash_password(value: str, salt: str) -> str:
+    """
+    Runs salted_hash on the hashing executor.
+    """
+    return run_cpu(HASH_EXECUTOR, salted_hash, value, salt)
+
+
+def check_password(
+    user: sqlite3.Row, password: str, password_type: PASSWORD_TYPE = None
+) -> bool:
+    """
+    Checks a password/key against a row from the "auth_user" query.
+    """
+    if password_type is None or password_type == "raw_password":
+        return hash_password(password, user["salt"]) == user["password"]
+    elif password_type == "password_hash":
+        return password == user["password"]
+    elif password_type == "connection_key":
+        return (
+            user["connection_key"] is not None
+            and user["connection_key"] == password
+            and user["security"] == 0
+        )
+    elif password_type == "session_key":
+        return (
+            user["session_key"] is not None
+            and user["session_key"] == password
+            and user["security"] != 2
+            and user["session_expires"] >= int(time.time())
+        )
+    return False
+
+
+def get_user_credentials(username: str) -> Optional[sqlite3.Row]:
+    """
+    Gets an EKN user, with their password hash and salt, by username.  Never
+    cached, as another process may have just changed them.
+    """
+    with DatabaseManager(read_only=True) as db:
+        result = run(db, "user_credentials_by_username", {"username": username})
+        return result.fetchone()
+
+
+def forget_users(user_ids: "Iterable[int]") -> None:
+    """
+    Drops cached lookups of users, after their credentials, security or
+    connections change.
+    """
+    user_ids = set(user_ids)
+    identity_cache.invalidate_values(lambda user: user["id"] in user_ids)
+
+
 def verify_credentials_raw(username: str, password: str) -> Optional[sqlite3.Row]:
     """
     Verifies an EKN username and raw password.
     """
 
-    with DatabaseManager() as db:
-        result = db.execute(
-            "SELECT * FROM users WHERE username=:username", {"username": username}
-        )
-        user = result.fetchone()
-        if not user:
-            return None
+    user = get_user_credentials(username)
+    if not user:
+        return None
 
-        salt = user["salt"]
-        sha512 = hashlib.new("sha512")
-        sha512.update(f"{password}:{salt}".encode("utf8"))
-        password_hash = sha512.hexdigest()
-        if not password_hash == user["password"]:
-            return None
-        return user
+    password_hash = hash_password(password, user["salt"])
+    if not password_hash == user["password"]:
+        return None
+    return user
 
 
 def verify_credentials_hash(username: str, password_hash: str) -> Optional[sqlite3.Row]:
@@ -255,66 +320,61 @@ def verify_credentials_hash(username: str, password_hash: str) -> Optional[sqlit
     Verifies an EKN username and password hash.
     """
 
-    with DatabaseManager() as db:
-        result = db.execute(
-            "SELECT * FROM users WHERE username=:username", {"username": username}
-        )
-        user = result.fetchone()
-        if not user:
-            return None
+    user = get_user_credentials(username)
+    if not user:
+        return None
 
-        if not password_hash == user["password"]:
-            return None
-        return user
+    if not password_hash == user["password"]:
+        return None
+    return user
 
 
 def verify_session_key(username: str, key: str) -> Optional[sqlite3.Row]:
     """
-    Verifies an EKN user id and session key.
+    Verifies an EKN username and session key.
     """
 
-    with DatabaseManager() as db:
-        result = db.execute(
-            "SELECT * FROM users WHERE username=:username", {"username": username}
-        )
-        user = result.fetchone()
-        if not user:
-            return None
-        if user["security"] == 2:
-            return None
-        result = db.execute(
-            "SELECT * FROM session_keys WHERE user=:user_id", {"user_id": user["id"]}
-        )
+    user = get_user_credentials(username)
+    if not user or user["security"] == 2:
+        return None
+    with DatabaseManager(read_only=True) as db:
+        result = run(db, "session_key", {"user_id": user["id"]})
         row = result.fetchone()
-        if not row:
-            return None
-        if row["expires"] < int(time.time()):
-            return None
-
-        if key != row["key"]:
-            return None
-        return user
+    if not row or row["key"] != key or row["expires"] < int(time.time()):
+        return None
+    return user
 
 
-def verify_service(service: str, key: str) -> Optional[sqlite3.Row]:
+def verify_service(
+    service: str, key: str, db: Optional[DatabaseManager] = None
+) -> Optional[sqlite3.Row]:
     """
-    Verifies a service's credentials.
+    Verifies a service's credentials, using `db` if it is already open.
+    Services which were verified in the last SERVICE_CACHE_TTL seconds with the
+    same key aren't looked up again.
     """
 
-    with DatabaseManager() as db:
-        result = db.execute(
-            "SELECT * FROM services WHERE name=:name", {"name": service}
-        )
+    cache_key = (service, hashlib.sha256(f"{key}".encode("utf8")).digest())
+    service_obj = service_cache.get(cache_key)
+    if service_obj is not None:
+        return service_obj
+
+    with nullcontext(db) if db else DatabaseManager() as db:
+        result = run(db, "service", {"name": service})
         service_obj = result.fetchone()
         if not service_obj:
             return None
-        salt = service_obj["salt"]
-        sha512 = hashlib.new("sha512")
-        sha512.update(f"{key}:{salt}".encode("utf8"))
-        key_hash = sha512.hexdigest()
-        if key_hash != service_obj["key"]:
+        if hash_password(key, service_obj["salt"]) != service_obj["key"]:
             return None
-        return service_obj
+    service_cache.set(cache_key, service_obj)
+    return service_obj
+
+
+def forget_service(service: str) -> None:
+    """
+    Drops a service's cached verifications, e.g. after it is given a new key.
+    """
+    service_cache.invalidate(lambda cache_key: cache_key[0] == service)
 
 
 def resolve_service_username(
@@ -324,21 +384,20 @@ def resolve_service_username(
     Gets an EKN username from a service id and the username on the service.
     """
 
-    with DatabaseManager() as db:
-        result = db.execute(
-            "SELECT * FROM connections WHERE service=:service_id AND service_user=:service_user",
+    user = identity_cache.get(("service_user", service_id, service_user))
+    if user is not None:
+        return user
+
+    with DatabaseManager(read_only=True) as db:
+        result = run(
+            db,
+            "user_by_service_user",
             {"service_id": service_id, "service_user": service_user},
         )
-        service_user_obj = result.fetchone()
-        if not service_user_obj:
-            return None
-        result = db.execute(
-            "SELECT * FROM users WHERE id=:id", {"id": service_user_obj["user"]}
-        )
         user = result.fetchone()
-        if not user:
-            return None
-        return user
+    if user:
+        identity_cache.set(("service_user", service_id, service_user), user)
+    return user
 
 
 def verify_service_username(
@@ -349,21 +408,16 @@ def verify_service_username(
     """
 
     with DatabaseManager() as db:
-        result = db.execute(
-            "SELECT * FROM connections WHERE service=:service_id AND service_user=:service_user",
+        result = run(
+            db,
+            "user_credentials_by_service_user",
             {"service_id": service_id, "service_user": service_user},
         )
-        service_user_obj = result.fetchone()
-        if not service_user_obj:
-            return None
-        if service_user_obj["key"] is None or service_user_obj["key"] != key:
-            return None
-        result = db.execute(
-            "SELECT * FROM users WHERE id=:id", {"id": service_user_obj["user"]}
-        )
         user = result.fetchone()
         if not user:
             return None
+        if user["connection_key"] is None or user["connection_key"] != key:
+            return None
         if user["security"] != 0:
             return None
         return user
@@ -371,37 +425,75 @@ def verify_service_username(
 
 def update_session_key(username: str) -> None:
     """
-    Updates a user's session key if neccessary.
+    Updates a user's session key if neccessary.  Only reads the session_keys
+    table when the key isn't already known to be valid.
     """
-    with DatabaseManager() as db:
-        result = db.execute(
-            "SELECT * FROM users WHERE username=:username", {"username": username}
-        )
-        user = result.fetchone()
-        assert user is not None
-        if user["security"] == 2:
-            return
-        result = db.execute(
-            "SELECT * FROM session_keys WHERE user=:user_id", {"user_id": user["id"]}
-        )
+    if session_key_valid(username):
+        return
+    with DatabaseManager(read_only=True) as db:
+        result = run(db, "session_expiry", {"username": username})
         row = result.fetchone()
-        gen_key = True
-        if row:
-            gen_key = False
-            if row["expires"] > int(time.time()):
-                session_key = row["key"]
-                expires = row["expires"]
-            else:
-                session_key = secrets.token_hex(16)
-                expires = int(time.time()) + 86_400
-                db.execute(
-                    "UPDATE session_keys SET key=:key, expires=:expires WHERE user=:id",
-                    {"id": user["id"], "key": session_key, "expires": expires},
-                )
-        if gen_key:
-            session_key = secrets.token_hex(16)
-            expires = int(time.time()) + 86_400
-            db.execute(
-                "INSERT INTO session_keys (user, key, expires) VALUES (?, ?, ?)",
-                (user["id"], session_key, expires),
-            )
+    assert row is not None
+    refresh_session_key(row, row["expires"])
+
+
+def merge_temp_users(db: DatabaseManager, merges: "Mapping[int, int]") -> int:
+    """
+    Merges temp accounts into real accounts, given as {temp user id: user id}.
+
+    Votes are moved over in one pass, summing the counts of any edges the real
+    account already has and dropping votes the accounts made for each other.
+    The temp accounts' connections are moved over, the temp accounts deleted
+    and their cached lookups dropped.
+    Must be called with an open database, and is left uncommitted.  Returns how
+    many accounts were merged.
+    """
+    if not db.conn.in_transaction:
+        # Compacting and merging in one write transaction means no event for a
+        # temp account can be appended between them.
+        db.execute("BEGIN IMMEDIATE")
+    # Pending votes need to be in the votes table to be moved with the rest.
+    compact_vote_events(db)
+    db.execute(
+        "CREATE TEMP TABLE IF NOT EXISTS merge_map (temp_id INTEGER PRIMARY KEY, user_id INTEGER)"
+    )
+    db.execute("DELETE FROM merge_map")
+    db.executemany(
+        "INSERT INTO merge_map (temp_id, user_id) VALUES (?, ?)", merges.items()
+    )
+    # Only ever merge temp accounts, and never into another account being merged.
+    db.execute(
+        "DELETE FROM merge_map WHERE temp_id NOT IN (SELECT id FROM users WHERE temp=1) "
+        + "OR user_id IN (SELECT temp_id FROM merge_map)"
+    )
+    merged = db.execute("SELECT COUNT(*) FROM merge_map").fetchone()[0]
+    if not merged:
+        return 0
+
+    db.execute(
+        """INSERT INTO votes (user_from, user_to, category, count)
+        SELECT
+            COALESCE(map_from.user_id, votes.user_from) AS new_from,
+            COALESCE(map_to.user_id, votes.user_to) AS new_to,
+            votes.category,
+            SUM(votes.count)
+        FROM votes
+        LEFT JOIN merge_map AS map_from ON map_from.temp_id=votes.user_from
+        LEFT JOIN merge_map AS map_to ON map_to.temp_id=votes.user_to
+        WHERE map_from.temp_id IS NOT NULL OR map_to.temp_id IS NOT NULL
+        GROUP BY new_from, new_to, votes.category
+        HAVING new_from != new_to
+        ON CONFLICT(user_from, user_to, category) DO UPDATE SET count=votes.count + excluded.count"""
+    )
+    db.execute(
+        "DELETE FROM votes WHERE user_from IN (SELECT temp_id FROM merge_map) "
+        + "OR user_to IN (SELECT temp_id FROM merge_map)"
+    )
+    db.execute(
+        "UPDATE connections SET user=(SELECT user_id FROM merge_map WHERE temp_id=connections.user) "
+        + "WHERE user IN (SELECT temp_id FROM merge_map)"
+    )
+    db.execute("DELETE FROM users WHERE id IN (SELECT temp_id FROM merge_map)")
+    db.execute("DELETE FROM merge_map")
+    forget_users(merges)
+    return merged
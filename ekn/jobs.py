@@ -0,0 +1,336 @@
+from concurrent.futures import ThreadPoolExecutor
+from ekn.admission import ScoreRejected, admitted_score
+from ekn.background import start_periodic_task
+from ekn.conditional import data_versions
+from ekn.database import DatabaseManager
+from ekn.helpers import get_network
+from ekn.queries import run
+from ekn.singleflight import coalesce_score
+from ekn.storage import SQLiteStorage
+from typing import Any, Optional
+import json
+import os
+import secrets
+import sqlite3
+import threading
+import time
+
+
+# How many score jobs run at once, and can wait to run, in each process.
+JOB_WORKERS = int(os.environ.get("EKN_JOB_WORKERS", "2"))
+JOB_QUEUE_SIZE = int(os.environ.get("EKN_JOB_QUEUE_SIZE", "64"))
+# How many unfinished jobs each service can have at once.
+SERVICE_JOB_LIMIT = int(os.environ.get("EKN_SERVICE_JOB_LIMIT", "8"))
+# How long finished jobs, and their results, are kept for.  Seconds.
+JOB_TTL = int(os.environ.get("EKN_JOB_TTL", "3600"))
+# How long unfinished jobs are kept unless the process running them renews them,
+# every HEARTBEAT_INTERVAL seconds.  Jobs of a process which died stop counting
+# against their service's limit once this runs out.  Seconds.
+JOB_LEASE = 60
+HEARTBEAT_INTERVAL = 15  # Seconds
+# The longest a poll can wait for a job to finish.  Seconds.
+MAX_WAIT = 30
+# How long to wait before resubmitting a job turned away by a full queue.
+QUEUE_RETRY_AFTER = 5  # Seconds
+POLL_INTERVAL = 0.5  # Seconds
+SWEEP_INTERVAL = 60  # Seconds
+TOP_K_LIMIT = 100
+# The most users a batch job can score, or a top job can score to find the highest.
+BATCH_LIMIT = 100
+TOP_NETWORK_LIMIT = int(os.environ.get("EKN_TOP_NETWORK_LIMIT", "500"))
+FINISHED = ("done", "failed")
+
+job_pool: Optional[ThreadPoolExecutor] = None
+job_pool_lock = threading.Lock()
+# Ids of jobs started by this process which haven't finished
+jobs_pending: set[str] = set()
+# Notified whenever a job run by this process finishes.
+job_finished = threading.Condition()
+
+
+def create_job(
+    db: DatabaseManager, service_id: int, viewer: int, request: dict[str, Any]
+) -> str:
+    """
+    Records a queued score job and returns its id.  `request` is what to score;
+    see run_job.  The job has to be committed before it is started.
+    """
+    job_id = secrets.token_hex(16)
+    now = int(time.time())
+    db.execute(
+        "INSERT INTO score_jobs (id, service, viewer, request, status, created, expires) "
+        + "VALUES (:id, :service_id, :viewer, :request, 'queued', :now, :expires)",
+        {
+            "id": job_id,
+            "service_id": service_id,
+            "viewer": viewer,
+            "request": json.dumps(request),
+            "now": now,
+            "expires": now + JOB_LEASE,
+        },
+    )
+    return job_id
+
+
+def count_active_jobs(db: DatabaseManager, service_id: int) -> int:
+    """
+    How many of a service's jobs are queued or running, in any process.
+    """
+    result = run(
+        db, "active_score_jobs", {"service_id": service_id, "now": int(time.time())}
+    )
+    return result.fetchone()[0]
+
+
+def delete_job(db: DatabaseManager, job_id: str) -> None:
+    db.execute("DELETE FROM score_jobs WHERE id=:id", {"id": job_id})
+
+
+def start_job(
+    job_id: str, service_id: int, viewer: int, request: dict[str, Any]
+) -> bool:
+    """
+    Runs a committed job on this process' job pool.  Returns False, without
+    starting it, if JOB_QUEUE_SIZE jobs are already waiting or running.
+    """
+    global job_pool
+    with job_pool_lock:
+        if len(jobs_pending) >= JOB_QUEUE_SIZE:
+            return False
+        if job_pool is None:
+            job_pool = ThreadPoolExecutor(JOB_WORKERS, thread_name_prefix="job")
+            threading.Thread(
+                target=renew_jobs_forever, name="job-heartbeat", daemon=True
+            ).start()
+        jobs_pending.add(job_id)
+        job_pool.submit(run_pooled_job, job_id, service_id, viewer, request)
+        return True
+
+
+def run_pooled_job(
+    job_id: str, service_id: int, viewer: int, request: dict[str, Any]
+) -> None:
+    try:
+        run_job(job_id, service_id, viewer, request)
+    finally:
+        with job_pool_lock:
+            jobs_pending.discard(job_id)
+
+
+def renew_jobs() -> int:
+    """
+    Keeps this process' unfinished jobs for another JOB_LEASE seconds.  Returns
+    how many were renewed.
+    """
+    with job_pool_lock:
+        job_ids = sorted(jobs_pending)
+    if not job_ids:
+        return 0
+    with DatabaseManager() as db:
+        result = db.execute(
+            "UPDATE score_jobs SET expires=:expires "
+            + "WHERE id IN (SELECT value FROM json_each(:ids)) "
+            + "AND status IN ('queued', 'running')",
+            {"ids": json.dumps(job_ids), "expires": int(time.time()) + JOB_LEASE},
+        )
+        return result.rowcount
+
+
+def renew_jobs_forever() -> None:
+    while True:
+        time.sleep(HEARTBEAT_INTERVAL)
+        try:
+            renew_jobs()
+        except sqlite3.Error as e:
+            print(f"Database Error in job-heartbeat: {e}")
+
+
+def set_job_status(
+    job_id: str, status: str, result: Any = None, error: Optional[str] = None
+) -> None:
+    ttl = JOB_TTL if status in FINISHED else JOB_LEASE
+    with DatabaseManager() as db:
+        db.execute(
+            "UPDATE score_jobs SET status=:status, result=:result, error=:error, "
+            + "expires=:expires WHERE id=:id",
+            {
+                "id": job_id,
+                "status": status,
+                "result": None if result is None else json.dumps(result),
+                "error": error,
+                "expires": int(time.time()) + ttl,
+            },
+        )
+
+
+def run_job(job_id: str, service_id: int, viewer: int, request: dict[str, Any]) -> None:
+    """
+    Runs a score job, storing its result or error.  Scores wait for a turn
+    from `request["service"]`'s admission, like /get_score.  `request["kind"]`
+    is one of:
+
+    * "single": scores `request["targets"][0]`, a [service username, user id] pair.
+    * "batch": scores every pair in `request["targets"]`.  Users who aren't
+      connected to the service have no id, and get a 404 result.
+    * "top": finds the `request["k"]` highest scored users connected to the
+      service in the viewer's network.  Fails if more than TOP_NETWORK_LIMIT
+      of them would have to be scored.
+    """
+    service = request["service"]
+    try:
+        set_job_status(job_id, "running")
+        if request["kind"] == "top":
+            result: Any = top_scores(
+                service, service_id, viewer, request["flavor"], request["k"]
+            )
+        else:
+            result = [
+                score_target(
+                    service, viewer, request["from"], name, user_id, request["flavor"]
+                )
+                for name, user_id in request["targets"]
+            ]
+            if request["kind"] == "single":
+                result = result[0]
+        set_job_status(job_id, "done", result)
+    except Exception as e:
+        print(f"Score job {job_id} failed: {e!r}")
+        set_job_status(job_id, "failed", error=str(e))
+    finally:
+        with job_finished:
+            job_finished.notify_all()
+
+
+def score_once(service: str, for_id: int, viewer: int, flavor: str) -> float:
+    """
+    Calculates a score once it's given a turn, sharing the calculation with
+    identical ones of the same data running at the same time.
+    """
+    with DatabaseManager(read_only=True) as db:
+        versions = data_versions(run(db, "data_versions").fetchall())
+    return coalesce_score(
+        (service, for_id, viewer, flavor, *versions),
+        admitted_score,
+        service,
+        for_id,
+        viewer,
+        flavor,
+    )
+
+
+def score_target(
+    service: str,
+    viewer: int,
+    _from: str,
+    _for: str,
+    for_id: Optional[int],
+    flavor: str,
+) -> dict[str, Any]:
+    """
+    One score, in the same form as a /get_score response.
+    """
+    result: dict[str, Any] = {"for": _for, "from": _from, "flavor": flavor}
+    if for_id is None:
+        result.update(status=404, message="'for' is not connected to this service.")
+    elif for_id == viewer:
+        result.update(status=400, message="User cannot view themselves.")
+    else:
+        try:
+            score = score_once(service, for_id, viewer, flavor)
+        except ScoreRejected as e:
+            result.update(status=503, message=str(e))
+        else:
+            result.update(score=score, status=200)
+    return result
+
+
+def top_scores(
+    service: str, service_id: int, viewer: int, flavor: str, k: int
+) -> list[dict]:
+    """
+    Scores everyone in the viewer's network who is connected to the service, and
+    returns the `k` highest as [{"for": service username, "score": score}].
+    """
+    database = DatabaseManager(read_only=True)
+    storage = SQLiteStorage(database)
+    compiled = storage.get_flavor(flavor)
+    if not compiled:
+        raise ValueError("Flavor does not exist.")
+    flavors = list(compiled.categories) if compiled.categories else None
+    network = get_network(viewer, flavors, storage=storage)
+    network.discard(viewer)
+
+    with database as db:
+        result = run(
+            db,
+            "service_users_by_ids",
+            {"service_id": service_id, "ids": json.dumps(sorted(network))},
+        )
+        names = {row["user"]: row["service_user"] for row in result.fetchall()}
+    if len(names) > TOP_NETWORK_LIMIT:
+        raise ValueError(
+            f"Network is too large, over {TOP_NETWORK_LIMIT} users would be scored."
+        )
+    scores = [
+        {"for": name, "score": score_once(service, user, viewer, flavor)}
+        for user, name in names.items()
+    ]
+    scores.sort(key=lambda score: score["score"], reverse=True)
+    return scores[:k]
+
+
+def read_job(job_id: str, service_id: int) -> Optional[dict[str, Any]]:
+    """
+    Gets a job's status, and its result or error once it has finished.  Returns
+    None if there is no such job for the service, or it has expired.
+    """
+    with DatabaseManager(read_only=True) as db:
+        row = run(
+            db,
+            "score_job",
+            {"id": job_id, "service_id": service_id, "now": int(time.time())},
+        ).fetchone()
+    if not row:
+        return None
+    job: dict[str, Any] = {"job": row["id"], "status": row["status"]}
+    if row["status"] == "done":
+        job["result"] = json.loads(row["result"])
+    elif row["status"] == "failed":
+        job["error"] = row["error"]
+    return job
+
+
+def wait_for_job(
+    job_id: str, service_id: int, wait: float = 0
+) -> Optional[dict[str, Any]]:
+    """
+    Like read_job, but waits up to `wait` seconds for the job to finish.  Jobs
+    run by other processes are checked for every POLL_INTERVAL seconds.
+    """
+    deadline = time.monotonic() + min(wait, MAX_WAIT)
+    while True:
+        job = read_job(job_id, service_id)
+        remaining = deadline - time.monotonic()
+        if job is None or job["status"] in FINISHED or remaining <= 0:
+            return job
+        with job_finished:
+            job_finished.wait(min(remaining, POLL_INTERVAL))
+
+
+def sweep_jobs(db: DatabaseManager) -> int:
+    """
+    Deletes expired jobs.  Returns how many were deleted.
+    """
+    result = db.execute(
+        "DELETE FROM score_jobs WHERE expires<=:now", {"now": int(time.time())}
+    )
+    return result.rowcount
+
+
+def start_job_sweeper(
+    interval: float = SWEEP_INTERVAL, path: str = "database.db"
+) -> threading.Thread:
+    """
+    Starts a daemon thread which deletes expired jobs every `interval` seconds.
+    """
+    return start_periodic_task("job-sweeper", interval, sweep_jobs, path)
@@ -0,0 +1,101 @@
+from ekn.background import start_periodic_task
+from ekn.database import DatabaseManager
+from ekn.events import compact_vote_events
+from ekn.helpers import merge_temp_users
+import sys
+import threading
+
+
+COMPACTION_INTERVAL = 86_400  # Seconds
+
+
+def merge_duplicate_temp_users(db: DatabaseManager) -> int:
+    """
+    Merges temp accounts whose service user is also connected to a real account,
+    and removes the duplicate connections this leaves.  Returns how many temp
+    accounts were merged.
+    """
+    result = db.execute(
+        """SELECT temp_connections.user AS temp_id, MIN(connections.user) AS user_id
+        FROM connections AS temp_connections
+        JOIN users AS temp_users ON temp_users.id=temp_connections.user AND temp_users.temp=1
+        JOIN connections ON connections.service=temp_connections.service
+            AND connections.service_user=temp_connections.service_user
+            AND connections.user!=temp_connections.user
+        JOIN users ON users.id=connections.user AND users.temp=0
+        GROUP BY temp_connections.user"""
+    )
+    merged = merge_temp_users(
+        db, {row["temp_id"]: row["user_id"] for row in result.fetchall()}
+    )
+    # Keep the connection with a key, so services' stored keys stay valid.
+    db.execute(
+        """DELETE FROM connections WHERE rowid IN (
+            SELECT rowid FROM (
+                SELECT rowid, ROW_NUMBER() OVER (
+                    PARTITION BY service, service_user, user ORDER BY key IS NULL, rowid
+                ) AS position FROM connections
+            ) WHERE position > 1
+        )"""
+    )
+    return merged
+
+
+def compact_graph(db: DatabaseManager) -> dict[str, int]:
+    """
+    Shrinks the trust graph and the database file.
+
+    Folds in pending vote events, merges duplicate temp accounts, deletes edges
+    with no votes left, then refreshes the query planner's statistics and frees
+    unused pages.  Returns counts describing how much the graph shrank.
+    """
+    report = {
+        "edges_before": db.execute("SELECT COUNT(*) FROM votes").fetchone()[0],
+        "users_before": db.execute("SELECT COUNT(*) FROM users").fetchone()[0],
+        "pages_before": db.execute("PRAGMA page_count").fetchone()[0],
+    }
+    if not db.conn.in_transaction:
+        # One write transaction, so no event for a merged account is appended
+        # between compacting and merging.
+        db.execute("BEGIN IMMEDIATE")
+    compact_vote_events(db)
+    report["temp_users_merged"] = merge_duplicate_temp_users(db)
+    result = db.execute("DELETE FROM votes WHERE count<=0")
+    report["zero_edges_removed"] = result.rowcount
+    db.commit()
+
+    db.execute("ANALYZE")
+    # Only frees pages if auto_vacuum is INCREMENTAL, which needs a full VACUUM to set.
+    if db.execute("PRAGMA auto_vacuum").fetchone()[0] == 2:
+        db.execute("PRAGMA incremental_vacuum").fetchall()
+    db.commit()
+
+    report["edges_after"] = db.execute("SELECT COUNT(*) FROM votes").fetchone()[0]
+    report["users_after"] = db.execute("SELECT COUNT(*) FROM users").fetchone()[0]
+    report["pages_after"] = db.execute("PRAGMA page_count").fetchone()[0]
+    return report
+
+
+def start_graph_compactor(
+    interval: float = COMPACTION_INTERVAL, path: str = "database.db"
+) -> threading.Thread:
+    """
+    Starts a daemon thread which compacts the trust graph every `interval`
+    seconds.
+    """
+    return start_periodic_task("graph-compactor", interval, compact_graph, path)
+
+
+if __name__ == "__main__":
+    # Usage: python -m ekn.maintenance [database path]
+    with DatabaseManager(*sys.argv[1:2]) as db:
+        report = compact_graph(db)
+    print(
+        f"Edges: {report['edges_before']} -> {report['edges_after']} "
+        + f"({report['zero_edges_removed']} with no votes removed)"
+    )
+    print(
+        f"Users: {report['users_before']} -> {report['users_after']} "
+        + f"({report['temp_users_merged']} duplicate temp accounts merged)"
+    )
+    print(f"Pages: {report['pages_before']} -> {report['pages_after']}")
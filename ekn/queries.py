@@ -0,0 +1,145 @@
+from collections import Counter
+from collections.abc import Iterable
+from ekn.database import DatabaseManager
+from typing import Any, Optional
+import json
+import sqlite3
+import threading
+
+
+# Columns to use when a user's password hash and salt aren't needed.
+USER_COLUMNS = "users.id, users.username, users.security, users.temp"
+CREDENTIAL_COLUMNS = f"{USER_COLUMNS}, users.password, users.salt"
+CATEGORY_COLUMNS = "category, type, secondary_of, composite_of, description"
+# The sequence number of the last vote event folded into the votes table.  Read
+# in the same statement as the counts, so both come from one snapshot.
+COMPACTED_SEQ = """(SELECT COALESCE(MAX(CAST(value AS INTEGER)), 0) FROM etn_settings
+        WHERE setting='vote_events_compacted')"""
+
+# Named statements.  Each one is always the same SQL text, so SQLite can reuse
+# the prepared statement; flavor lists are bound as JSON arrays via `bind_flavors()`.
+QUERIES: dict[str, str] = {
+    "user": f"SELECT {USER_COLUMNS} FROM users WHERE id=:id",
+    "user_id": "SELECT id FROM users WHERE username=:username",
+    "user_credentials": f"SELECT {CREDENTIAL_COLUMNS} FROM users WHERE id=:id",
+    "user_credentials_by_username": (
+        f"SELECT {CREDENTIAL_COLUMNS} FROM users WHERE username=:username"
+    ),
+    "user_by_service_user": f"""SELECT {USER_COLUMNS} FROM connections
+        JOIN users ON users.id=connections.user
+        WHERE connections.service=:service_id
+        AND connections.service_user=:service_user""",
+    "user_credentials_by_service_user": f"""SELECT {CREDENTIAL_COLUMNS},
+        connections.key AS connection_key FROM connections
+        JOIN users ON users.id=connections.user
+        WHERE connections.service=:service_id
+        AND connections.service_user=:service_user""",
+    "user_ids_by_service_users": """SELECT connections.service_user,
+        users.id FROM connections JOIN users ON users.id=connections.user
+        WHERE connections.service=:service_id
+        AND connections.service_user IN (SELECT value FROM json_each(:service_users))""",
+    # Everything needed to authenticate a user acting through a service, and
+    # who they are acting on.  `username` is a service username, falling back
+    # to an EKN username.
+    "auth_user": f"""SELECT {CREDENTIAL_COLUMNS},
+        connections.key AS connection_key, session_keys.key AS session_key,
+        session_keys.expires AS session_expires,
+        (SELECT target.id FROM connections JOIN users AS target
+        ON target.id=connections.user WHERE connections.service=:service_id
+        AND connections.service_user=:target) AS target_id
+        FROM users
+        LEFT JOIN connections ON connections.user=users.id
+        AND connections.service=:service_id AND connections.service_user=:username
+        LEFT JOIN session_keys ON session_keys.user=users.id
+        WHERE users.id=COALESCE(
+            (SELECT actor.id FROM connections JOIN users AS actor
+            ON actor.id=connections.user WHERE connections.service=:service_id
+            AND connections.service_user=:username),
+            (SELECT id FROM users WHERE username=:username))""",
+    "service_users_by_ids": """SELECT user, service_user FROM connections
+        WHERE service=:service_id AND user IN (SELECT value FROM json_each(:ids))""",
+    "service": "SELECT id, name, key, salt FROM services WHERE name=:name",
+    "service_id": "SELECT id FROM services WHERE name=:name",
+    "connection": """SELECT service, service_user, user, key FROM connections
+        WHERE service=:service_id AND service_user=:service_user""",
+    "connection_key": (
+        "SELECT key FROM connections WHERE user=:user_id AND service=:service_id"
+    ),
+    "session_key": "SELECT user, key, expires FROM session_keys WHERE user=:user_id",
+    "session_expiry": """SELECT users.id, users.username, users.security,
+        session_keys.expires FROM users LEFT JOIN session_keys ON session_keys.user=users.id
+        WHERE users.username=:username""",
+    "data_versions": """SELECT setting, value FROM etn_settings
+        WHERE setting IN ('graph_version', 'categories_version')""",
+    "active_score_jobs": """SELECT COUNT(*) FROM score_jobs WHERE service=:service_id
+        AND status IN ('queued', 'running') AND expires>:now""",
+    "score_job": """SELECT id, viewer, request, status, result, error FROM score_jobs
+        WHERE id=:id AND service=:service_id AND expires>:now""",
+    "category": f"SELECT {CATEGORY_COLUMNS} FROM categories WHERE category=:cat",
+    "categories": f"SELECT {CATEGORY_COLUMNS} FROM categories",
+    "votes_from": """SELECT user_from, user_to, category, count FROM votes
+        WHERE user_from=:user AND (:flavors IS NULL
+        OR category IN (SELECT value FROM json_each(:flavors)))""",
+    # Each user is only added, and followed, once.  The LIMIT stops the walk
+    # itself once that many users are found, nearest first.
+    "reachable": """WITH RECURSIVE reach(id) AS (
+            SELECT :user
+            UNION
+            SELECT votes.user_to FROM reach
+            JOIN votes ON votes.user_from=reach.id
+            WHERE reach.id IS NOT :checking
+            AND (:flavors IS NULL
+            OR votes.category IN (SELECT value FROM json_each(:flavors)))
+            LIMIT :limit
+        )
+        SELECT id FROM reach""",
+    "vote_count": """SELECT COALESCE(SUM(count), 0) FROM votes
+        WHERE user_from=:from AND user_to=:to AND (:cat IS NULL OR category=:cat)""",
+    # Votes from one user to others, including events which aren't compacted yet.
+    "edge_count": f"""SELECT (SELECT COALESCE(SUM(count), 0) FROM votes
+        WHERE user_from=:from AND user_to=:to AND (:cat IS NULL OR category=:cat))
+        + (SELECT COALESCE(SUM(amount), 0) FROM vote_events
+        WHERE seq > {COMPACTED_SEQ} AND user_from=:from AND user_to=:to
+        AND (:cat IS NULL OR category=:cat))""",
+    "edge_counts": f"""SELECT user_to, category, SUM(count) AS count FROM (
+            SELECT user_to, category, count FROM votes
+            WHERE user_from=:from AND user_to IN (SELECT value FROM json_each(:to))
+            UNION ALL
+            SELECT user_to, category, amount FROM vote_events
+            WHERE seq > {COMPACTED_SEQ} AND user_from=:from
+            AND user_to IN (SELECT value FROM json_each(:to))
+        ) GROUP BY user_to, category""",
+    "vote_events_since": """SELECT seq, user_from, user_to, category, amount,
+        created FROM vote_events WHERE seq > :since ORDER BY seq LIMIT :limit""",
+}
+
+executions: Counter[str] = Counter()
+executions_lock = threading.Lock()
+
+
+def bind_flavors(flavor_list: Optional[Iterable[str]]) -> Optional[str]:
+    """
+    Binds a list of flavors as one parameter.  Empty means every flavor.
+    """
+    flavor_list = list(flavor_list or [])
+    return json.dumps(flavor_list) if flavor_list else None
+
+
+def run(
+    db: DatabaseManager, name: str, params: Optional[dict[str, Any]] = None
+) -> sqlite3.Cursor:
+    """
+    Runs a named statement on an open database.
+    """
+    sql = QUERIES[name]
+    with executions_lock:
+        executions[name] += 1
+    return db.execute(sql, params or {})
+
+
+def get_executions() -> dict[str, int]:
+    """
+    How many times each named statement has run in this process.
+    """
+    with executions_lock:
+        return dict(executions)
@@ -1,3 +1,4 @@
+import ekn.routes.jobs as jobs
 import ekn.routes.misc as misc
 import ekn.routes.registration as registration
 import ekn.routes.users as users
@@ -8,10 +9,13 @@ change_security = users.change_security
 gdpr_view = users.gdpr_view
 get_score = voting.get_score
 get_current_key = users.get_current_key
+get_score_job = jobs.get_score_job
 get_vote_count = voting.get_vote_count
 register_connection = registration.register_connection
 register_service = registration.register_service
 register_user = registration.register_user
+submit_score_job = jobs.submit_score_job
 verify_credentials_route = users.verify_credentials_route
 version = misc.version
 vote = voting.vote
+votes = voting.votes
@@ -0,0 +1,249 @@
+from ekn.auth import authenticate
+from ekn.categories import get_flavor
+from ekn.database import DatabaseManager
+from ekn.decs import allow_cors
+from ekn.helpers import get_params, verify_service
+from ekn.jobs import (
+    BATCH_LIMIT,
+    QUEUE_RETRY_AFTER,
+    SERVICE_JOB_LIMIT,
+    TOP_K_LIMIT,
+    count_active_jobs,
+    create_job,
+    delete_job,
+    start_job,
+    wait_for_job,
+)
+from ekn.queries import run
+from flask import Response
+import json
+import math
+
+
+@allow_cors(hosts=["*"])
+def submit_score_job() -> Response:
+    """Starts calculating trust scores in the background
+    Takes the same data as `/get_score`, and returns a job id to poll `/get_score_job` with.
+    `for` can be a username, a list of up to 100 usernames, or left out to find the `k` highest
+    scored users in `from`'s network.  Each service can have up to 8 unfinished jobs at once.  `password_type` is optional and defaults to `"raw_password"`.  `flavor` is
+    optional and defaults to `"general"`.
+    ---
+    consumes:
+    - application/json
+    parameters:
+    - in: body
+      name: service
+      description: Scores to calculate
+      schema:
+        type: object
+        required:
+          - service_name
+          - service_key
+          - from
+          - password
+        properties:
+          service_name:
+            type: string
+            description: Service's name
+          service_key:
+            type: string
+            description: Service's key
+          for:
+            type: string
+            description: Username on Service, or a list of them
+          from:
+            type: string
+            description: Username on Service
+          password:
+            type: string
+            description: Password on EKN
+          password_type:
+            type: string
+            description: The type of password
+            enum: [raw_password, password_hash, connection_key, session_key]
+            default: raw_password
+          flavor:
+            type: string
+            default: general
+          k:
+            type: integer
+            description: How many of the highest scored users to find, if `for` is left out
+    responses:
+      202:
+        content:
+          application/json:
+            schema:
+              type: object
+              properties:
+                job:
+                  type: string
+                  example: 2ab96390c7dbe3439de74d0c9b0b1767
+                status:
+                  type: string
+                  example: queued
+      400:
+        description: User cannot view themselves / No users provided / Too many users / Invalid 'for' / Invalid k
+      403:
+        description: Username or Password is incorrect / Service name or key is incorrect
+      404:
+        description: _for_ is not connected to this service / Flavor does not exist
+      429:
+        description: The service has too many unfinished jobs
+      503:
+        description: Too many jobs are queued, see the Retry-After header
+    """
+    service, key, _for, _from, password, password_type, flavor, k = get_params(
+        [
+            "service_name",
+            "service_key",
+            "for",
+            "from",
+            "password",
+            "password_type",
+            "flavor",
+            "k",
+        ]
+    )
+    if _for is not None and not isinstance(_for, (str, list)):
+        return Response("Invalid 'for'.", 400)
+    if isinstance(_for, list):
+        if not _for:
+            return Response("No users provided.", 400)
+        if len(_for) > BATCH_LIMIT:
+            return Response("Too many users.", 400)
+        if not all(isinstance(name, str) for name in _for):
+            return Response("Invalid 'for'.", 400)
+    if _for == _from:
+        return Response("User cannot view themselves.", 400)
+    if _for is None:
+        try:
+            k = int(k)
+        except (TypeError, ValueError):
+            return Response("Invalid k.", 400)
+        if not 0 < k <= TOP_K_LIMIT:
+            return Response("Invalid k.", 400)
+
+    if not flavor:
+        flavor = "general"
+    elif not get_flavor(flavor):
+        return Response("Flavor does not exist.", 404)
+
+    with DatabaseManager(read_only=True) as db:
+        auth = authenticate(db, service, key, _from, password, password_type)
+        if isinstance(auth, Response):
+            return auth
+        service_id = auth.service["id"]
+        if _for is None:
+            request = {
+                "kind": "top",
+                "service": service,
+                "from": _from,
+                "flavor": flavor,
+                "k": k,
+            }
+        else:
+            fors = _for if isinstance(_for, list) else [_for]
+            result = run(
+                db,
+                "user_ids_by_service_users",
+                {"service_id": service_id, "service_users": json.dumps(fors)},
+            )
+            targets = {row["service_user"]: row["id"] for row in result.fetchall()}
+            if isinstance(_for, str) and _for not in targets:
+                return Response("'for' is not connected to this service.", 404)
+            request = {
+                "kind": "batch" if isinstance(_for, list) else "single",
+                "service": service,
+                "from": _from,
+                "flavor": flavor,
+                "targets": [[name, targets.get(name)] for name in fors],
+            }
+
+    with DatabaseManager() as db:
+        if count_active_jobs(db, service_id) >= SERVICE_JOB_LIMIT:
+            return Response("Too many unfinished score jobs.", 429)
+        job_id = create_job(db, service_id, auth.user["id"], request)
+    if not start_job(job_id, service_id, auth.user["id"], request):
+        with DatabaseManager() as db:
+            delete_job(db, job_id)
+        response = Response("Too many score jobs are queued, try again later.", 503)
+        response.headers["Retry-After"] = str(QUEUE_RETRY_AFTER)
+        return response
+    return Response(json.dumps({"job": job_id, "status": "queued"}), 202)
+
+
+@allow_cors(hosts=["*"])
+def get_score_job() -> Response:
+    """Gets the status and result of a score job
+    `wait` is optional, and is how many seconds (up to 30) to wait for the job to finish before
+    answering.
+    ---
+    consumes:
+    - application/json
+    parameters:
+    - in: body
+      name: service
+      description: The job to get
+      schema:
+        type: object
+        required:
+          - service_name
+          - service_key
+          - job
+        properties:
+          service_name:
+            type: string
+            description: Service's name
+          service_key:
+            type: string
+            description: Service's key
+          job:
+            type: string
+            description: The job id returned by `/submit_score_job`
+          wait:
+            type: number
+            description: How many seconds to wait for the job to finish
+            default: 0
+    responses:
+      200:
+        content:
+          application/json:
+            schema:
+              type: object
+              properties:
+                job:
+                  type: string
+                  example: 2ab96390c7dbe3439de74d0c9b0b1767
+                status:
+                  type: string
+                  enum: [queued, running, done, failed]
+                result:
+                  description: The scores, once the job is done
+                error:
+                  type: string
+                  description: Why the job failed
+      400:
+        description: Invalid wait
+      403:
+        description: Service name or key is incorrect
+      404:
+        description: Job does not exist
+    """
+    service, key, job_id, wait = get_params(
+        ["service_name", "service_key", "job", "wait"]
+    )
+    try:
+        wait = float(wait or 0)
+    except (TypeError, ValueError):
+        return Response("Invalid wait.", 400)
+    if not math.isfinite(wait):
+        return Response("Invalid wait.", 400)
+
+    service_obj = verify_service(service, key)
+    if not service_obj:
+        return Response("Service name or key is incorrect.", 403)
+
+    job = wait_for_job(job_id, service_obj["id"], wait)
+    if job is None:
+        return Response("Job does not exist.", 404)
+    return Response(json.dumps(job), 200)
@@ -1,7 +1,15 @@
 from database_migration.update import get_version
+from ekn.admission import score_admission
+from ekn.conditional import COUNTER_CACHE_CONTROL, conditional, make_etag
+from ekn.counters import get_counter
 from ekn.database import DatabaseManager
 from ekn.decs import allow_cors
+from ekn.helpers import identity_cache, network_sizes, service_cache
+from ekn.queries import get_executions
+from ekn.sessions import known_expiries
+from ekn.singleflight import score_flights
 from flask import Response
+import json
 
 
 def version() -> Response:
@@ -14,13 +22,13 @@ def version() -> Response:
     return Response(get_version(DatabaseManager()), 200)
 
 
-def count_rows(where):
-    with DatabaseManager() as db:
-        result = db.execute(f"SELECT COUNT(*) FROM {where};")
-        row = result.fetchone()
-        if row:
-            return Response(str(row["COUNT(*)"]), 200)
-        return Response("0", 200)
+def read_counter(name: str) -> Response:
+    with DatabaseManager(read_only=True) as db:
+        value = get_counter(db, name)
+    # The counter's value is its own version
+    return conditional(
+        make_etag(name, value), COUNTER_CACHE_CONTROL, lambda: Response(str(value), 200)
+    )
 
 
 @allow_cors(hosts=["*"])
@@ -31,8 +39,10 @@ def get_total_users() -> Response:
     responses:
         200:
             description: The total number of users
+        304:
+            description: The total hasn't changed since the If-None-Match ETag
     """
-    return count_rows('users')
+    return read_counter('total_users')
 
 
 @allow_cors(hosts=["*"])
@@ -43,8 +53,10 @@ def get_total_real_users() -> Response:
     responses:
         200:
             description: The total number of real users
+        304:
+            description: The total hasn't changed since the If-None-Match ETag
     """
-    return count_rows('users WHERE temp=0')
+    return read_counter('real_users')
 
 
 @allow_cors(hosts=["*"])
@@ -55,8 +67,10 @@ def get_total_temp_users() -> Response:
     responses:
         200:
             description: The total number of temporary users
+        304:
+            description: The total hasn't changed since the If-None-Match ETag
     """
-    return count_rows('users WHERE temp=1')
+    return read_counter('temp_users')
 
 
 @allow_cors(hosts=["*"])
@@ -67,5 +81,57 @@ def get_total_votes() -> Response:
     responses:
         200:
             description: The total number of votes
+        304:
+            description: The total hasn't changed since the If-None-Match ETag
     """
-    return count_rows('votes')
+    return read_counter('total_votes')
+
+
+@allow_cors(hosts=["*"])
+def get_score_stats() -> Response:
+    """Get how busy trust score calculation is
+    Returns how many scores are being calculated and waiting, how many have been
+    admitted and turned away since the server started, and how many shared
+    another request's calculation.
+    ---
+    responses:
+        200:
+            description: Score admission statistics
+    """
+    stats = score_admission.stats()
+    stats["coalesced"] = score_flights.stats()["shared"]
+    return Response(json.dumps(stats), 200)
+
+
+@allow_cors(hosts=["*"])
+def get_query_stats() -> Response:
+    """Get how often each database statement runs
+    Returns how many times each named statement has run in this server process
+    since it started, to find the hottest queries.
+    ---
+    responses:
+        200:
+            description: Executions by statement name
+    """
+    return Response(json.dumps(get_executions()), 200)
+
+
+@allow_cors(hosts=["*"])
+def get_cache_stats() -> Response:
+    """Get how well the in-process caches are doing
+    Returns the hits, misses, hit rate and size of each cache in this server
+    process since it started.
+    ---
+    responses:
+        200:
+            description: Statistics by cache
+    """
+    caches = {
+        "services": service_cache,
+        "identities": identity_cache,
+        "network_sizes": network_sizes,
+        "session_expiries": known_expiries,
+    }
+    return Response(
+        json.dumps({name: cache.stats() for name, cache in caches.items()}), 200
+    )
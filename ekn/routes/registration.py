@@ -1,14 +1,23 @@
 from ekn.database import DatabaseManager
 from ekn.decs import allow_cors
-from ekn.helpers import get_params, verify_service, verify_credentials
+from ekn.helpers import (
+    get_params,
+    hash_password,
+    merge_temp_users,
+    verify_service,
+    verify_credentials,
+)
+from ekn.queries import run
 from flask import Response
 from typing import Optional
-import hashlib
 import json
 import secrets
 import time
 
 
+# The most users /register_temp_users registers in one request.
+REGISTER_LIMIT = 1_000
+
 @allow_cors
 def register_user() -> Response:
     """Register a new user with the EKN
@@ -50,22 +59,16 @@ def register_user() -> Response:
         return Response("Invalid Username", 409)
 
     salt = secrets.token_hex(6)
-    sha512 = hashlib.new("sha512")
-    sha512.update(f"{password}:{salt}".encode("utf8"))
-    password_hash = sha512.hexdigest()
+    password_hash = hash_password(password, salt)
     with DatabaseManager() as db:
-        result = db.execute(
-            "SELECT * FROM users WHERE username=:username", {"username": username}
-        )
+        result = run(db, "user_id", {"username": username})
         if result.fetchone():
             return Response("Username is not available.", 409)  # 409: Conflict
         db.execute(
             "INSERT INTO users (username, password, salt) VALUES (?, ?, ?)",
             (username, password_hash, salt),
         )
-        result = db.execute(
-            "SELECT * FROM users WHERE username=:username", {"username": username}
-        )
+        result = run(db, "user_id", {"username": username})
         id = result.fetchone()["id"]
         db.execute(
             "INSERT INTO connections (service, service_user, user) VALUES (?, ?, ?)",
@@ -124,18 +127,14 @@ def register_temp_user() -> Response:
     service_id = service_obj["id"]
 
     with DatabaseManager() as db:
-        result = db.execute(
-            "SELECT * FROM users WHERE username=:username", {"username": username}
-        )
+        result = run(db, "user_id", {"username": username})
         if result.fetchone():
             return Response("Username is not available.", 409)
         db.execute(
             "INSERT INTO users (username, password, salt, temp) VALUES (?, ?, ?, ?)",
             (username, None, None, 1),
         )
-        result = db.execute(
-            "SELECT * FROM users WHERE username=:username", {"username": username}
-        )
+        result = run(db, "user_id", {"username": username})
         id = result.fetchone()["id"]
         db.execute(
             "INSERT INTO connections (service, service_user, user) VALUES (?, ?, ?)",
@@ -144,6 +143,113 @@ def register_temp_user() -> Response:
     return Response("Registration Successful.", 200)
 
 
+@allow_cors(hosts=["*"])
+def register_temp_users() -> Response:
+    """Register many temporary users with the EKN at once
+    Registers a temporary user for every username in `service_users`, exactly as
+    `/register_temp_user` would, in a single transaction.  Usernames which are
+    already registered are skipped rather than failing the whole request.
+    ---
+    consumes:
+    - application/json
+    parameters:
+    - in: body
+      name: users
+      description: The users to be registered.
+      schema:
+        type: object
+        required:
+          - service_users
+          - service_name
+          - service_key
+        properties:
+          service_users:
+            type: array
+            description: The case sensitive usernames on the service you're registering temp accounts for.
+            items:
+              type: string
+              example: mr_blobby
+          service_name:
+            type: string
+            description: The service's name
+            example: Discord
+          service_key:
+            type: string
+            description: The service's key in EKN
+            example: a4b4da38aa385015769b44de37651a51
+    responses:
+        200:
+          description: Registration Successful
+          content:
+            application/json:
+              schema:
+                type: object
+                properties:
+                  created:
+                    type: array
+                    items:
+                      type: string
+                      example: mr_blobby
+                  skipped:
+                    type: array
+                    items:
+                      type: string
+                      example: johnny
+        400:
+          description: No users provided / Too many users / Invalid user
+        403:
+          description: Service name or key is incorrect
+    """
+    service_users, service, key = get_params(
+        ["service_users", "service_name", "service_key"]
+    )
+    if isinstance(service_users, str):
+        try:
+            service_users = json.loads(service_users)
+        except json.JSONDecodeError:
+            service_users = None
+    if not service_users or not isinstance(service_users, list):
+        return Response("No users provided.", 400)
+    if len(service_users) > REGISTER_LIMIT:
+        return Response("Too many users.", 400)
+    if not all(user and isinstance(user, str) for user in service_users):
+        return Response("Invalid user.", 400)
+    # Keep the request's order, but only register each user once.
+    service_users = list(dict.fromkeys(service_users))
+
+    service_obj = verify_service(service, key)
+    if not service_obj:
+        return Response("Service name or key is incorrect.", 403)
+    service_id = service_obj["id"]
+
+    usernames = {user: f"{service}:{user}" for user in service_users}
+    created: list[str] = []
+    skipped: list[str] = []
+    with DatabaseManager() as db:
+        result = db.execute(
+            "SELECT username FROM users WHERE username IN (SELECT value FROM json_each(:usernames))",
+            {"usernames": json.dumps(list(usernames.values()))},
+        )
+        existing = {row["username"] for row in result.fetchall()}
+
+        connections = []
+        for service_user, username in usernames.items():
+            if username in existing:
+                skipped.append(service_user)
+                continue
+            result = db.execute(
+                "INSERT INTO users (username, password, salt, temp) VALUES (?, ?, ?, ?) RETURNING id",
+                (username, None, None, 1),
+            )
+            connections.append((service_id, service_user, result.fetchone()["id"]))
+            created.append(service_user)
+        db.executemany(
+            "INSERT INTO connections (service, service_user, user) VALUES (?, ?, ?)",
+            connections,
+        )
+    return Response(json.dumps({"created": created, "skipped": skipped}), 200)
+
+
 @allow_cors
 def register_service() -> Response:
     """Register a new service with the EKN.
@@ -182,14 +288,12 @@ def register_service() -> Response:
     name = get_params(["name"])
 
     with DatabaseManager() as db:
-        result = db.execute("SELECT * FROM services WHERE name=:name", {"name": name})
+        result = run(db, "service_id", {"name": name})
         if result.fetchone():
             return Response("Name is not available.", 409)
         key = secrets.token_hex(16)
         salt = secrets.token_hex(6)
-        sha512 = hashlib.new("sha512")
-        sha512.update(f"{key}:{salt}".encode("utf8"))
-        key_hash = sha512.hexdigest()
+        key_hash = hash_password(key, salt)
         db.execute(
             "INSERT INTO services (name, key, salt) VALUES (?, ?, ?)",
             (name, key_hash, salt),
@@ -295,8 +399,9 @@ def register_connection() -> Response:
         return Response("Username or Password is incorrect.", 403)
 
     with DatabaseManager() as db:
-        result = db.execute(
-            "SELECT * FROM connections WHERE service_user=:service_user AND service=:service_id",
+        result = run(
+            db,
+            "connection",
             {"service_user": service_user, "service_id": service_id},
         )
         row = result.fetchone()
@@ -308,9 +413,7 @@ def register_connection() -> Response:
         else:
             # Possibly a temp account!
             temp_user_id = int(row["user"])
-            result = db.execute(
-                "SELECT * FROM users WHERE id=:id", {"id": temp_user_id}
-            )
+            result = run(db, "user", {"id": temp_user_id})
             temp_user = result.fetchone()
             if not temp_user:
                 raise RuntimeError(
@@ -319,32 +422,15 @@ def register_connection() -> Response:
             if int(temp_user["temp"]) == 0:
                 return Response("Service user already connected to the EKN.", 409)
             # Temp account found! Migrating...
-            db.execute(
-                "UPDATE votes SET user_from=:new_id WHERE user_from=:temp_id",
-                {"new_id": user["id"], "temp_id": temp_user_id},
-            )
-            db.execute(
-                "UPDATE votes SET user_to=:new_id WHERE user_to=:temp_id",
-                {"new_id": user["id"], "temp_id": temp_user_id},
-            )
-            db.execute(
-                "DELETE FROM users WHERE id=:id and temp=1", {"id": temp_user_id}
-            )
-            db.execute(
-                "DELETE FROM connections WHERE user=:id and service=:service_id",
-                {"id": temp_user_id, "service_id": service_id},
-            )
-            db.execute(
-                "INSERT INTO connections (service, service_user, user) VALUES (?, ?, ?)",
-                (service_id, service_user, user["id"]),
-            )
+            merge_temp_users(db, {temp_user_id: user["id"]})
     session_key: Optional[str] = None
     connection_key: Optional[str] = None
     expires = 0
     if user["security"] == 0:
         with DatabaseManager() as db:
-            result = db.execute(
-                "SELECT * FROM connections WHERE user=:user_id AND service=:service_id",
+            result = run(
+                db,
+                "connection_key",
                 {"user_id": user["id"], "service_id": service_id},
             )
             row = result.fetchone()
@@ -365,10 +451,7 @@ def register_connection() -> Response:
                 )
     if user["security"] == 1:
         with DatabaseManager() as db:
-            result = db.execute(
-                "SELECT * FROM session_keys WHERE user=:user_id",
-                {"user_id": user["id"]},
-            )
+            result = run(db, "session_key", {"user_id": user["id"]})
             row = result.fetchone()
             gen_key = True
             if row:
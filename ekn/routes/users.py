@@ -1,15 +1,17 @@
 from ekn.database import DatabaseManager
 from ekn.decs import allow_cors
 from ekn.helpers import (
+    forget_users,
     get_params,
+    hash_password,
     verify_credentials,
     verify_service,
     resolve_service_username,
     update_session_key,
 )
+from ekn.queries import run
 from flask import Response
 from typing import Optional
-import hashlib
 import json
 import secrets
 import time
@@ -95,8 +97,9 @@ def verify_credentials_route() -> Response:
     expires = 0
     if user["security"] == 0 and service_id:
         with DatabaseManager() as db:
-            result = db.execute(
-                "SELECT * FROM connections WHERE user=:user_id AND service=:service_id",
+            result = run(
+                db,
+                "connection_key",
                 {"user_id": user["id"], "service_id": service_id},
             )
             row = result.fetchone()
@@ -117,10 +120,7 @@ def verify_credentials_route() -> Response:
                 )
     if user["security"] <= 1:
         with DatabaseManager() as db:
-            result = db.execute(
-                "SELECT * FROM session_keys WHERE user=:user_id",
-                {"user_id": user["id"]},
-            )
+            result = run(db, "session_key", {"user_id": user["id"]})
             row = result.fetchone()
             gen_key = True
             if row:
@@ -229,8 +229,9 @@ def get_current_key() -> Response:
     expires = 0
     if user["security"] == 0:
         with DatabaseManager() as db:
-            result = db.execute(
-                "SELECT * FROM connections WHERE user=:user_id AND service=:service_id",
+            result = run(
+                db,
+                "connection_key",
                 {"user_id": user["id"], "service_id": service_id},
             )
             row = result.fetchone()
@@ -249,10 +250,7 @@ def get_current_key() -> Response:
                 )
     if user["security"] == 1:
         with DatabaseManager() as db:
-            result = db.execute(
-                "SELECT * FROM session_keys WHERE user=:user_id",
-                {"user_id": user["id"]},
-            )
+            result = run(db, "session_key", {"user_id": user["id"]})
             row = result.fetchone()
             if row:
                 if row["expires"] > int(time.time()):
@@ -320,14 +318,13 @@ def change_password() -> Response:
         return Response("Username or Password is incorrect.", 403)
 
     salt = secrets.token_hex(6)
-    sha512 = hashlib.new("sha512")
-    sha512.update(f"{new_password}:{salt}".encode("utf8"))
-    password_hash = sha512.hexdigest()
+    password_hash = hash_password(new_password, salt)
     with DatabaseManager() as db:
         db.execute(
             "UPDATE users SET password=:password, salt=:salt WHERE id=:id",
             {"password": password_hash, "salt": salt, "id": user["id"]},
         )
+    forget_users([user["id"]])
 
     return Response("Success.", 200)
 
@@ -404,6 +401,13 @@ def gdpr_view() -> Response:
             row = dict(raw_row)
             rows.append(row)
 
+        result = db.execute(
+            "SELECT * FROM vote_events WHERE user_from=:id", {"id": user["id"]}
+        )
+        for raw_row in result.fetchall():
+            row = dict(raw_row)
+            rows.append(row)
+
     return Response(json.dumps(rows))
 
 
@@ -465,5 +469,6 @@ def change_security() -> Response:
             "UPDATE users SET security=:security WHERE id=:id",
             {"security": security, "id": user["id"]},
         )
+    forget_users([user["id"]])
     update_session_key(username)
     return Response("Success.", 200)
@@ -1,17 +1,43 @@
+from ekn.admission import ScoreRejected, admitted_score, busy_response
+from ekn.auth import authenticate
+from ekn.categories import get_flavor, get_registry
+from ekn.conditional import (
+    CATEGORIES_CACHE_CONTROL,
+    SCORE_CACHE_CONTROL,
+    conditional,
+    etag_matches,
+    get_data_versions,
+    make_etag,
+    not_modified,
+    with_etag,
+)
 from ekn.database import DatabaseManager
 from ekn.decs import allow_cors
+from ekn.events import (
+    append_vote_events,
+    compact_vote_events,
+    get_edge_count,
+    get_edge_counts,
+)
 from ekn.helpers import (
     get_params,
-    get_votes,
     resolve_service_username,
     verify_credentials,
     verify_service,
     update_session_key,
 )
-from flask import Response
+from ekn.queries import run
+from ekn.singleflight import coalesce_score
+from ekn.types import PASSWORD_TYPE
+from flask import Response, request
+from typing import Optional
 import json
+import sqlite3
 
 
+# The most votes /votes accepts in one request.
+VOTE_LIMIT = 100
+
 @allow_cors(hosts=["*"])
 def vote() -> Response:
     """Allows a service to vote on behalf of a user
@@ -95,52 +121,205 @@ def vote() -> Response:
 
     if not flavor:
         flavor = "general"
-    else:
-        with DatabaseManager() as db:
-            result = db.execute(
-                "SELECT * FROM categories WHERE category=:cat", {"cat": flavor}
-            )
-            if not result.fetchone():
-                return Response("Flavor does not exist.", 404)
+    elif not get_flavor(flavor):
+        return Response("Flavor does not exist.", 404)
+
+    with DatabaseManager() as db:
+        auth = authenticate(db, service, key, _from, password, password_type, to)
+        if isinstance(auth, Response):
+            return auth
+        if auth.target_id is None:
+            return Response("'to' is not connected to this service.", 404)
+
+        current = get_edge_count(db, auth.user["id"], auth.target_id, flavor)
+        if (current + amount) < 0:
+            return Response("Cannot have a negative amount of trust.", 400)
+        append_vote_events(db, [(auth.user["id"], auth.target_id, flavor, amount)])
+        # Folded in straight away, so scores and their tags see the vote at once.
+        compact_vote_events(db)
+
+    return Response("Success.", 200)
+
+
+@allow_cors(hosts=["*"])
+def votes() -> Response:
+    """Allows a service to cast many votes on behalf of its users at once
+    `votes` is a list of votes, each taking the same `to`, `from`, `password`, `password_type`, `flavor` and `amount` fields as `/vote`.  The service is verified once, each distinct voter is verified once, and all accepted votes are applied in a single transaction.  Every vote gets its own result, in the same order as the request.
+    ---
+    consumes:
+    - application/json
+    parameters:
+    - in: body
+      name: service
+      description: Votes
+      schema:
+        type: object
+        required:
+          - service_name
+          - service_key
+          - votes
+        properties:
+          service_name:
+            type: string
+            description: Service's name
+            example: Discord
+          service_key:
+            type: string
+            description: Service's key
+            example: a4b4da38aa385015769b44de37651a51
+          votes:
+            type: array
+            items:
+              type: object
+              required:
+                - to
+                - from
+                - password
+              properties:
+                to:
+                  type: string
+                  description: Username on Service
+                  example: mr_blobby
+                from:
+                  type: string
+                  description: Username on Service
+                  example: johnny
+                password:
+                  type: string
+                  description: Password on EKN
+                  example: hunter2
+                password_type:
+                  type: string
+                  description: The type of password
+                  enum: [raw_password, password_hash, connection_key, session_key]
+                  default: raw_password
+                flavor:
+                  type: string
+                  default: general
+                amount:
+                  type: number
+                  default: 1
+    responses:
+      200:
+        content:
+          application/json:
+            schema:
+              type: array
+              items:
+                type: object
+                properties:
+                  to:
+                    type: string
+                    example: mr_blobby
+                  from:
+                    type: string
+                    example: johnny
+                  flavor:
+                    type: string
+                    example: general
+                  status:
+                    type: integer
+                    description: The status `/vote` would have returned for this vote
+                    example: 200
+                  message:
+                    type: string
+                    example: Success.
+      400:
+        description: No votes provided / Too many votes
+      403:
+        description: Service name or key is incorrect
+    """
+    service, key, entries = get_params(["service_name", "service_key", "votes"])
+    if isinstance(entries, str):
+        try:
+            entries = json.loads(entries)
+        except json.JSONDecodeError:
+            entries = None
+    if not entries or not isinstance(entries, list):
+        return Response("No votes provided.", 400)
+    if len(entries) > VOTE_LIMIT:
+        return Response("Too many votes.", 400)
 
     service_obj = verify_service(service, key)
     if not service_obj:
         return Response("Service name or key is incorrect.", 403)
-    from_user = verify_credentials(_from, password, password_type, service_obj["id"])
-    if not from_user:
-        return Response("Username or Password is incorrect.", 403)
-    update_session_key(from_user["username"])
-    to_user = resolve_service_username(service_obj["id"], to)
-    if not to_user:
-        return Response("'to' is not connected to this service.", 404)
 
-    with DatabaseManager() as db:
-        result = db.execute(
-            "SELECT * FROM votes WHERE user_from=:from AND user_to=:to AND category=:cat",
-            {"from": from_user["id"], "to": to_user["id"], "cat": flavor},
-        )
-        current = result.fetchone()
-        if current:
-            if (current["count"] + amount) < 0:
-                return Response("Cannot have a negative amount of trust.", 400)
-            db.execute(
-                "UPDATE votes SET count=:count WHERE user_from=:from AND user_to=:to AND category=:cat",
-                {
-                    "from": from_user["id"],
-                    "to": to_user["id"],
-                    "count": current["count"] + amount,
-                    "cat": flavor,
-                },
-            )
-        else:
-            if amount < 0:
-                return Response("Cannot have a negative amount of trust.", 400)
-            db.execute(
-                "INSERT INTO votes (user_from, user_to, count, category) VALUES (?, ?, ?, ?)",
-                (from_user["id"], to_user["id"], amount, flavor),
+    flavors = set(get_registry().names())
+
+    results: list[dict] = []
+    # Credentials and usernames are only checked once per distinct value.
+    voters: dict[tuple, Optional[sqlite3.Row]] = {}
+    targets: dict[str, Optional[sqlite3.Row]] = {}
+    pending: list[tuple[int, int, int, str, int]] = []
+    for entry in entries:
+        if not isinstance(entry, dict):
+            results.append({"status": 400, "message": "Invalid vote."})
+            continue
+        to = entry.get("to") or entry.get("for")
+        _from = entry.get("from")
+        flavor = entry.get("flavor") or "general"
+        res = {"to": to, "from": _from, "flavor": flavor}
+        results.append(res)
+        fields = (to, _from, flavor, entry.get("password"), entry.get("password_type"))
+        if not all(field is None or isinstance(field, str) for field in fields):
+            res.update(status=400, message="Invalid vote.")
+            continue
+        try:
+            amount = int(entry["amount"]) if entry.get("amount") else 1
+        except (TypeError, ValueError):
+            res.update(status=400, message="Invalid amount.")
+            continue
+
+        if _from == to:
+            res.update(status=400, message="User cannot vote for themselves.")
+            continue
+        if flavor not in flavors:
+            res.update(status=404, message="Flavor does not exist.")
+            continue
+
+        credentials = (_from, entry.get("password"), entry.get("password_type"))
+        if credentials not in voters:
+            from_user = verify_credentials(
+                _from, credentials[1], credentials[2], service_obj["id"]
             )
+            if from_user:
+                update_session_key(from_user["username"])
+            voters[credentials] = from_user
+        from_user = voters[credentials]
+        if not from_user:
+            res.update(status=403, message="Username or Password is incorrect.")
+            continue
 
-    return Response("Success.", 200)
+        if to not in targets:
+            targets[to] = resolve_service_username(service_obj["id"], to)
+        to_user = targets[to]
+        if not to_user:
+            res.update(status=404, message="'to' is not connected to this service.")
+            continue
+
+        pending.append(
+            (len(results) - 1, from_user["id"], to_user["id"], flavor, amount)
+        )
+
+    with DatabaseManager() as db:
+        counts: dict[tuple[int, int, str], int] = {}
+        events: list[tuple[int, int, str, int]] = []
+        for index, from_id, to_id, flavor, amount in pending:
+            edge = (from_id, to_id, flavor)
+            if edge not in counts:
+                counts[edge] = get_edge_count(db, *edge)
+            if counts[edge] + amount < 0:
+                results[index].update(
+                    status=400, message="Cannot have a negative amount of trust."
+                )
+                continue
+            counts[edge] += amount
+            events.append(edge + (amount,))
+            results[index].update(status=200, message="Success.")
+        append_vote_events(db, events)
+        compact_vote_events(db)
+
+    return Response(json.dumps(results), 200)
 
 
 @allow_cors(hosts=["*"])
@@ -151,6 +330,9 @@ def get_vote_count() -> Response:
 
     If `flavor` is not specified, it will return the total number of times a user (B) has voted for a
     user (A) in *all* categories.
+
+    `for` may also be a list of usernames, and `flavor` a list of flavors, to get many counts in one
+    request.  One result is then returned per user and flavor, in request order.
     ---
     consumes:
     - application/json
@@ -197,25 +379,51 @@ def get_vote_count() -> Response:
             default: general
     responses:
       200:
+        description: One count, or a list of counts if `for` or `flavor` was a list
         content:
           application/json:
             schema:
-              type: object
-              properties:
-                for:
-                  type: string
-                  example: mr_blobby
-                to:
-                  type: string
-                  example: mr_blobby_incognito
-                votes:
-                  type: integer
-                  example: 42
-                flavor:
-                  type: string
-                  example: general
+              oneOf:
+                - type: object
+                  properties:
+                    for:
+                      type: string
+                      example: mr_blobby
+                    to:
+                      type: string
+                      example: mr_blobby_incognito
+                    votes:
+                      type: integer
+                      example: 42
+                    flavor:
+                      type: string
+                      example: general
+                - type: array
+                  items:
+                    type: object
+                    properties:
+                      for:
+                        type: string
+                        example: mr_blobby
+                      from:
+                        type: string
+                        example: johnny
+                      flavor:
+                        type: string
+                        example: general
+                      votes:
+                        type: integer
+                        description: Only given when `status` is 200
+                        example: 42
+                      status:
+                        type: integer
+                        description: The status a single `/get_vote_count` would have returned
+                        example: 200
+                      message:
+                        type: string
+                        description: Why the count failed, when `status` isn't 200
       400:
-        description: User cannot vote for themselves
+        description: User cannot vote for themselves / Invalid 'for' / Invalid flavor
       403:
         description: Username or Password is incorrect / Service name or key is incorrect
       404:
@@ -233,47 +441,99 @@ def get_vote_count() -> Response:
         ]
     )
 
+    if isinstance(_for, list) or isinstance(flavor, list):
+        return get_vote_counts(
+            service,
+            key,
+            _for if isinstance(_for, list) else [_for],
+            _from,
+            password,
+            password_type,
+            flavor if isinstance(flavor, list) else [flavor],
+        )
+
     if _from == _for:
         return Response("User cannot view themselves.", 400)
 
-    flavor_str = ""
-    if flavor:
-        flavor_str = "AND category=:cat"
+    # Without a flavor, votes in every category are counted.
+    category = flavor
     if not flavor:
         flavor = "general"
-    else:
-        with DatabaseManager() as db:
-            result = db.execute(
-                "SELECT * FROM categories WHERE category=:cat", {"cat": flavor}
-            )
-            if not result.fetchone():
-                return Response("Flavor does not exist.", 404)
-
-    service_obj = verify_service(service, key)
-    if not service_obj:
-        return Response("Service name or key is incorrect.", 403)
-    from_user = verify_credentials(_from, password, password_type, service_obj["id"])
-    if not from_user:
-        return Response("Username or Password is incorrect.", 403)
-    update_session_key(from_user["username"])
-    for_user = resolve_service_username(service_obj["id"], _for)
-    if not for_user:
-        return Response("'for' is not connected to this service.", 404)
+    elif not get_flavor(flavor):
+        return Response("Flavor does not exist.", 404)
 
     response = {"for": _for, "from": _from, "votes": 0, "flavor": flavor}
-    with DatabaseManager() as db:
-        result = db.execute(
-            f'SELECT sum("count") AS "count" FROM votes WHERE user_from=:from AND user_to=:to {flavor_str}',
-            {"from": from_user["id"], "to": for_user["id"], "cat": flavor},
+    with DatabaseManager(read_only=True) as db:
+        auth = authenticate(db, service, key, _from, password, password_type, _for)
+        if isinstance(auth, Response):
+            return auth
+        if auth.target_id is None:
+            return Response("'for' is not connected to this service.", 404)
+        response["votes"] = get_edge_count(
+            db, auth.user["id"], auth.target_id, category
         )
-        current = result.fetchone()
-        if current:
-            if current["count"]:
-                response["votes"] = current["count"]
 
     return Response(json.dumps(response), 200)
 
 
+def get_vote_counts(
+    service: str,
+    key: str,
+    fors: list[str],
+    _from: str,
+    password: str,
+    password_type: PASSWORD_TYPE,
+    flavors: list[Optional[str]],
+) -> Response:
+    """
+    `/get_vote_count` for many `for` users and flavors, with one lookup for all
+    of the users and one grouped query for all of the counts.
+    """
+    if not fors:
+        return Response("No users provided.", 400)
+    if not all(isinstance(_for, str) for _for in fors):
+        return Response("Invalid 'for'.", 400)
+    flavors = flavors or [None]
+    if not all(flavor is None or isinstance(flavor, str) for flavor in flavors):
+        return Response("Invalid flavor.", 400)
+    for flavor in flavors:
+        if flavor and not get_flavor(flavor):
+            return Response("Flavor does not exist.", 404)
+
+    with DatabaseManager(read_only=True) as db:
+        auth = authenticate(db, service, key, _from, password, password_type)
+        if isinstance(auth, Response):
+            return auth
+        result = run(
+            db,
+            "user_ids_by_service_users",
+            {"service_id": auth.service["id"], "service_users": json.dumps(fors)},
+        )
+        targets = {row["service_user"]: row["id"] for row in result.fetchall()}
+        counts = get_edge_counts(db, auth.user["id"], targets.values())
+
+    results: list[dict] = []
+    for _for in fors:
+        for flavor in flavors:
+            res = {"for": _for, "from": _from, "flavor": flavor or "general"}
+            results.append(res)
+            if _for == _from:
+                res.update(status=400, message="User cannot view themselves.")
+            elif _for not in targets:
+                res.update(
+                    status=404, message="'for' is not connected to this service."
+                )
+            else:
+                # Without a flavor, votes in every category are counted.
+                by_category = counts.get(targets[_for], {})
+                if flavor:
+                    res.update(votes=by_category.get(flavor, 0), status=200)
+                else:
+                    res.update(votes=sum(by_category.values()), status=200)
+
+    return Response(json.dumps(results), 200)
+
+
 @allow_cors(hosts=["*"])
 def get_score() -> Response:
     """Allows a service to get the trust score for a user on behalf of, and from the perspective of another user.
@@ -341,12 +601,16 @@ def get_score() -> Response:
                 flavor:
                   type: string
                   example: general
+      304:
+        description: The score hasn't changed since the If-None-Match ETag
       400:
         description: User cannot view themselves
       403:
         description: Username or Password is incorrect / Service name or key is incorrect
       404:
         description: _for_ is not connected to this service / Flavor does not exist
+      503:
+        description: Too many scores are being calculated, see the Retry-After header
     """
     service, key, _for, _from, password, password_type, flavor = get_params(
         [
@@ -359,33 +623,63 @@ def get_score() -> Response:
             "flavor",
         ]
     )
+    checked = authorize_score(
+        service, key, _for, _from, password, password_type, flavor
+    )
+    if isinstance(checked, Response):
+        return checked
+    for_id, from_id, flavor = checked
+
+    # Read before scoring, so a vote made while scoring changes the next tag
+    versions = get_data_versions()
+    etag = make_etag("score", *versions, for_id, from_id, _for, _from, flavor)
+    if etag_matches(request.headers.get("If-None-Match"), etag, request.method):
+        return not_modified(etag, SCORE_CACHE_CONTROL)
+    try:
+        # Identical scores being calculated at the same time share one
+        # calculation, as long as they are of the same data as their tag.
+        score = coalesce_score(
+            (service, for_id, from_id, flavor, *versions),
+            admitted_score,
+            service,
+            for_id,
+            from_id,
+            flavor,
+        )
+    except ScoreRejected:
+        return busy_response()
+    response = {"for": _for, "from": _from, "score": score, "flavor": flavor}
+    return with_etag(Response(json.dumps(response), 200), etag, SCORE_CACHE_CONTROL)
+
+
+def authorize_score(
+    service: str,
+    key: str,
+    _for: str,
+    _from: str,
+    password: str,
+    password_type: PASSWORD_TYPE,
+    flavor: Optional[str],
+) -> Response | tuple[int, int, str]:
+    """
+    Checks a /get_score request.  Returns the ids of the users to score for and
+    from, and the flavor to score, or the response to send if it is refused.
+    """
     if _for == _from:
         return Response("User cannot view themselves.", 400)
 
     if not flavor:
         flavor = "general"
-    else:
-        with DatabaseManager() as db:
-            result = db.execute(
-                "SELECT * FROM categories WHERE category=:cat", {"cat": flavor}
-            )
-            if not result.fetchone():
-                return Response("Flavor does not exist.", 404)
+    elif not get_flavor(flavor):
+        return Response("Flavor does not exist.", 404)
 
-    service_obj = verify_service(service, key)
-    if not service_obj:
-        return Response("Service name or key is incorrect.", 403)
-    from_user = verify_credentials(_from, password, password_type, service_obj["id"])
-    if not from_user:
-        return Response("Username or Password is incorrect.", 403)
-    update_session_key(from_user["username"])
-    for_user = resolve_service_username(service_obj["id"], _for)
-    if not for_user:
+    with DatabaseManager(read_only=True) as db:
+        auth = authenticate(db, service, key, _from, password, password_type, _for)
+    if isinstance(auth, Response):
+        return auth
+    if auth.target_id is None:
         return Response("'for' is not connected to this service.", 404)
-
-    score = get_votes(for_user["id"], from_user["id"], flavor)
-    response = {"for": _for, "from": _from, "score": score, "flavor": flavor}
-    return Response(json.dumps(response), 200)
+    return auth.target_id, auth.user["id"], flavor
 
 
 @allow_cors(hosts=["*"])
@@ -401,10 +695,12 @@ def categories() -> Response:
                 items:
                   type: string
                   example: category1
+        304:
+          description: The categories haven't changed since the If-None-Match ETag
     """
-    cats = []
-    with DatabaseManager() as db:
-        result = db.execute("SELECT * FROM categories")
-        for row in result.fetchall():
-            cats.append(row["category"])
-    return Response(json.dumps(cats), 200)
+    names, categories_version = get_registry().names_version()
+    return conditional(
+        make_etag("categories", categories_version),
+        CATEGORIES_CACHE_CONTROL,
+        lambda: Response(json.dumps(names), 200),
+    )
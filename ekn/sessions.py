@@ -0,0 +1,119 @@
+from ekn.background import start_periodic_task
+from ekn.cache import TTLCache
+from ekn.database import DatabaseManager
+from ekn.types import STORAGE_ROW
+from typing import Optional
+import secrets
+import sys
+import threading
+import time
+
+
+SWEEP_INTERVAL = 3_600  # Seconds
+SWEEP_BATCH_SIZE = 1_000
+FLUSH_INTERVAL = 1  # Seconds
+SESSION_LENGTH = 86_400  # Seconds
+
+# When each user's session key expires, by username, for keys known to be valid.
+known_expiries = TTLCache(100_000, SESSION_LENGTH)
+# New session keys waiting to be written, by user id
+pending_keys: dict[int, tuple[str, int]] = {}
+pending_keys_lock = threading.Lock()
+
+
+def session_key_valid(username: str) -> bool:
+    """
+    Whether a user's session key is known to be valid without reading the table.
+    """
+    expires = known_expiries.get(username)
+    return expires is not None and expires > int(time.time())
+
+
+def refresh_session_key(user: STORAGE_ROW, expires: Optional[int]) -> None:
+    """
+    Queues a new session key for a user if their current one, which expires at
+    `expires`, has run out.  New keys last SESSION_LENGTH seconds from when they
+    are queued, and are written by flush_session_keys.
+    """
+    if user["security"] == 2:
+        return
+    now = int(time.time())
+    if expires is None or expires <= now:
+        expires = now + SESSION_LENGTH
+        with pending_keys_lock:
+            pending_keys[user["id"]] = (secrets.token_hex(16), expires)
+    known_expiries.set(user["username"], expires)
+
+
+def flush_session_keys(db: DatabaseManager) -> int:
+    """
+    Writes every queued session key in one batch.  Keys which were replaced by a
+    valid one after being queued are skipped.  Keys stay queued until the batch
+    is committed, so a failed write is retried on the next flush.  Returns how
+    many were queued.
+    """
+    with pending_keys_lock:
+        queued = dict(pending_keys)
+    if not queued:
+        return 0
+    db.executemany(
+        "INSERT INTO session_keys (user, key, expires) VALUES (:id, :key, :expires) "
+        + "ON CONFLICT(user) DO UPDATE SET key=excluded.key, expires=excluded.expires "
+        + f"WHERE session_keys.expires <= excluded.expires - {SESSION_LENGTH}",
+        [
+            {"id": user_id, "key": key, "expires": expires}
+            for user_id, (key, expires) in queued.items()
+        ],
+    )
+    db.commit()
+    with pending_keys_lock:
+        # Keys queued again while the batch was written are left for next time.
+        for user_id, key in queued.items():
+            if pending_keys.get(user_id) == key:
+                del pending_keys[user_id]
+    return len(queued)
+
+
+def sweep_session_keys(db: DatabaseManager, batch_size: int = SWEEP_BATCH_SIZE) -> int:
+    """
+    Deletes expired session keys, committing after every `batch_size` rows so the
+    write lock is never held for long.  Returns the number of keys deleted.
+    """
+    now = int(time.time())
+    deleted = 0
+    while True:
+        result = db.execute(
+            "DELETE FROM session_keys WHERE rowid IN "
+            + "(SELECT rowid FROM session_keys WHERE expires < :now LIMIT :batch_size)",
+            {"now": now, "batch_size": batch_size},
+        )
+        db.commit()
+        deleted += result.rowcount
+        if result.rowcount < batch_size:
+            return deleted
+
+
+def start_sweeper(
+    interval: float = SWEEP_INTERVAL, path: str = "database.db"
+) -> threading.Thread:
+    """
+    Starts a daemon thread which deletes expired session keys every `interval`
+    seconds.
+    """
+    return start_periodic_task("session-sweeper", interval, sweep_session_keys, path)
+
+
+def start_session_flusher(
+    interval: float = FLUSH_INTERVAL, path: str = "database.db"
+) -> threading.Thread:
+    """
+    Starts a daemon thread which writes queued session keys every `interval`
+    seconds.
+    """
+    return start_periodic_task("session-flusher", interval, flush_session_keys, path)
+
+
+if __name__ == "__main__":
+    # Usage: python -m ekn.sessions [database path]
+    with DatabaseManager(*sys.argv[1:2]) as db:
+        print(f"Deleted {sweep_session_keys(db)} expired session keys")
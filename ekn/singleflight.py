@@ -0,0 +1,265 @@
+from collections.abc import Awaitable, Callable, Hashable
+from concurrent.futures import Future
+from ekn.background import start_periodic_task
+from ekn.database import DatabaseManager
+from typing import Any, Optional, TypeVar
+import asyncio
+import json
+import os
+import secrets
+import threading
+import time
+
+
+T = TypeVar("T")
+
+# Which identical scores share one calculation: "off", "process" for scores
+# asked for at the same time in one process, or "workers" to also share them
+# between processes through the score_flights table.
+COALESCING = os.environ.get("EKN_SCORE_COALESCING", "process")
+# How long another worker's calculation is waited for before taking it over, in
+# case that worker died.  Seconds.
+LOCK_TTL = 60
+# How long a finished calculation's result is kept for workers still waiting.
+RESULT_TTL = 2  # Seconds
+POLL_INTERVAL = 0.05  # Seconds
+SWEEP_INTERVAL = 3_600  # Seconds
+
+
+class SingleFlight:
+    """
+    Runs one call at a time for each key.  Calls made with a key while a call
+    with it is running wait for, and share, its result or exception.
+    """
+
+    def __init__(self) -> None:
+        self.lock = threading.Lock()
+        self.flights: dict[Hashable, Future] = {}
+        self.led = 0
+        self.shared = 0
+
+    def _join(self, key: Hashable) -> tuple[Future, bool]:
+        with self.lock:
+            future = self.flights.get(key)
+            if future is not None:
+                self.shared += 1
+                return future, False
+            future = self.flights[key] = Future()
+            self.led += 1
+            return future, True
+
+    def _land(self, key: Hashable) -> None:
+        with self.lock:
+            del self.flights[key]
+
+    def do(self, key: Hashable, function: Callable[..., T], *args: Any) -> T:
+        future, leader = self._join(key)
+        if not leader:
+            return future.result()
+        try:
+            result = function(*args)
+        except BaseException as e:
+            future.set_exception(e)
+            raise
+        else:
+            future.set_result(result)
+            return result
+        finally:
+            self._land(key)
+
+    def _settle(self, key: Hashable, future: Future, task: asyncio.Future) -> None:
+        try:
+            future.set_result(task.result())
+        except BaseException as e:
+            future.set_exception(e)
+        finally:
+            self._land(key)
+
+    async def do_async(
+        self, key: Hashable, function: Callable[..., Awaitable[T]], *args: Any
+    ) -> T:
+        """
+        Like do, for coroutine functions, waiting without holding a thread.  The
+        call runs as its own task, so cancelling any of the callers waiting on
+        it, including the one which started it, doesn't cancel it for the rest.
+        """
+        future, leader = self._join(key)
+        if leader:
+            task = asyncio.ensure_future(function(*args))
+            task.add_done_callback(lambda task: self._settle(key, future, task))
+        return await asyncio.shield(asyncio.wrap_future(future))
+
+    def stats(self) -> dict[str, int]:
+        with self.lock:
+            return {"led": self.led, "shared": self.shared}
+
+
+def claim_flight(key: str, owner: str) -> bool:
+    """
+    Takes the cross-worker lock for a key, unless another worker holds it or has
+    just published a result for it.
+    """
+    now = time.time()
+    with DatabaseManager() as db:
+        result = db.execute(
+            "INSERT INTO score_flights (key, owner, result, expires) "
+            + "VALUES (:key, :owner, NULL, :expires) "
+            + "ON CONFLICT(key) DO UPDATE SET owner=excluded.owner, result=NULL, "
+            + "expires=excluded.expires WHERE score_flights.expires<=:now RETURNING owner",
+            {"key": key, "owner": owner, "expires": now + LOCK_TTL, "now": now},
+        )
+        return bool(result.fetchall())
+
+
+def publish_flight(key: str, owner: str, result: Any) -> None:
+    """
+    Stores a result for workers waiting on the key, and releases its lock.
+    """
+    with DatabaseManager() as db:
+        db.execute(
+            "UPDATE score_flights SET result=:result, expires=:expires "
+            + "WHERE key=:key AND owner=:owner",
+            {
+                "key": key,
+                "owner": owner,
+                "result": json.dumps(result),
+                "expires": time.time() + RESULT_TTL,
+            },
+        )
+
+
+def abandon_flight(key: str, owner: str) -> None:
+    with DatabaseManager() as db:
+        db.execute(
+            "DELETE FROM score_flights WHERE key=:key AND owner=:owner",
+            {"key": key, "owner": owner},
+        )
+
+
+def peek_flight(key: str) -> tuple[str, Optional[Any]]:
+    """
+    Gets whether another worker's calculation for the key is "running", "done"
+    (with its result) or "missing", i.e. finished without a result or given up.
+    """
+    with DatabaseManager(read_only=True) as db:
+        row = db.execute(
+            "SELECT result, expires FROM score_flights WHERE key=:key", {"key": key}
+        ).fetchone()
+    if row is None or row["expires"] <= time.time():
+        return "missing", None
+    if row["result"] is None:
+        return "running", None
+    return "done", json.loads(row["result"])
+
+
+def across_workers(key: str, function: Callable[..., T], *args: Any) -> T:
+    """
+    Runs `function(*args)` unless another worker is already running it for the
+    same key, in which case its result is waited for instead.
+    """
+    while True:
+        owner = secrets.token_hex(8)
+        if claim_flight(key, owner):
+            try:
+                result = function(*args)
+            except BaseException:
+                abandon_flight(key, owner)
+                raise
+            publish_flight(key, owner, result)
+            return result
+        while True:
+            state, result = peek_flight(key)
+            if state == "done":
+                return result
+            if state == "missing":
+                break
+            time.sleep(POLL_INTERVAL)
+
+
+async def across_workers_async(
+    key: str, function: Callable[..., Awaitable[T]], *args: Any
+) -> T:
+    """
+    Like across_workers, for coroutine functions.  The database is used on the
+    IO thread pool.
+    """
+    from ekn.aio import run_sync
+
+    while True:
+        owner = secrets.token_hex(8)
+        if await run_sync(claim_flight, key, owner):
+            try:
+                result = await function(*args)
+            except BaseException:
+                await run_sync(abandon_flight, key, owner)
+                raise
+            await run_sync(publish_flight, key, owner, result)
+            return result
+        while True:
+            state, result = await run_sync(peek_flight, key)
+            if state == "done":
+                return result
+            if state == "missing":
+                break
+            await asyncio.sleep(POLL_INTERVAL)
+
+
+# Shared by everything that calculates scores
+score_flights = SingleFlight()
+
+
+def coalesce_score(
+    key: tuple[Any, ...], function: Callable[..., T], *args: Any
+) -> T:
+    """
+    Calculates a score, given as (service, for id, from id, flavor, graph
+    version, categories version), sharing the result with identical
+    calculations as configured by COALESCING.  Only the same service's
+    calculations are shared, as each is charged to, and can be turned away by,
+    its service's admission.  Only calculations of the same data versions are
+    shared, so a result is never tagged with newer versions than it was
+    calculated from.
+    """
+    if COALESCING == "off":
+        return function(*args)
+    if COALESCING == "workers":
+        return score_flights.do(key, across_workers, json.dumps(key), function, *args)
+    return score_flights.do(key, function, *args)
+
+
+async def coalesce_score_async(
+    key: tuple[Any, ...],
+    function: Callable[..., Awaitable[T]],
+    *args: Any,
+) -> T:
+    """
+    Like coalesce_score, for coroutine functions.
+    """
+    if COALESCING == "off":
+        return await function(*args)
+    if COALESCING == "workers":
+        return await score_flights.do_async(
+            key, across_workers_async, json.dumps(key), function, *args
+        )
+    return await score_flights.do_async(key, function, *args)
+
+
+def sweep_flights(db: DatabaseManager) -> int:
+    """
+    Deletes finished and abandoned calculations' rows.  Returns how many were
+    deleted.
+    """
+    result = db.execute(
+        "DELETE FROM score_flights WHERE expires<=:now", {"now": time.time()}
+    )
+    return result.rowcount
+
+
+def start_flight_sweeper(
+    interval: float = SWEEP_INTERVAL, path: str = "database.db"
+) -> threading.Thread:
+    """
+    Starts a daemon thread which deletes expired score_flights rows every
+    `interval` seconds.
+    """
+    return start_periodic_task("flight-sweeper", interval, sweep_flights, path)
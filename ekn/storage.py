@@ -0,0 +1,423 @@
+from abc import ABC, abstractmethod
+from collections.abc import Iterable
+from contextlib import nullcontext
+from ekn.categories import Flavor, compile_flavor, get_registry
+from ekn.database import DatabaseManager
+from ekn.events import append_vote_events, compact_vote_events
+from ekn.queries import bind_flavors, run
+from ekn.types import STORAGE_ROW
+from typing import Optional
+import itertools
+import json
+import threading
+
+
+class Storage(ABC):
+    """
+    Everything EKN stores, independent of where it is stored.
+
+    Rows support lookups by column name, like sqlite3.Row.  Using a storage as a
+    context manager keeps one connection open for every call made inside it.
+    """
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback) -> None:
+        pass
+
+    @abstractmethod
+    def get_user(self, user_id: int) -> Optional[STORAGE_ROW]:
+        ...
+
+    @abstractmethod
+    def get_user_by_username(self, username: str) -> Optional[STORAGE_ROW]:
+        ...
+
+    @abstractmethod
+    def add_user(
+        self,
+        username: str,
+        password: Optional[str],
+        salt: Optional[str],
+        temp: bool = False,
+    ) -> int:
+        ...
+
+    @abstractmethod
+    def get_service(self, name: str) -> Optional[STORAGE_ROW]:
+        ...
+
+    @abstractmethod
+    def add_service(self, name: str, key: str, salt: str) -> int:
+        ...
+
+    @abstractmethod
+    def get_connection(
+        self, service_id: int, service_user: str
+    ) -> Optional[STORAGE_ROW]:
+        ...
+
+    @abstractmethod
+    def add_connection(
+        self,
+        service_id: int,
+        service_user: str,
+        user_id: int,
+        key: Optional[str] = None,
+    ) -> None:
+        ...
+
+    @abstractmethod
+    def get_category(self, category: str) -> Optional[STORAGE_ROW]:
+        ...
+
+    @abstractmethod
+    def get_categories(self) -> list[STORAGE_ROW]:
+        ...
+
+    def get_flavor(self, name: str) -> Optional[Flavor]:
+        """
+        Gets a flavor with the categories it is scored over resolved.
+        """
+        row = self.get_category(name)
+        return compile_flavor(row) if row else None
+
+    @abstractmethod
+    def get_votes_from(
+        self, user_id: int, flavors: Optional[list[str]] = None
+    ) -> list[STORAGE_ROW]:
+        """
+        Gets every vote a user has cast in the given flavors, or in every flavor
+        if no flavors are given.
+        """
+
+    @abstractmethod
+    def get_vote_count(
+        self, user_from: int, user_to: int, category: Optional[str] = None
+    ) -> int:
+        """
+        Gets how many votes one user has given another in a category, or in
+        every category if no category is given.
+        """
+
+    def get_reachable(
+        self,
+        user_id: int,
+        flavors: Optional[list[str]],
+        checking: Optional[int],
+        limit: int,
+    ) -> set[int]:
+        """
+        Gets every user reachable from a user, nearest first.  Votes cast by
+        `checking` aren't followed.  Stops once at least `limit` users have been
+        found.
+        """
+        users = {user_id}
+        frontier = [user_id]
+        while frontier and len(users) < limit:
+            next_frontier = []
+            for u in frontier:
+                if u == checking:
+                    continue
+                for vote in self.get_votes_from(u, flavors):
+                    if vote["user_to"] not in users:
+                        users.add(vote["user_to"])
+                        next_frontier.append(vote["user_to"])
+            frontier = next_frontier
+        return users
+
+    @abstractmethod
+    def add_votes(self, votes: Iterable[tuple[int, int, str, int]]) -> None:
+        """
+        Adds (user_from, user_to, category, amount) votes to the counts.
+        """
+
+    @abstractmethod
+    def get_session_key(self, user_id: int) -> Optional[STORAGE_ROW]:
+        ...
+
+    @abstractmethod
+    def set_session_key(self, user_id: int, key: str, expires: int) -> None:
+        ...
+
+
+class SQLiteStorage(Storage):
+    """
+    Storage backed by the SQLite database.
+    """
+
+    def __init__(self, database: Optional[DatabaseManager] = None):
+        self.database = database if database is not None else DatabaseManager()
+        self.depth = 0
+
+    def __enter__(self):
+        if not self.depth:
+            self.database.open()
+        self.depth += 1
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback) -> None:
+        self.depth -= 1
+        if not self.depth:
+            self.database.close()
+
+    def _db(self):
+        # Reuse the connection if the storage is already open.
+        if self.database.connected:
+            return nullcontext(self.database)
+        return self.database
+
+    def get_user(self, user_id: int) -> Optional[STORAGE_ROW]:
+        with self._db() as db:
+            return run(db, "user_credentials", {"id": user_id}).fetchone()
+
+    def get_user_by_username(self, username: str) -> Optional[STORAGE_ROW]:
+        with self._db() as db:
+            result = run(db, "user_credentials_by_username", {"username": username})
+            return result.fetchone()
+
+    def add_user(
+        self,
+        username: str,
+        password: Optional[str],
+        salt: Optional[str],
+        temp: bool = False,
+    ) -> int:
+        with self._db() as db:
+            result = db.execute(
+                "INSERT INTO users (username, password, salt, temp) VALUES (?, ?, ?, ?) RETURNING id",
+                (username, password, salt, int(temp)),
+            )
+            return result.fetchone()["id"]
+
+    def get_service(self, name: str) -> Optional[STORAGE_ROW]:
+        with self._db() as db:
+            return run(db, "service", {"name": name}).fetchone()
+
+    def add_service(self, name: str, key: str, salt: str) -> int:
+        with self._db() as db:
+            result = db.execute(
+                "INSERT INTO services (name, key, salt) VALUES (?, ?, ?) RETURNING id",
+                (name, key, salt),
+            )
+            return result.fetchone()["id"]
+
+    def get_connection(
+        self, service_id: int, service_user: str
+    ) -> Optional[STORAGE_ROW]:
+        with self._db() as db:
+            result = run(
+                db,
+                "connection",
+                {"service_id": service_id, "service_user": service_user},
+            )
+            return result.fetchone()
+
+    def add_connection(
+        self,
+        service_id: int,
+        service_user: str,
+        user_id: int,
+        key: Optional[str] = None,
+    ) -> None:
+        with self._db() as db:
+            db.execute(
+                "INSERT INTO connections (service, service_user, user, key) VALUES (?, ?, ?, ?)",
+                (service_id, service_user, user_id, key),
+            )
+
+    def get_category(self, category: str) -> Optional[STORAGE_ROW]:
+        with self._db() as db:
+            return run(db, "category", {"cat": category}).fetchone()
+
+    def get_categories(self) -> list[STORAGE_ROW]:
+        with self._db() as db:
+            return run(db, "categories").fetchall()
+
+    def get_flavor(self, name: str) -> Optional[Flavor]:
+        return get_registry(self.database.path).get(name)
+
+    def get_votes_from(
+        self, user_id: int, flavors: Optional[list[str]] = None
+    ) -> list[STORAGE_ROW]:
+        with self._db() as db:
+            result = run(
+                db, "votes_from", {"user": user_id, "flavors": bind_flavors(flavors)}
+            )
+            return result.fetchall()
+
+    def get_vote_count(
+        self, user_from: int, user_to: int, category: Optional[str] = None
+    ) -> int:
+        with self._db() as db:
+            result = run(
+                db, "vote_count", {"from": user_from, "to": user_to, "cat": category}
+            )
+            return result.fetchone()[0]
+
+    def get_reachable(
+        self,
+        user_id: int,
+        flavors: Optional[list[str]],
+        checking: Optional[int],
+        limit: int,
+    ) -> set[int]:
+        # One recursive query instead of one query per user.
+        with self._db() as db:
+            result = run(
+                db,
+                "reachable",
+                {
+                    "user": user_id,
+                    "flavors": bind_flavors(flavors),
+                    "checking": checking,
+                    "limit": limit,
+                },
+            )
+            return {row["id"] for row in result.fetchall()}
+
+    def add_votes(self, votes: Iterable[tuple[int, int, str, int]]) -> None:
+        with self._db() as db:
+            # Logged like any other vote, but folded in straight away.
+            append_vote_events(db, votes)
+            compact_vote_events(db)
+
+    def get_session_key(self, user_id: int) -> Optional[STORAGE_ROW]:
+        with self._db() as db:
+            return run(db, "session_key", {"user_id": user_id}).fetchone()
+
+    def set_session_key(self, user_id: int, key: str, expires: int) -> None:
+        with self._db() as db:
+            db.execute(
+                "INSERT INTO session_keys (user, key, expires) VALUES (?, ?, ?) "
+                + "ON CONFLICT(user) DO UPDATE SET key=excluded.key, expires=excluded.expires",
+                (user_id, key, expires),
+            )
+
+
+class MemoryStorage(Storage):
+    """
+    Storage kept entirely in memory, for tests, benchmarks and throwaway
+    instances.  Starts with the same categories as a new database.
+    """
+
+    def __init__(self):
+        self.lock = threading.RLock()
+        self.ids = itertools.count(1)
+        self.users: dict[int, dict] = {}
+        self.usernames: dict[str, int] = {}
+        self.services: dict[str, dict] = {}
+        self.connections: dict[tuple[int, str], dict] = {}
+        self.votes: dict[int, dict[tuple[int, str], int]] = {}
+        self.session_keys: dict[int, dict] = {}
+        self.categories: dict[str, dict] = {
+            "general": {"type": "general"},
+            "agi safety research": {"type": "normal"},
+            "agi safety ecosystem development": {
+                "type": "secondary",
+                "secondary_of": "agi safety research",
+            },
+            "agi safety": {
+                "type": "composite",
+                "composite_of": json.dumps(
+                    ["agi safety research", "agi safety ecosystem development"]
+                ),
+            },
+            "bounty ecosystem participation": {"type": "normal"},
+        }
+        for category, row in self.categories.items():
+            row.setdefault("secondary_of", None)
+            row.setdefault("composite_of", None)
+            row.update(category=category, description=None)
+
+    def get_user(self, user_id: int) -> Optional[STORAGE_ROW]:
+        return self.users.get(user_id)
+
+    def get_user_by_username(self, username: str) -> Optional[STORAGE_ROW]:
+        return self.users.get(self.usernames.get(username, 0))
+
+    def add_user(
+        self,
+        username: str,
+        password: Optional[str],
+        salt: Optional[str],
+        temp: bool = False,
+    ) -> int:
+        with self.lock:
+            user_id = next(self.ids)
+            self.users[user_id] = {
+                "id": user_id,
+                "username": username,
+                "password": password,
+                "salt": salt,
+                "security": 0,
+                "temp": int(temp),
+            }
+            self.usernames[username] = user_id
+            return user_id
+
+    def get_service(self, name: str) -> Optional[STORAGE_ROW]:
+        return self.services.get(name)
+
+    def add_service(self, name: str, key: str, salt: str) -> int:
+        with self.lock:
+            service_id = next(self.ids)
+            self.services[name] = {"id": service_id, "name": name, "key": key, "salt": salt}
+            return service_id
+
+    def get_connection(
+        self, service_id: int, service_user: str
+    ) -> Optional[STORAGE_ROW]:
+        return self.connections.get((service_id, service_user))
+
+    def add_connection(
+        self,
+        service_id: int,
+        service_user: str,
+        user_id: int,
+        key: Optional[str] = None,
+    ) -> None:
+        self.connections[(service_id, service_user)] = {
+            "service": service_id,
+            "service_user": service_user,
+            "user": user_id,
+            "key": key,
+        }
+
+    def get_category(self, category: str) -> Optional[STORAGE_ROW]:
+        return self.categories.get(category)
+
+    def get_categories(self) -> list[STORAGE_ROW]:
+        return list(self.categories.values())
+
+    def get_votes_from(
+        self, user_id: int, flavors: Optional[list[str]] = None
+    ) -> list[STORAGE_ROW]:
+        return [
+            {"user_from": user_id, "user_to": user_to, "category": category, "count": count}
+            for (user_to, category), count in self.votes.get(user_id, {}).items()
+            if not flavors or category in flavors
+        ]
+
+    def get_vote_count(
+        self, user_from: int, user_to: int, category: Optional[str] = None
+    ) -> int:
+        return sum(
+            count
+            for (to, cat), count in self.votes.get(user_from, {}).items()
+            if to == user_to and (not category or cat == category)
+        )
+
+    def add_votes(self, votes: Iterable[tuple[int, int, str, int]]) -> None:
+        with self.lock:
+            for user_from, user_to, category, amount in votes:
+                edges = self.votes.setdefault(user_from, {})
+                edges[(user_to, category)] = edges.get((user_to, category), 0) + amount
+
+    def get_session_key(self, user_id: int) -> Optional[STORAGE_ROW]:
+        return self.session_keys.get(user_id)
+
+    def set_session_key(self, user_id: int, key: str, expires: int) -> None:
+        self.session_keys[user_id] = {"user": user_id, "key": key, "expires": expires}
+
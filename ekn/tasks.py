@@ -0,0 +1,34 @@
+from ekn.events import start_compactor
+from ekn.jobs import start_job_sweeper
+from ekn.maintenance import start_graph_compactor
+from ekn.sessions import start_sweeper
+from ekn.singleflight import start_flight_sweeper
+import sys
+import threading
+
+
+def start_background_tasks(path: str = "database.db") -> list[threading.Thread]:
+    """
+    Starts the daemon threads which compact and sweep the whole database.  Only
+    one process per database should run these, see `python -m ekn.tasks`.
+    """
+    return [
+        # Fold logged votes into the votes table
+        start_compactor(path=path),
+        # Delete expired session keys
+        start_sweeper(path=path),
+        # Prune dead edges and duplicate temp accounts once a day
+        start_graph_compactor(path=path),
+        # Delete expired score jobs
+        start_job_sweeper(path=path),
+        # Delete finished cross-worker score locks
+        start_flight_sweeper(path=path),
+    ]
+
+
+if __name__ == "__main__":
+    # Usage: python -m ekn.tasks [database path]
+    # Runs the background tasks for servers started without them, e.g. alongside
+    # several gunicorn workers.
+    for thread in start_background_tasks(*sys.argv[1:2]):
+        thread.join()
@@ -1,5 +1,6 @@
-from typing import Callable, Literal, Optional, TYPE_CHECKING
+from typing import Any, Callable, Literal, Optional, TYPE_CHECKING
 from collections.abc import Iterable
+import sqlite3
 
 if TYPE_CHECKING:
     from ekn.database import DatabaseManager
@@ -7,7 +8,15 @@ if TYPE_CHECKING:
 SQL_PARAM = tuple[int | str | bool | float, ...]
 SQL_PARAMS = Optional[SQL_PARAM | Iterable[SQL_PARAM]]
 
-DATABASE_VERSIONS = dict[str, Callable[["DatabaseManager"], None] | None]
+MIGRATION_STEP = (
+    str | tuple[str, SQL_PARAM | dict] | Callable[["DatabaseManager"], None]
+)
+MIGRATION_STEPS = list[MIGRATION_STEP]
+
+DATABASE_VERSIONS = dict[str, MIGRATION_STEPS | None]
+
+# Rows returned by a storage backend, looked up by column name
+STORAGE_ROW = sqlite3.Row | dict[str, Any]
 
 PASSWORD_TYPE = Optional[
     Literal["raw_password", "password_hash", "connection_key", "session_key"]
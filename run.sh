@@ -1,2 +1,4 @@
 #!/bin/bash
+# Compact and sweep the database once, not in every worker
+python -m ekn.tasks &
 gunicorn --bind 0.0.0.0:31415 --log-level debug --access-logfile /var/log/etn/etn_access.log --error-logfile /var/log/etn/etn_error.log app:app
@@ -2,4 +2,5 @@
 set FLASK_RUN_HOST=0.0.0.0
 set FLASK_RUN_PORT=31415
 set FLASK_DEBUG=True
+set EKN_BACKGROUND_TASKS=1
 python -m flask run
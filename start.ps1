@@ -1,4 +1,5 @@
 $env:FLASK_RUN_HOST="0.0.0.0"
 $env:FLASK_RUN_PORT=31415
 $env:FLASK_DEBUG=$true
+$env:EKN_BACKGROUND_TASKS=1
 python -m flask run
@@ -2,4 +2,5 @@
 export FLASK_RUN_HOST=0.0.0.0
 export FLASK_RUN_PORT=31415
 export FLASK_DEBUG=True
+export EKN_BACKGROUND_TASKS=1
 python -m flask run
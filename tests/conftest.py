@@ -1,17 +1,28 @@
+import json
+
 import pytest
-from tempfile import TemporaryDirectory
+from flask import Flask
 from unittest.mock import MagicMock, patch
 
+from ekn.categories import CategoryRegistry, registries
 from ekn.database import DatabaseManager
+from ekn.helpers import identity_cache, service_cache
+from ekn.sessions import known_expiries, pending_keys
 
 
 @pytest.fixture
 def db():
-    with TemporaryDirectory() as folder:
-        db_file = folder + '/test.db'
-        with DatabaseManager(db_file) as database:
-            with patch('ekn.helpers.DatabaseManager', return_value=DatabaseManager(db_file)):
-                yield database
+    # Each test gets its own in-memory database, and starts without anything
+    # cached from other tests' databases
+    service_cache.invalidate()
+    identity_cache.invalidate()
+    known_expiries.invalidate()
+    pending_keys.clear()
+    database = DatabaseManager.memory()
+    with database:
+        with patch('ekn.helpers.DatabaseManager', return_value=DatabaseManager(database.path)):
+            yield database
+    database.drop()
 
 
 @pytest.fixture
@@ -41,6 +52,53 @@ def network(make_network):
     make_network(votes)
 
 
+@pytest.fixture
+def call_route(db, monkeypatch):
+    """
+    Calls a route's view function with a JSON body against the test database,
+    and returns its status code and body, decoded if it is JSON.
+    """
+    def database(read_only=False):
+        return DatabaseManager(db.path, read_only)
+
+    for module in ('ekn.routes.voting', 'ekn.routes.registration', 'ekn.routes.jobs', 'ekn.jobs',
+                   'ekn.conditional'):
+        monkeypatch.setattr(f'{module}.DatabaseManager', database)
+    monkeypatch.setitem(registries, 'database.db', CategoryRegistry(db.path))
+    app = Flask(__name__)
+
+    def call(view, body, headers=None):
+        db.commit()
+        with app.test_request_context(method='POST', json=body, headers=headers):
+            response = view()
+        data = response.get_data(as_text=True)
+        try:
+            data = json.loads(data)
+        except ValueError:
+            pass
+        return response.status_code, data
+    return call
+
+
+@pytest.fixture
+def service(call_route):
+    """
+    Registers a service called "service", with users one, two and three, each
+    connected to it under the same name with the password "password".  Returns
+    the service's key.
+    """
+    from ekn.routes import register_connection, register_service, register_user
+
+    _, key = call_route(register_service, {'name': 'service'})
+    for name in ('one', 'two', 'three'):
+        call_route(register_user, {'username': name, 'password': 'password'})
+        call_route(register_connection, {
+            'service_name': 'service', 'service_key': key, 'service_user': name, 'username': name,
+            'password': 'password',
+        })
+    return str(key)
+
+
 # Add a command to run slow tests - this will by default skip tests marked as slow
 def pytest_addoption(parser):
     parser.addoption(
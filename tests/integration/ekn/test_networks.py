@@ -6,7 +6,9 @@ import time
 from pathlib import Path
 
 import pytest
-from ekn.helpers import get_votes
+from ekn.database import DatabaseManager
+from ekn.helpers import get_network, get_votes
+from ekn.storage import MemoryStorage, SQLiteStorage
 
 
 logger = logging.getLogger(__file__)
@@ -73,3 +75,31 @@ def test_saved_networks(network_type, make_network):
             assert get_votes(to, from_, 'general') == 0.0
     total_time = time.time() - start
     print(f'Took {total_time:.2f}s to check {len(without_scores)} items without scores: {1000 * total_time / len(without_scores):.2f}ms per item')
+
+
+@pytest.mark.slow
+@pytest.mark.parametrize('network_type', ('sparse', 'average', 'dense'))
+def test_network_extraction(network_type, db, make_network, monkeypatch):
+    """Check that every way of finding a network agrees, and compare how long they take."""
+    with open(data_dir / f'network-{network_type}.json') as f:
+        data = json.load(f)
+
+    make_network(data['weights'])
+    memory = MemoryStorage()
+    memory.add_votes([(from_, to, 'general', count) for from_, to, count in data['weights']])
+    storages = {'sqlite': SQLiteStorage(DatabaseManager(db.path, read_only=True)), 'memory': memory}
+    users = range(1, max({i[0] for i in data['weights']}) + 1)
+
+    networks = {}
+    for extraction, storage_name in itertools.product(('python', 'recursive'), storages):
+        monkeypatch.setattr('ekn.helpers.NETWORK_EXTRACTION', extraction)
+        start = time.time()
+        networks[extraction, storage_name] = [
+            get_network(user, ['general'], storage=storages[storage_name]) for user in users
+        ]
+        total_time = time.time() - start
+        print(f'{extraction} on {storage_name}: {1000 * total_time / len(users):.2f}ms per network')
+
+    expected = networks['python', 'sqlite']
+    for found in networks.values():
+        assert found == expected
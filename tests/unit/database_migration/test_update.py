@@ -0,0 +1,82 @@
+import sqlite3
+from tempfile import TemporaryDirectory
+
+import pytest
+
+from database_migration.update import get_version, main_database_versions, run_migration
+from ekn.database import DatabaseManager
+
+
+@pytest.fixture
+def old_db_file():
+    # A database as it looked on v1.0.0, before there was any versioning
+    with TemporaryDirectory() as folder:
+        db_file = folder + '/test.db'
+        conn = sqlite3.connect(db_file)
+        conn.executescript("""
+            CREATE TABLE votes (user_from INTEGER, user_to INTEGER, count INTEGER);
+            CREATE TABLE users (id INTEGER PRIMARY KEY AUTOINCREMENT, username TEXT, password TEXT, salt TEXT);
+            CREATE TABLE services (id INTEGER PRIMARY KEY AUTOINCREMENT, name TEXT, key TEXT);
+            CREATE TABLE connections (service INTEGER, service_user TEXT, user INTEGER);
+            INSERT INTO users (username, password, salt) VALUES ('user1', 'hash1', 'salt1'), ('user2', 'hash2', 'salt2');
+            INSERT INTO services (name, key) VALUES ('service1', 'key1');
+            INSERT INTO votes (user_from, user_to, count) VALUES (1, 2, 3);
+        """)
+        conn.commit()
+        conn.close()
+        yield db_file
+
+
+def test_update_database_from_oldest(old_db_file):
+    db = DatabaseManager(old_db_file)
+    assert get_version(db) == list(main_database_versions)[-1]
+
+    with db:
+        users = db.execute("SELECT id, username, security, temp FROM users").fetchall()
+        assert [tuple(user) for user in users] == [(1, 'user1', 0, 0), (2, 'user2', 0, 0)]
+
+        # Every user has been connected to the EKN service
+        result = db.execute("SELECT service_user, user FROM connections WHERE service=:id", {"id": db.ekn_service_id})
+        assert sorted(tuple(row) for row in result.fetchall()) == [('user1', 1), ('user2', 2)]
+
+        service = db.execute("SELECT * FROM services WHERE name='service1'").fetchone()
+        assert service["salt"]
+        assert service["key"] != 'key1'
+
+        votes = db.execute("SELECT * FROM votes").fetchall()
+        assert [tuple(vote) for vote in votes] == [(1, 2, 'general', 3)]
+
+
+def test_update_database_resumes(old_db_file):
+    versions = list(main_database_versions)
+    steps = main_database_versions["2.1.1"]
+    main_database_versions["2.1.1"] = steps + ["SELECT * FROM no_such_table"]
+    try:
+        with pytest.raises(sqlite3.OperationalError):
+            DatabaseManager(old_db_file)
+    finally:
+        main_database_versions["2.1.1"] = steps
+
+    # Everything before the failing version was kept, the failing version was rolled back
+    conn = sqlite3.connect(old_db_file)
+    assert conn.execute("SELECT value FROM etn_settings WHERE setting='version'").fetchone() == ('2.1.0',)
+    assert conn.execute("SELECT name FROM sqlite_master WHERE name='users_old'").fetchone() is None
+    conn.close()
+
+    db = DatabaseManager(old_db_file)
+    assert get_version(db) == versions[-1]
+
+
+def test_run_migration_rolls_back(db):
+    version = db.execute("SELECT value FROM etn_settings WHERE setting='version'").fetchone()["value"]
+    db.close()
+    with pytest.raises(sqlite3.OperationalError):
+        run_migration(db, "99.0.0", [
+            "CREATE TABLE new_table (id INTEGER)",
+            "INSERT INTO new_table (id) VALUES (1)",
+            "SELECT * FROM no_such_table",
+        ])
+    db.open()
+
+    assert db.execute("SELECT name FROM sqlite_master WHERE name='new_table'").fetchone() is None
+    assert db.execute("SELECT value FROM etn_settings WHERE setting='version'").fetchone()["value"] == version
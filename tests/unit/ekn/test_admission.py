@@ -0,0 +1,106 @@
+import asyncio
+import threading
+import time
+
+import pytest
+
+from ekn.admission import AdmissionController, busy_response, estimate_cost, UNKNOWN_COST
+from ekn.helpers import network_sizes
+
+
+def test_admission_limits_running():
+    controller = AdmissionController(max_running=2, service_running=2, service_budget=100, max_queue=0)
+    first = controller.acquire('a', 1)
+    second = controller.acquire('b', 1)
+    assert first and second
+    # The queue is full, so it is turned away straight away
+    assert controller.acquire('a', 1) is None
+    controller.release(first)
+    assert controller.acquire('a', 1)
+    assert controller.stats() == {
+        'running': 2, 'queue_depth': 0, 'admitted': 3, 'rejected': 1, 'timed_out': 0,
+        'average_time': pytest.approx(0, abs=0.1),
+    }
+
+
+@pytest.mark.parametrize('service_running, cost, admitted', [
+    (1, 1, False),
+    (2, 40, True),
+    (2, 41, False),
+])
+def test_admission_service_limits(service_running, cost, admitted):
+    controller = AdmissionController(max_running=10, service_running=service_running, service_budget=100,
+                                     max_queue=0)
+    assert controller.acquire('a', 60)
+    assert bool(controller.acquire('a', cost)) == admitted
+    # Other services aren't affected
+    assert controller.acquire('b', 1)
+
+
+def test_admission_large_network():
+    # A service can always score one network, however large
+    controller = AdmissionController(max_running=10, service_running=10, service_budget=100, max_queue=0)
+    assert controller.acquire('a', 1000)
+    assert controller.acquire('a', 1) is None
+
+
+def test_admission_cheapest_first():
+    controller = AdmissionController(max_running=1, service_running=1, service_budget=100, max_queue=10, timeout=5)
+    running = controller.acquire('a', 1)
+    order = []
+
+    def wait(cost):
+        ticket = controller.acquire('a', cost)
+        order.append(cost)
+        controller.release(ticket)
+
+    threads = [threading.Thread(target=wait, args=(cost,)) for cost in (50, 10, 30)]
+    for thread in threads:
+        thread.start()
+    deadline = time.monotonic() + 5
+    while controller.stats()['queue_depth'] < 3:
+        assert time.monotonic() < deadline, 'tickets never queued'
+        time.sleep(0.01)
+    controller.release(running)
+    for thread in threads:
+        thread.join(5)
+    assert order == [10, 30, 50]
+
+
+def test_admission_timeout():
+    controller = AdmissionController(max_running=1, max_queue=1, timeout=0.01)
+    running = controller.acquire('a', 1)
+    assert controller.acquire('b', 1) is None
+    assert controller.stats()['timed_out'] == 1
+    assert controller.stats()['queue_depth'] == 0
+    controller.release(running)
+
+
+def test_admission_async():
+    controller = AdmissionController(max_running=1, max_queue=1, timeout=5)
+
+    async def run():
+        running = await controller.acquire_async('a', 1)
+        waiting = asyncio.ensure_future(controller.acquire_async('b', 1))
+        await asyncio.sleep(0)
+        assert not waiting.done()
+        controller.release(running)
+        return await waiting
+
+    assert asyncio.run(run()).admitted
+
+
+def test_busy_response():
+    controller = AdmissionController(max_running=1)
+    controller.average_time = 4.0
+    response = busy_response(controller)
+    assert response.status_code == 503
+    assert response.headers['Retry-After'] == '4'
+
+
+def test_estimate_cost():
+    network_sizes.invalidate()
+    assert estimate_cost(1, 'general') == UNKNOWN_COST
+    network_sizes.set((1, 'general'), 250)
+    assert estimate_cost(1, 'general') == 250
+    network_sizes.invalidate()
@@ -0,0 +1,101 @@
+import asyncio
+import json
+
+import pytest
+from flask import Flask, request
+
+from ekn import aio
+from ekn.asgi import ASGIApp, Request
+from ekn.database import DatabaseManager
+
+
+def make_scope(method, path, body=b'', content_type=None):
+    headers = [(b'content-type', content_type.encode())] if content_type else []
+    scope = {'type': 'http', 'method': method, 'path': path, 'query_string': b'', 'headers': headers}
+    return scope, body
+
+
+async def call(app, scope, body):
+    sent = []
+    messages = [{'type': 'http.request', 'body': body[:1], 'more_body': True},
+                {'type': 'http.request', 'body': body[1:]}]
+
+    async def receive():
+        return messages.pop(0)
+
+    async def send(message):
+        sent.append(message)
+
+    await app(scope, receive, send)
+    return sent[0]['status'], dict(sent[0]['headers']), sent[1]['body']
+
+
+@pytest.fixture
+def flask_app():
+    app = Flask(__name__)
+
+    @app.route('/echo', methods=['POST'])
+    def echo():
+        return {'json': request.get_json(silent=True), 'form': request.form.to_dict()}
+
+    yield app
+    aio.shutdown_io_pool()
+
+
+@pytest.mark.parametrize('body, content_type, expected', [
+    (b'{"a": 1}', 'application/json', {'json': {'a': 1}, 'form': {}}),
+    (b'a=1&b=', 'application/x-www-form-urlencoded', {'json': None, 'form': {'a': '1', 'b': ''}}),
+])
+def test_asgi_runs_flask_views(flask_app, body, content_type, expected):
+    status, headers, data = asyncio.run(call(ASGIApp(flask_app), *make_scope('POST', '/echo', body, content_type)))
+    assert status == 200
+    assert headers[b'Content-Type'] == b'application/json'
+    assert json.loads(data) == expected
+
+
+def test_asgi_not_found(flask_app):
+    status, _, _ = asyncio.run(call(ASGIApp(flask_app), *make_scope('GET', '/missing')))
+    assert status == 404
+
+
+@pytest.mark.parametrize('body, content_type, expected', [
+    (b'{"a": 1, "c": "x"}', 'application/json', [1, None, 'x']),
+    (b'{"a": 1}', 'application/merge-patch+json; charset=utf-8', [1, None, None]),
+    (b'a=1&c=x%20y', 'application/x-www-form-urlencoded', ['1', None, 'x y']),
+    # Anything else is left to Flask
+    (b'[1]', 'application/json', None),
+    (b'{', 'application/json', None),
+    (b'a=1', None, None),
+    (b'a=1', 'multipart/form-data; boundary=x', None),
+])
+def test_request_get_params(body, content_type, expected):
+    assert Request(*make_scope('POST', '/', body, content_type)).get_params(['a', 'b', 'c']) == expected
+
+
+def test_asgi_options_get_score(flask_app):
+    status, headers, _ = asyncio.run(call(ASGIApp(flask_app), *make_scope('OPTIONS', '/get_score')))
+    assert status == 200
+    assert headers[b'Access-Control-Allow-Origin'] == b'*'
+
+
+def test_asgi_lifespan(flask_app):
+    messages = [{'type': 'lifespan.startup'}, {'type': 'lifespan.shutdown'}]
+    sent = []
+
+    async def receive():
+        return messages.pop(0)
+
+    async def send(message):
+        sent.append(message['type'])
+
+    asyncio.run(ASGIApp(flask_app)({'type': 'lifespan'}, receive, send))
+    assert sent == ['lifespan.startup.complete', 'lifespan.shutdown.complete']
+
+
+def test_query(db, monkeypatch):
+    db.execute("INSERT INTO users (id, username) VALUES (1, 'user')")
+    db.commit()
+    monkeypatch.setattr('ekn.aio.DatabaseManager', lambda read_only: DatabaseManager(db.path, read_only))
+    rows = asyncio.run(aio.query('user_id', {'username': 'user'}))
+    aio.shutdown_io_pool()
+    assert [row['id'] for row in rows] == [1]
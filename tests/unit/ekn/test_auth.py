@@ -0,0 +1,81 @@
+import hashlib
+import time
+
+import pytest
+from flask import Response
+
+from ekn.auth import authenticate
+from ekn.sessions import flush_session_keys
+
+
+def sha512(value):
+    return hashlib.sha512(value.encode('utf8')).hexdigest()
+
+
+@pytest.fixture
+def accounts(db):
+    db.execute("INSERT INTO services (id, name, key, salt) VALUES (10, 'service', ?, 'salt')", (sha512('key:salt'),))
+    db.executemany(
+        "INSERT INTO users (id, username, password, salt, security) VALUES (?, ?, ?, ?, ?)",
+        [(1, 'user1', sha512('pw:s1'), 's1', 0), (2, 'user2', sha512('pw:s2'), 's2', 1), (3, 'temp', None, None, 0)]
+    )
+    db.executemany(
+        "INSERT INTO connections (service, service_user, user, key) VALUES (10, ?, ?, ?)",
+        [('one', 1, 'connection'), ('two', 2, None), ('three', 3, None)]
+    )
+    db.execute("INSERT INTO session_keys (user, key, expires) VALUES (2, 'session', ?)", (int(time.time()) + 60,))
+    return db
+
+
+@pytest.mark.parametrize('username, password, password_type', [
+    ('one', 'pw', None),
+    ('one', 'pw', 'raw_password'),
+    ('user1', 'pw', 'raw_password'),
+    ('one', sha512('pw:s1'), 'password_hash'),
+    ('one', 'connection', 'connection_key'),
+])
+def test_authenticate(accounts, username, password, password_type):
+    auth = authenticate(accounts, 'service', 'key', username, password, password_type, 'two')
+    assert auth.service['id'] == 10
+    assert auth.user['id'] == 1
+    assert auth.password_type == (password_type or 'raw_password')
+    assert auth.target_id == 2
+
+
+def test_authenticate_session_key(accounts):
+    auth = authenticate(accounts, 'service', 'key', 'two', 'session', 'session_key')
+    assert (auth.user['id'], auth.target_id) == (2, None)
+
+
+@pytest.mark.parametrize('service, key, username, password, password_type, status', [
+    ('service', 'wrong', 'one', 'pw', None, 403),
+    ('other', 'key', 'one', 'pw', None, 403),
+    ('service', 'key', 'one', 'wrong', None, 403),
+    ('service', 'key', 'nobody', 'pw', None, 403),
+    # Connection keys only work with service usernames
+    ('service', 'key', 'user1', 'connection', 'connection_key', 403),
+    # Connection keys only work for users with security 0
+    ('service', 'key', 'two', None, 'connection_key', 403),
+    ('service', 'key', 'one', 'session', 'session_key', 403),
+    ('service', 'key', 'three', 'pw', None, 403),
+])
+def test_authenticate_fails(accounts, service, key, username, password, password_type, status):
+    response = authenticate(accounts, service, key, username, password, password_type)
+    assert isinstance(response, Response)
+    assert response.status_code == status
+
+
+def test_authenticate_missing_target(accounts):
+    assert authenticate(accounts, 'service', 'key', 'one', 'pw', None, 'nobody').target_id is None
+
+
+def test_authenticate_refreshes_session_key(accounts):
+    authenticate(accounts, 'service', 'key', 'one', 'pw')
+    assert flush_session_keys(accounts) == 1
+    row = accounts.execute("SELECT key, expires FROM session_keys WHERE user=1").fetchone()
+    assert row['expires'] > time.time() + 86_000
+
+    # Unexpired keys are kept
+    authenticate(accounts, 'service', 'key', 'one', 'pw')
+    assert flush_session_keys(accounts) == 0
+    assert tuple(accounts.execute("SELECT key, expires FROM session_keys WHERE user=1").fetchone()) == tuple(row)
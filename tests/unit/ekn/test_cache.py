@@ -0,0 +1,124 @@
+import hashlib
+import json
+
+import pytest
+from flask import Flask
+
+from ekn.cache import TTLCache
+from ekn.helpers import (
+    forget_service, merge_temp_users, resolve_service_username, service_cache, verify_credentials_raw,
+    verify_service
+)
+from ekn.routes import misc
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr('ekn.cache.time.monotonic', lambda: now[0])
+    return now
+
+
+def test_cache_get_set(clock):
+    cache = TTLCache(10, 60)
+    assert cache.get('a') is None
+    cache.set('a', 1)
+    assert cache.get('a') == 1
+    assert cache.stats() == {'hits': 1, 'misses': 1, 'hit_rate': 0.5, 'size': 1}
+
+
+def test_cache_expires(clock):
+    cache = TTLCache(10, 60)
+    cache.set('a', 1)
+    clock[0] += 59
+    assert cache.get('a') == 1
+    clock[0] += 1
+    assert cache.get('a') is None
+    assert cache.stats()['size'] == 0
+
+
+def test_cache_evicts_least_recently_used(clock):
+    cache = TTLCache(2, 60)
+    cache.set('a', 1)
+    cache.set('b', 2)
+    cache.get('a')
+    cache.set('c', 3)
+    assert (cache.get('a'), cache.get('b'), cache.get('c')) == (1, None, 3)
+
+
+def test_cache_invalidate(clock):
+    cache = TTLCache(10, 60)
+    cache.set(('a', 1), 1)
+    cache.set(('a', 2), 2)
+    cache.set(('b', 1), 3)
+    cache.invalidate(lambda key: key[0] == 'a')
+    assert (cache.get(('a', 1)), cache.get(('a', 2)), cache.get(('b', 1))) == (None, None, 3)
+    cache.invalidate()
+    assert cache.get(('b', 1)) is None
+
+
+def test_cache_invalidate_values(clock):
+    cache = TTLCache(10, 60)
+    cache.set('a', {'id': 1})
+    cache.set('b', {'id': 2})
+    cache.invalidate_values(lambda value: value['id'] == 1)
+    assert (cache.get('a'), cache.get('b')) == (None, {'id': 2})
+
+
+def test_verify_service_cached(db):
+    key_hash = hashlib.sha512(b'key:salt').hexdigest()
+    db.execute("INSERT INTO services (name, key, salt) VALUES ('service', ?, 'salt')", (key_hash,))
+    db.commit()
+
+    assert verify_service('service', 'wrong') is None
+    assert verify_service('service', 'key')['name'] == 'service'
+    hits = service_cache.stats()['hits']
+
+    # Cached until the service is forgotten, even if it has been re-keyed
+    db.execute("UPDATE services SET key='other' WHERE name='service'")
+    db.commit()
+    assert verify_service('service', 'key')['name'] == 'service'
+    assert service_cache.stats()['hits'] == hits + 1
+    with Flask(__name__).test_request_context():
+        stats = json.loads(misc.get_cache_stats().get_data())
+    assert stats['services'] == service_cache.stats()
+    assert set(stats) == {'services', 'identities', 'network_sizes', 'session_expiries'}
+    forget_service('service')
+    assert verify_service('service', 'key') is None
+
+
+@pytest.fixture
+def identities(db):
+    password_hash = hashlib.sha512(b'pw:salt').hexdigest()
+    db.execute("INSERT INTO services (id, name, key, salt) VALUES (10, 'service', 'key', 'salt')")
+    db.executemany(
+        "INSERT INTO users (id, username, password, salt, temp) VALUES (?, ?, ?, 'salt', ?)",
+        [(1, 'user', password_hash, 0), (2, 'temp', None, 1)]
+    )
+    db.executemany("INSERT INTO connections (service, service_user, user) VALUES (10, ?, ?)", [('one', 1), ('two', 2)])
+    db.commit()
+    return db
+
+
+def test_verify_credentials_not_cached(identities):
+    assert verify_credentials_raw('user', 'pw')['id'] == 1
+
+    # Password changes made by another process are seen straight away
+    identities.execute("UPDATE users SET salt='other' WHERE id=1")
+    identities.commit()
+    assert verify_credentials_raw('user', 'pw') is None
+
+
+def test_resolve_service_username_cached(identities):
+    assert resolve_service_username(10, 'two')['id'] == 2
+    assert resolve_service_username(10, 'three') is None
+
+    # Users who aren't found aren't cached
+    identities.execute("INSERT INTO connections (service, service_user, user) VALUES (10, 'three', 1)")
+    identities.commit()
+    assert resolve_service_username(10, 'three')['id'] == 1
+
+    # Merging a temp account drops lookups of it
+    assert merge_temp_users(identities, {2: 1}) == 1
+    identities.commit()
+    assert resolve_service_username(10, 'two')['id'] == 1
@@ -0,0 +1,58 @@
+import pytest
+
+from ekn.categories import CategoryRegistry, compile_flavor, get_registry
+
+
+@pytest.mark.parametrize('name, flavor_type, categories, secondary_of', [
+    ('general', 'general', None, None),
+    ('agi safety research', 'normal', ('agi safety research',), None),
+    ('agi safety ecosystem development', 'secondary', ('agi safety research',), 'agi safety research'),
+    ('agi safety', 'composite', ('agi safety research', 'agi safety ecosystem development', 'agi safety'), None),
+])
+def test_registry_flavors(db, name, flavor_type, categories, secondary_of):
+    flavor = get_registry(db.path).get(name)
+    assert (flavor.name, flavor.type, flavor.categories, flavor.secondary_of) == (
+        name, flavor_type, categories, secondary_of
+    )
+
+
+def test_registry_missing(db):
+    assert get_registry(db.path).get('bla bla bla') is None
+
+
+def test_registry_shared(db):
+    assert get_registry(db.path) is get_registry(db.path)
+
+
+def test_compile_flavor_composite():
+    row = {'category': 'c', 'type': 'composite', 'secondary_of': None,
+           'composite_of': '["a", "b"]', 'description': None}
+    assert compile_flavor(row).categories == ('a', 'b', 'c')
+
+
+def test_categories_version_bumped(db):
+    def version():
+        return db.execute("SELECT value FROM etn_settings WHERE setting='categories_version'").fetchone()[0]
+
+    before = int(version())
+    db.execute("INSERT INTO categories (category, type) VALUES ('new', 'normal')")
+    db.execute("UPDATE categories SET description='d' WHERE category='new'")
+    db.execute("DELETE FROM categories WHERE category='new'")
+    assert int(version()) == before + 3
+
+
+def test_registry_reloads_on_change(db):
+    registry = CategoryRegistry(db.path)
+    assert registry.get('new') is None
+    db.execute("INSERT INTO categories (category, type) VALUES ('new', 'normal')")
+    db.commit()
+
+    # Changes are only picked up on the next check
+    assert registry.get('new') is None
+    registry.checked = 0.0
+    assert registry.get('new').categories == ('new',)
+
+    db.execute("DELETE FROM categories WHERE category='new'")
+    db.commit()
+    registry.invalidate()
+    assert 'new' not in registry.names()
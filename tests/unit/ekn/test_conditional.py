@@ -0,0 +1,86 @@
+import pytest
+from flask import Flask, Response
+
+from ekn.conditional import conditional, etag_matches, get_data_versions, make_etag
+from ekn.database import DatabaseManager
+from ekn.routes import misc
+
+
+@pytest.fixture
+def app():
+    return Flask(__name__)
+
+
+def test_graph_version_bumped(db, make_network):
+    def version():
+        return int(db.execute("SELECT value FROM etn_settings WHERE setting='graph_version'").fetchone()[0])
+
+    before = version()
+    make_network([(1, 2), (2, 3)])
+    db.execute(
+        "INSERT INTO votes (user_from, user_to, category, count) VALUES (1, 2, 'general', 5) "
+        + "ON CONFLICT(user_from, user_to, category) DO UPDATE SET count=votes.count + excluded.count"
+    )
+    db.execute("DELETE FROM votes WHERE user_from=2")
+    assert version() == before + 4
+
+
+def test_get_data_versions(db, make_network, monkeypatch):
+    monkeypatch.setattr('ekn.conditional.DatabaseManager', lambda read_only: DatabaseManager(db.path, read_only))
+    graph, categories = get_data_versions()
+    make_network([(1, 2)])
+    assert get_data_versions() == (str(int(graph) + 1), categories)
+
+
+@pytest.mark.parametrize('header, expected', [
+    (None, False),
+    ('', False),
+    ('"abc"', True),
+    ('W/"abc"', True),
+    ('"xyz", "abc"', True),
+    ('"xyz"', False),
+    ('*', True),
+])
+def test_etag_matches(header, expected):
+    assert etag_matches(header, 'abc') is expected
+
+
+def test_etag_matches_post():
+    assert etag_matches('"abc"', 'abc', 'POST')
+    assert not etag_matches('*', 'abc', 'POST')
+    assert etag_matches('*', 'abc', 'HEAD')
+
+
+def test_make_etag():
+    assert make_etag('score', 1, 2) == make_etag('score', 1, 2)
+    assert make_etag('score', 1, 2) != make_etag('score', 12)
+
+
+def test_conditional(app):
+    etag = make_etag('x')
+    with app.test_request_context(headers={'If-None-Match': f'"{etag}"'}):
+        response = conditional(etag, 'no-cache', pytest.fail)
+        assert response.status_code == 304
+        assert response.headers['ETag'] == f'"{etag}"'
+        assert response.headers['Cache-Control'] == 'no-cache'
+    with app.test_request_context(headers={'If-None-Match': '"old"'}):
+        response = conditional(etag, 'no-cache', lambda: Response('body', 200))
+        assert response.status_code == 200
+        assert response.headers['ETag'] == f'"{etag}"'
+    with app.test_request_context():
+        response = conditional(etag, 'no-cache', lambda: Response('missing', 404))
+        assert 'ETag' not in response.headers
+
+
+def test_read_counter(app, db, monkeypatch):
+    monkeypatch.setattr('ekn.routes.misc.DatabaseManager', lambda read_only: DatabaseManager(db.path, read_only))
+    with app.test_request_context():
+        response = misc.read_counter('total_users')
+        assert response.get_data(as_text=True) == '0'
+        etag = response.headers['ETag']
+    with app.test_request_context(headers={'If-None-Match': etag}):
+        assert misc.read_counter('total_users').status_code == 304
+    db.execute("INSERT INTO users (id, username) VALUES (1, 'user')")
+    db.commit()
+    with app.test_request_context(headers={'If-None-Match': etag}):
+        assert misc.read_counter('total_users').get_data(as_text=True) == '1'
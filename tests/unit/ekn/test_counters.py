@@ -0,0 +1,64 @@
+from ekn.counters import get_counter, repair_counters
+from ekn.helpers import merge_temp_users
+
+
+def get_counters(db):
+    return {
+        name: get_counter(db, name)
+        for name in ('total_users', 'real_users', 'temp_users', 'total_votes')
+    }
+
+
+def test_counters_empty(db):
+    assert get_counters(db) == {'total_users': 0, 'real_users': 0, 'temp_users': 0, 'total_votes': 0}
+
+
+def test_counters_users(db):
+    db.executemany(
+        "INSERT INTO users (id, username, temp) VALUES (?, ?, ?)",
+        [(1, 'user1', 0), (2, 'user2', 0), (3, 'temp3', 1), (4, 'temp4', 1), (5, 'temp5', 1)]
+    )
+    assert get_counters(db) == {'total_users': 5, 'real_users': 2, 'temp_users': 3, 'total_votes': 0}
+
+    db.execute("DELETE FROM users WHERE id IN (1, 3)")
+    assert get_counters(db) == {'total_users': 3, 'real_users': 1, 'temp_users': 2, 'total_votes': 0}
+
+    db.execute("UPDATE users SET temp=0 WHERE id=4")
+    assert get_counters(db) == {'total_users': 3, 'real_users': 2, 'temp_users': 1, 'total_votes': 0}
+
+
+def test_counters_votes(db, make_network):
+    make_network([(1, 2), (2, 1), (2, 3), (3, 4)])
+    assert get_counter(db, 'total_votes') == 4
+
+    # Updating existing votes doesn't change how many there are
+    db.execute(
+        "INSERT INTO votes (user_from, user_to, category, count) VALUES (1, 2, 'general', 5) "
+        + "ON CONFLICT(user_from, user_to, category) DO UPDATE SET count=votes.count + excluded.count"
+    )
+    db.execute("UPDATE votes SET count=10 WHERE user_from=2")
+    assert get_counter(db, 'total_votes') == 4
+
+    db.execute("DELETE FROM votes WHERE user_from=2")
+    assert get_counter(db, 'total_votes') == 2
+
+
+def test_counters_merge(db, make_network):
+    db.executemany(
+        "INSERT INTO users (id, username, temp) VALUES (?, ?, ?)",
+        [(1, 'user1', 0), (2, 'user2', 0), (3, 'temp3', 1)]
+    )
+    make_network([(1, 2), (3, 2), (2, 3), (2, 1)])
+    merge_temp_users(db, {3: 1})
+    assert get_counters(db) == {'total_users': 2, 'real_users': 2, 'temp_users': 0, 'total_votes': 2}
+
+
+def test_repair_counters(db, make_network):
+    make_network([(1, 2), (2, 1)])
+    db.execute("INSERT INTO users (username, temp) VALUES ('temp1', 1)")
+    db.execute("UPDATE counters SET value=42")
+
+    assert repair_counters(db) == {
+        'total_users': (42, 1), 'real_users': (42, 0), 'temp_users': (42, 1), 'total_votes': (42, 2)
+    }
+    assert get_counters(db) == {'total_users': 1, 'real_users': 0, 'temp_users': 1, 'total_votes': 2}
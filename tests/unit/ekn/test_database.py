@@ -0,0 +1,99 @@
+import sqlite3
+import threading
+from tempfile import TemporaryDirectory
+
+import pytest
+
+from ekn.database import DatabaseManager
+
+
+def test_memory_database_persists():
+    database = DatabaseManager.memory()
+    with database as db:
+        db.execute("INSERT INTO users (username) VALUES ('user1')")
+
+    # Other managers for the same path see the same database
+    with DatabaseManager(database.path) as db:
+        assert db.execute("SELECT username FROM users").fetchone()["username"] == 'user1'
+        assert db.ekn_service_id
+    database.drop()
+
+
+def test_memory_databases_are_separate():
+    database1 = DatabaseManager.memory()
+    database2 = DatabaseManager.memory()
+    with database1 as db:
+        db.execute("INSERT INTO users (username) VALUES ('user1')")
+    with database2 as db:
+        assert db.execute("SELECT COUNT(*) FROM users").fetchone()[0] == 0
+    database1.drop()
+    database2.drop()
+
+
+def test_memory_database_drop():
+    database = DatabaseManager.memory()
+    with database as db:
+        db.execute("INSERT INTO users (username) VALUES ('user1')")
+    database.drop()
+
+    # A dropped database starts again from scratch
+    with DatabaseManager(database.path) as db:
+        assert db.execute("SELECT COUNT(*) FROM users").fetchone()[0] == 0
+    database.drop()
+
+
+@pytest.fixture(params=('memory', 'file'))
+def database(request):
+    if request.param == 'memory':
+        database = DatabaseManager.memory()
+        yield database
+        database.drop()
+        return
+    with TemporaryDirectory() as folder:
+        yield DatabaseManager(folder + '/test.db')
+
+
+def test_read_only(database):
+    with database as db:
+        db.execute("INSERT INTO users (username) VALUES ('user1')")
+
+    reader = DatabaseManager(database.path, read_only=True)
+    with reader as db:
+        assert db.execute("SELECT username FROM users").fetchone()["username"] == 'user1'
+        with pytest.raises(sqlite3.OperationalError):
+            db.execute("INSERT INTO users (username) VALUES ('user2')")
+
+
+def test_read_only_creates_database():
+    with TemporaryDirectory() as folder:
+        with DatabaseManager(folder + '/test.db', read_only=True) as db:
+            assert db.execute("SELECT * FROM categories WHERE category='general'").fetchone()
+
+
+def test_read_only_doesnt_wait_for_writers(database):
+    # Readers can be used while a writer is open, from any thread
+    def read():
+        with DatabaseManager(database.path, read_only=True) as db:
+            db.execute("SELECT * FROM users").fetchall()
+
+    with database:
+        thread = threading.Thread(target=read)
+        thread.start()
+        thread.join(timeout=5)
+        assert not thread.is_alive()
+
+
+def test_writers_are_serialized(database):
+    order = []
+
+    def write():
+        with DatabaseManager(database.path):
+            order.append('other')
+
+    with database:
+        thread = threading.Thread(target=write)
+        thread.start()
+        thread.join(timeout=0.2)
+        order.append('first')
+    thread.join()
+    assert order == ['first', 'other']
@@ -0,0 +1,77 @@
+from ekn.events import (
+    append_vote_events, compact_vote_events, get_compacted_seq,
+    get_edge_count, get_edge_counts, get_vote_events
+)
+from ekn.helpers import get_network
+
+
+def get_all_votes(db):
+    result = db.execute("SELECT user_from, user_to, category, count FROM votes")
+    return sorted(tuple(row) for row in result.fetchall())
+
+
+def test_append_vote_events(db):
+    append_vote_events(db, [(1, 2, 'general', 1), (1, 2, 'general', 2)])
+    append_vote_events(db, [(2, 1, 'agi safety', -1)])
+
+    events = get_vote_events(db)
+    assert [event['seq'] for event in events] == [1, 2, 3]
+    assert [tuple(event)[1:5] for event in events] == [
+        (1, 2, 'general', 1), (1, 2, 'general', 2), (2, 1, 'agi safety', -1)
+    ]
+    # Nothing has reached the votes table yet
+    assert get_all_votes(db) == []
+
+
+def test_get_vote_events_since(db):
+    append_vote_events(db, [(1, i, 'general', 1) for i in range(2, 12)])
+    assert [event['seq'] for event in get_vote_events(db, 4, 3)] == [5, 6, 7]
+    assert [event['seq'] for event in get_vote_events(db, 8)] == [9, 10]
+    assert get_vote_events(db, 10) == []
+
+
+def test_get_edge_count(db, make_network):
+    make_network([(1, 2, 3), (1, 2, 4, 'agi safety')])
+    append_vote_events(db, [(1, 2, 'general', 5), (1, 2, 'agi safety', -1), (2, 1, 'general', 7)])
+
+    assert get_edge_count(db, 1, 2, 'general') == 8
+    assert get_edge_count(db, 1, 2, 'agi safety') == 3
+    assert get_edge_count(db, 1, 2) == 11
+    assert get_edge_count(db, 2, 1) == 7
+    assert get_edge_count(db, 3, 1) == 0
+
+
+def test_get_edge_counts(db, make_network):
+    make_network([(1, 2, 3), (1, 2, 4, 'agi safety'), (1, 3, 2), (2, 3, 9)])
+    append_vote_events(db, [(1, 2, 'general', 5), (1, 4, 'agi safety', 1), (1, 3, 'general', -2)])
+
+    assert get_edge_counts(db, 1, [2, 3, 4, 5]) == {
+        2: {'general': 8, 'agi safety': 4},
+        3: {'general': 0},
+        4: {'agi safety': 1},
+    }
+    assert get_edge_counts(db, 1, [3]) == {3: {'general': 0}}
+    assert get_edge_counts(db, 1, []) == {}
+
+
+def test_compact_vote_events(db, make_network):
+    make_network([(1, 2, 3)])
+    append_vote_events(db, [(1, 2, 'general', 5), (1, 2, 'general', -2), (2, 1, 'general', 7)])
+    db.commit()
+    assert get_network(1, None) == {1, 2}
+    assert get_network(2, None) == {2}
+
+    assert compact_vote_events(db) == 3
+    db.commit()
+    assert get_compacted_seq(db) == 3
+    assert get_all_votes(db) == [(1, 2, 'general', 6), (2, 1, 'general', 7)]
+    assert get_network(2, None) == {1, 2}
+    # Counts stay the same once the events are compacted
+    assert get_edge_count(db, 1, 2) == 6
+
+    # Compacted events are never folded in twice, but are kept in the log
+    assert compact_vote_events(db) == 0
+    append_vote_events(db, [(2, 1, 'general', 1)])
+    assert compact_vote_events(db) == 1
+    assert get_all_votes(db) == [(1, 2, 'general', 6), (2, 1, 'general', 8)]
+    assert len(get_vote_events(db)) == 4
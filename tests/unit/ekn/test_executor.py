@@ -0,0 +1,37 @@
+import hashlib
+
+import pytest
+
+from ekn import executor
+from ekn.helpers import hash_password, salted_hash
+
+
+@pytest.fixture
+def pools(monkeypatch):
+    monkeypatch.setattr(executor, 'CPU_WORKERS', 1)
+    yield executor.pools
+    executor.shutdown_pools()
+
+
+@pytest.mark.parametrize('kind', ('inline', 'thread', 'process'))
+def test_run_cpu(pools, kind):
+    assert executor.run_cpu(kind, salted_hash, 'pw', 'salt') == hashlib.sha512(b'pw:salt').hexdigest()
+    assert list(pools) == ([] if kind == 'inline' else [kind])
+
+
+def test_run_cpu_shares_pools(pools):
+    executor.run_cpu('thread', abs, -1)
+    pool = pools['thread']
+    assert executor.run_cpu('thread', abs, -2) == 2
+    assert pools['thread'] is pool
+
+
+def test_run_cpu_unknown(pools):
+    with pytest.raises(ValueError):
+        executor.run_cpu('gpu', abs, -1)
+
+
+def test_hash_password(monkeypatch, pools):
+    monkeypatch.setattr('ekn.helpers.HASH_EXECUTOR', 'thread')
+    assert hash_password('pw', 'salt') == salted_hash('pw', 'salt')
+    assert 'thread' in pools
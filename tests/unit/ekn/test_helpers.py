@@ -1,9 +1,10 @@
 import pytest
 from unittest.mock import MagicMock, patch
 
+from ekn.events import append_vote_events, get_compacted_seq
 from ekn.helpers import (
-    get_params, get_where_str, get_users_index, get_network,
-    get_votes, DECAY
+    get_params, get_users_index, get_network,
+    get_votes, merge_temp_users, DECAY
 )
 
 
@@ -53,20 +54,6 @@ def test_get_params_empty():
         assert get_params([]) is None
 
 
-@pytest.mark.parametrize('flavors', (None, [], {}))
-def test_get_where_str_empty(flavors):
-    assert get_where_str(flavors) == "WHERE '1'='1'"
-
-
-@pytest.mark.parametrize('flavors, expected', (
-    (['a'], "'a'"),
-    (['a', 'b', 'c'], "'a', 'b', 'c'"),
-    (['bla', 'ble'], "'bla', 'ble'"),
-))
-def test_get_where_str(flavors, expected):
-    assert get_where_str(flavors) == f'WHERE category in ({expected})'
-
-
 @pytest.mark.parametrize('users, expected', (
     ({4, 2, 1, 3}, {1: 1, 2: 2, 3: 0, 4: 3}),
     ({1, 2, 3, 4}, {1: 1, 2: 2, 3: 0, 4: 3}),
@@ -88,12 +75,18 @@ def test_get_users_index_missing():
         assert get_users_index({1, 2, 3, 4}, 42)
 
 
-def test_get_network_empty(db):
+@pytest.fixture(params=('python', 'recursive'))
+def extraction(request, monkeypatch):
+    monkeypatch.setattr('ekn.helpers.NETWORK_EXTRACTION', request.param)
+    return request.param
+
+
+def test_get_network_empty(db, extraction):
     # The network always contains the checked item
-    assert get_network(1, "WHERE 1=1") == {1}
+    assert get_network(1, None) == {1}
 
 
-def test_get_network(make_network):
+def test_get_network(make_network, extraction):
     votes = [
         # Direct contacts
         (1, 2), (1, 3), (1, 4), (1, 5),
@@ -106,10 +99,10 @@ def test_get_network(make_network):
         (7, 8), (7, 9),
     ]
     make_network(votes)
-    assert get_network(1, "WHERE 1=1") == set(range(1, 10))
+    assert get_network(1, None) == set(range(1, 10))
 
 
-def test_get_network_sparse(make_network):
+def test_get_network_sparse(make_network, extraction):
     votes = [
         # Direct contacts
         (1, 2), (1, 5),
@@ -121,13 +114,20 @@ def test_get_network_sparse(make_network):
         (7, 8), (7, 9),
     ]
     make_network(votes)
-    assert get_network(1, "WHERE 1=1") == {1, 2, 5, 6}
+    assert get_network(1, None) == {1, 2, 5, 6}
 
 
-def test_get_network_cycle(make_network):
+def test_get_network_cycle(make_network, extraction):
     votes = [(1, 2), (2, 3), (3, 4), (4, 5), (5, 1)]
     make_network(votes)
-    assert get_network(1, "WHERE 1=1") == {1, 2, 3, 4, 5}
+    assert get_network(1, None) == {1, 2, 3, 4, 5}
+
+
+def test_get_network_checking(make_network, extraction):
+    # Votes cast by the checked user aren't followed
+    make_network([(1, 2), (2, 3), (3, 4), (2, 5)])
+    assert get_network(1, None, checking=3) == {1, 2, 3, 5}
+    assert get_network(1, None, checking=2) == {1, 2}
 
 
 ## Base tests to handle no connection between 2 users
@@ -415,3 +415,75 @@ def test_get_votes_complicated_network(make_network, votes):
     u8_votes = u6_votes + u6_u8 + u1_u8
 
     assert get_votes(1, 8, 'general') == pytest.approx(u8_score * u8_votes, 0.01)
+
+
+@pytest.fixture
+def temp_users(db):
+    # Users 1 and 2 are real, users 3 and 4 are temp accounts on service 5
+    for id, temp in ((1, 0), (2, 0), (3, 1), (4, 1)):
+        db.execute(
+            "INSERT INTO users (id, username, temp) VALUES (?, ?, ?)",
+            (id, f"user{id}", temp)
+        )
+        db.execute(
+            "INSERT INTO connections (service, service_user, user) VALUES (?, ?, ?)",
+            (5, f"user{id}", id)
+        )
+
+
+def get_all_votes(db):
+    result = db.execute("SELECT user_from, user_to, category, count FROM votes")
+    return sorted(tuple(row) for row in result.fetchall())
+
+
+def test_merge_temp_users(db, temp_users, make_network):
+    make_network([
+        # Votes which only need moving
+        (3, 2, 1), (2, 3, 2),
+        # Votes which overlap with the real account's votes
+        (1, 2, 3), (3, 2, 4, 'agi safety'),
+        (2, 1, 5), (2, 3, 6, 'agi safety'), (2, 1, 7, 'agi safety'),
+        # Votes between the merged accounts
+        (1, 3, 8), (3, 1, 9),
+    ])
+    assert merge_temp_users(db, {3: 1}) == 1
+    assert get_all_votes(db) == [
+        (1, 2, 'agi safety', 4), (1, 2, 'general', 4),
+        (2, 1, 'agi safety', 13), (2, 1, 'general', 7),
+    ]
+
+    assert db.execute("SELECT id FROM users WHERE id=3").fetchone() is None
+    result = db.execute("SELECT service_user FROM connections WHERE user=1")
+    assert sorted(row[0] for row in result.fetchall()) == ['user1', 'user3']
+
+
+def test_merge_temp_users_pending_events(db, temp_users):
+    db.commit()
+    append_vote_events(db, [(3, 2, 'general', 2)])
+    db.commit()
+    assert merge_temp_users(db, {3: 1}) == 1
+    assert get_all_votes(db) == [(1, 2, 'general', 2)]
+    # The events are compacted in the merge's transaction, not committed before it
+    assert db.conn.in_transaction
+    db.conn.rollback()
+    assert get_compacted_seq(db) == 0
+    assert get_all_votes(db) == []
+
+
+def test_merge_temp_users_bulk(db, temp_users, make_network):
+    make_network([(3, 4, 1), (4, 3, 2), (3, 2, 3), (4, 2, 4), (2, 3, 5), (2, 4, 6)])
+    assert merge_temp_users(db, {3: 1, 4: 1}) == 2
+    assert get_all_votes(db) == [(1, 2, 'general', 7), (2, 1, 'general', 11)]
+    assert db.execute("SELECT COUNT(*) FROM users").fetchone()[0] == 2
+
+
+def test_merge_temp_users_only_temp_users(db, temp_users, make_network):
+    make_network([(1, 2), (2, 4)])
+    # Real accounts can't be merged
+    assert merge_temp_users(db, {}) == 0
+    assert merge_temp_users(db, {2: 1}) == 0
+    assert get_all_votes(db) == [(1, 2, 'general', 1), (2, 4, 'general', 1)]
+
+    # Nor can accounts be merged into accounts which are being merged
+    assert merge_temp_users(db, {3: 4, 4: 1}) == 1
+    assert get_all_votes(db) == [(1, 2, 'general', 1), (2, 1, 'general', 1)]
@@ -0,0 +1,229 @@
+import sqlite3
+import threading
+import time
+
+import pytest
+
+from ekn.database import DatabaseManager
+from ekn.admission import ScoreRejected
+from ekn import jobs as jobs_module
+from ekn.jobs import create_job, read_job, renew_jobs, run_job, start_job, sweep_jobs, wait_for_job
+from ekn.routes import get_score_job, submit_score_job
+
+
+@pytest.fixture
+def jobs(db, make_network, monkeypatch):
+    monkeypatch.setattr('ekn.jobs.DatabaseManager', lambda read_only=False: DatabaseManager(db.path, read_only))
+    # The test holds the database's writer lock, so scores can't be calculated on other threads
+    monkeypatch.setattr('ekn.admission.SCORE_EXECUTOR', 'inline')
+    db.execute("INSERT INTO services (id, name, key, salt) VALUES (10, 'service', 'key', 'salt')")
+    db.executemany(
+        "INSERT INTO connections (service, service_user, user) VALUES (10, ?, ?)", [('one', 1), ('two', 2), ('three', 3)]
+    )
+    make_network([(1, 2), (2, 3), (1, 3)])
+    return db
+
+
+def submit(db, request, service_id=10):
+    job_id = create_job(db, service_id, 1, request)
+    db.commit()
+    return job_id
+
+
+def test_run_job_single(jobs):
+    job_id = submit(jobs, {'kind': 'single', 'service': 'service', 'from': 'one', 'flavor': 'general', 'targets': [['three', 3]]})
+    assert read_job(job_id, 10) == {'job': job_id, 'status': 'queued'}
+    run_job(job_id, 10, 1, {'kind': 'single', 'service': 'service', 'from': 'one', 'flavor': 'general', 'targets': [['three', 3]]})
+    job = read_job(job_id, 10)
+    assert job['status'] == 'done'
+    assert job['result'] == {'for': 'three', 'from': 'one', 'flavor': 'general', 'score': 1.97, 'status': 200}
+    # Jobs are only visible to the service that submitted them
+    assert read_job(job_id, 11) is None
+
+
+def test_run_job_batch(jobs):
+    request = {'kind': 'batch', 'service': 'service', 'from': 'one', 'flavor': 'general',
+               'targets': [['two', 2], ['nobody', None], ['one', 1]]}
+    job_id = submit(jobs, request)
+    run_job(job_id, 10, 1, request)
+    assert [result['status'] for result in read_job(job_id, 10)['result']] == [200, 404, 400]
+
+
+def test_run_job_top(jobs):
+    request = {'kind': 'top', 'service': 'service', 'from': 'one', 'flavor': 'general', 'k': 1}
+    job_id = submit(jobs, request)
+    run_job(job_id, 10, 1, request)
+    assert read_job(job_id, 10)['result'] == [{'for': 'three', 'score': 1.97}]
+
+
+def test_run_job_failed(jobs):
+    request = {'kind': 'top', 'service': 'service', 'from': 'one', 'flavor': 'bla bla bla', 'k': 1}
+    job_id = submit(jobs, request)
+    run_job(job_id, 10, 1, request)
+    assert read_job(job_id, 10) == {'job': job_id, 'status': 'failed', 'error': 'Flavor does not exist.'}
+
+
+def test_wait_for_job(jobs):
+    request = {'kind': 'single', 'service': 'service', 'from': 'one', 'flavor': 'general', 'targets': [['two', 2]]}
+    job_id = submit(jobs, request)
+    assert wait_for_job(job_id, 10)['status'] == 'queued'
+    assert wait_for_job('nope', 10, 5) is None
+
+    waited = []
+    waiter = threading.Thread(target=lambda: waited.append(wait_for_job(job_id, 10, 5)))
+    waiter.start()
+    run_job(job_id, 10, 1, request)
+    jobs.commit()
+    waiter.join()
+    assert waited[0]['status'] == 'done'
+
+
+def test_sweep_jobs(jobs):
+    job_id = submit(jobs, {'kind': 'top', 'service': 'service', 'from': 'one', 'flavor': 'general', 'k': 1})
+    other_id = submit(jobs, {'kind': 'top', 'service': 'service', 'from': 'one', 'flavor': 'general', 'k': 1})
+    jobs.execute("UPDATE score_jobs SET expires=:now WHERE id=:id", {'now': int(time.time()), 'id': job_id})
+    jobs.commit()
+    assert read_job(job_id, 10) is None
+    assert sweep_jobs(jobs) == 1
+    jobs.commit()
+    assert read_job(other_id, 10)['status'] == 'queued'
+
+
+def test_run_job_status_write_failed(jobs, monkeypatch):
+    statuses = []
+    set_job_status = jobs_module.set_job_status
+
+    def failing_status(job_id, status, *args, **kwargs):
+        statuses.append(status)
+        if status == 'running':
+            raise sqlite3.OperationalError('database is locked')
+        set_job_status(job_id, status, *args, **kwargs)
+
+    monkeypatch.setattr('ekn.jobs.set_job_status', failing_status)
+    request = {'kind': 'single', 'service': 'service', 'from': 'one', 'flavor': 'general', 'targets': [['two', 2]]}
+    job_id = submit(jobs, request)
+    run_job(job_id, 10, 1, request)
+    assert statuses == ['running', 'failed']
+    assert read_job(job_id, 10) == {'job': job_id, 'status': 'failed', 'error': 'database is locked'}
+
+
+def test_renew_jobs(jobs, monkeypatch):
+    request = {'kind': 'top', 'service': 'service', 'from': 'one', 'flavor': 'general', 'k': 1}
+    job_id, dead_id = submit(jobs, request), submit(jobs, request)
+    expires = jobs.execute("SELECT expires FROM score_jobs WHERE id=:id", {'id': job_id}).fetchone()[0]
+    # Unfinished jobs only last a short lease
+    assert expires <= time.time() + jobs_module.JOB_LEASE
+    jobs.execute("UPDATE score_jobs SET expires=1")
+    jobs.commit()
+
+    # Only jobs this process is still running are renewed
+    monkeypatch.setattr('ekn.jobs.jobs_pending', {job_id})
+    assert renew_jobs() == 1
+    assert read_job(job_id, 10)['status'] == 'queued'
+    assert read_job(dead_id, 10) is None
+
+
+def test_run_job_rejected(jobs, monkeypatch):
+    def admitted_score(*args):
+        raise ScoreRejected('Too many scores are being calculated.')
+
+    monkeypatch.setattr('ekn.jobs.admitted_score', admitted_score)
+    request = {'kind': 'single', 'service': 'service', 'from': 'one', 'flavor': 'general', 'targets': [['two', 2]]}
+    job_id = submit(jobs, request)
+    run_job(job_id, 10, 1, request)
+    assert read_job(job_id, 10)['result'] == {
+        'for': 'two', 'from': 'one', 'flavor': 'general', 'status': 503,
+        'message': 'Too many scores are being calculated.',
+    }
+
+
+def test_run_job_top_too_large(jobs, monkeypatch):
+    monkeypatch.setattr('ekn.jobs.TOP_NETWORK_LIMIT', 1)
+    request = {'kind': 'top', 'service': 'service', 'from': 'one', 'flavor': 'general', 'k': 1}
+    job_id = submit(jobs, request)
+    run_job(job_id, 10, 1, request)
+    assert read_job(job_id, 10)['error'] == 'Network is too large, over 1 users would be scored.'
+
+
+def test_start_job_queue_full(monkeypatch):
+    monkeypatch.setattr('ekn.jobs.JOB_QUEUE_SIZE', 0)
+    assert not start_job('job', 10, 1, {})
+
+
+@pytest.fixture
+def job_routes(call_route, service, make_network, monkeypatch):
+    monkeypatch.setattr('ekn.admission.SCORE_EXECUTOR', 'inline')
+    # Jobs are run by the test, as it holds the database's writer lock
+    started = []
+    monkeypatch.setattr('ekn.routes.jobs.start_job', lambda *args: started.append(args) or True)
+    make_network([(1, 2), (2, 3), (1, 3)])
+
+    def submit_route(key=service, **params):
+        return call_route(submit_score_job, {
+            'service_name': 'service', 'service_key': key, 'from': 'one', 'password': 'password', **params,
+        })
+
+    def get_route(job_id, key=service, **params):
+        return call_route(get_score_job, {'service_name': 'service', 'service_key': key, 'job': job_id, **params})
+
+    return submit_route, get_route, started
+
+
+def test_submit_score_job_route(job_routes):
+    submit_route, get_route, started = job_routes
+    status, body = submit_route(**{'for': 'three'})
+    assert status == 202
+    assert body['status'] == 'queued'
+    assert get_route(body['job']) == (200, {'job': body['job'], 'status': 'queued'})
+    run_job(*started[0])
+    status, job = get_route(body['job'], wait=1)
+    assert job['result'] == {'for': 'three', 'from': 'one', 'flavor': 'general', 'score': 1.97, 'status': 200}
+
+    status, body = submit_route(k=1)
+    assert status == 202
+    assert started[1][3] == {'kind': 'top', 'service': 'service', 'from': 'one', 'flavor': 'general', 'k': 1}
+
+
+@pytest.mark.parametrize('params, expected', [
+    ({}, (400, 'Invalid k.')),
+    ({'k': 0}, (400, 'Invalid k.')),
+    ({'k': 101}, (400, 'Invalid k.')),
+    ({'k': 'x'}, (400, 'Invalid k.')),
+    ({'for': []}, (400, 'No users provided.')),
+    ({'for': [{'a': 1}]}, (400, "Invalid 'for'.")),
+    ({'for': ['two', ['three']]}, (400, "Invalid 'for'.")),
+    ({'for': {'a': 1}}, (400, "Invalid 'for'.")),
+    ({'for': ['two'] * 101}, (400, 'Too many users.')),
+    ({'for': 'one'}, (400, 'User cannot view themselves.')),
+    ({'for': 'nobody'}, (404, "'for' is not connected to this service.")),
+    ({'for': 'two', 'flavor': 'nope'}, (404, 'Flavor does not exist.')),
+    ({'for': 'two', 'key': 'wrong'}, (403, 'Service name or key is incorrect.')),
+])
+def test_submit_score_job_route_invalid(job_routes, params, expected):
+    submit_route, _, started = job_routes
+    assert submit_route(**params) == expected
+    assert started == []
+
+
+def test_submit_score_job_route_limits(job_routes, monkeypatch, db):
+    submit_route, _, started = job_routes
+    monkeypatch.setattr('ekn.routes.jobs.SERVICE_JOB_LIMIT', 1)
+    assert submit_route(**{'for': 'two'})[0] == 202
+    assert submit_route(**{'for': 'two'}) == (429, 'Too many unfinished score jobs.')
+
+    monkeypatch.setattr('ekn.routes.jobs.SERVICE_JOB_LIMIT', 2)
+    monkeypatch.setattr('ekn.routes.jobs.start_job', lambda *args: False)
+    assert submit_route(**{'for': 'two'}) == (503, 'Too many score jobs are queued, try again later.')
+    assert db.execute("SELECT COUNT(*) FROM score_jobs").fetchone()[0] == 1
+
+
+@pytest.mark.parametrize('params, expected', [
+    ({'wait': 'x'}, (400, 'Invalid wait.')),
+    ({'wait': 'nan'}, (400, 'Invalid wait.')),
+    ({'key': 'wrong'}, (403, 'Service name or key is incorrect.')),
+])
+def test_get_score_job_route_invalid(job_routes, params, expected):
+    submit_route, get_route, _ = job_routes
+    _, body = submit_route(**{'for': 'two'})
+    assert get_route(body['job'], **params) == expected
+    assert get_route('nope') == (404, 'Job does not exist.')
@@ -0,0 +1,46 @@
+from ekn.events import append_vote_events
+from ekn.maintenance import compact_graph
+
+
+def get_all_votes(db):
+    result = db.execute("SELECT user_from, user_to, category, count FROM votes")
+    return sorted(tuple(row) for row in result.fetchall())
+
+
+def test_compact_graph_empty(db):
+    report = compact_graph(db)
+    assert report['edges_before'] == report['edges_after'] == 0
+    assert report['zero_edges_removed'] == report['temp_users_merged'] == 0
+
+
+def test_compact_graph_zero_edges(db, make_network):
+    make_network([(1, 2, 0), (1, 3, 2), (2, 3, 0, 'agi safety'), (3, 1, 1)])
+    # Pending events are folded in before pruning
+    append_vote_events(db, [(3, 1, 'general', -1), (1, 2, 'general', 1)])
+
+    report = compact_graph(db)
+    assert get_all_votes(db) == [(1, 2, 'general', 1), (1, 3, 'general', 2)]
+    assert report['edges_before'] == 4
+    assert report['edges_after'] == 2
+    assert report['zero_edges_removed'] == 2
+
+
+def test_compact_graph_duplicate_temp_users(db, make_network):
+    db.executemany(
+        "INSERT INTO users (id, username, temp) VALUES (?, ?, ?)",
+        [(1, 'user1', 0), (2, 'user2', 0), (3, 'service:user1', 1), (4, 'service:user4', 1)]
+    )
+    # Temp account 3 is the same service user as user 1
+    db.executemany(
+        "INSERT INTO connections (service, service_user, user, key) VALUES (?, ?, ?, ?)",
+        [(5, 'user1', 1, 'key'), (5, 'user1', 3, None), (5, 'user4', 4, None)]
+    )
+    make_network([(3, 2, 1), (1, 2, 2), (2, 3, 3), (4, 3, 4)])
+
+    report = compact_graph(db)
+    assert report['temp_users_merged'] == 1
+    assert report['users_before'] - report['users_after'] == 1
+    assert get_all_votes(db) == [(1, 2, 'general', 3), (2, 1, 'general', 3), (4, 1, 'general', 4)]
+
+    result = db.execute("SELECT service_user, user, key FROM connections")
+    assert sorted(tuple(row) for row in result.fetchall()) == [('user1', 1, 'key'), ('user4', 4, None)]
@@ -0,0 +1,54 @@
+import json
+import pytest
+import re
+from flask import Flask
+
+from ekn.queries import QUERIES, bind_flavors, get_executions, run
+from ekn.routes import misc
+
+
+@pytest.mark.parametrize('name', sorted(QUERIES))
+def test_queries_prepare(db, name):
+    # Every statement must be valid against the current schema
+    params = {param: None for param in re.findall(r':(\w+)', QUERIES[name])}
+    db.execute(f"EXPLAIN {QUERIES[name]}", params)
+
+
+@pytest.mark.parametrize('flavors, expected', [
+    (None, None),
+    ([], None),
+    (['general'], '["general"]'),
+    (['a', "it's"], '["a", "it\'s"]'),
+])
+def test_bind_flavors(flavors, expected):
+    assert bind_flavors(flavors) == expected
+
+
+def test_run_counts_executions(db):
+    before = get_executions().get('user_id', 0)
+    run(db, 'user_id', {'username': 'user1'})
+    run(db, 'user_id', {'username': 'user2'})
+    assert get_executions()['user_id'] == before + 2
+    with Flask(__name__).test_request_context():
+        response = misc.get_query_stats()
+    assert json.loads(response.get_data())['user_id'] == before + 2
+
+
+def test_user_has_no_credentials(db):
+    db.execute("INSERT INTO users (username, password, salt) VALUES ('user1', 'hash', 'salt')")
+    user = run(db, 'user', {'id': 1}).fetchone()
+    assert set(user.keys()) == {'id', 'username', 'security', 'temp'}
+    user = run(db, 'user_credentials_by_username', {'username': 'user1'}).fetchone()
+    assert (user['password'], user['salt']) == ('hash', 'salt')
+
+
+@pytest.mark.parametrize('flavors, expected', [
+    (None, {2, 3, 4}),
+    (['general'], {2}),
+    (['general', "it's"], {2, 4}),
+    (['other'], set()),
+])
+def test_votes_from_flavors(db, make_network, flavors, expected):
+    make_network([(1, 2), (1, 3, 1, 'agi safety'), (1, 4, 1, "it's"), (2, 1)])
+    rows = run(db, 'votes_from', {'user': 1, 'flavors': bind_flavors(flavors)}).fetchall()
+    assert {row['user_to'] for row in rows} == expected
@@ -0,0 +1,28 @@
+from ekn.routes import registration
+
+
+def register(call_route, key, service_users):
+    return call_route(registration.register_temp_users, {
+        'service_name': 'service', 'service_key': key, 'service_users': service_users,
+    })
+
+
+def test_register_temp_users(call_route, service, db):
+    assert register(call_route, service, ['a', 'b', 'a']) == (200, {'created': ['a', 'b'], 'skipped': []})
+    assert register(call_route, service, ['c', 'b']) == (200, {'created': ['c'], 'skipped': ['b']})
+
+    users = db.execute(
+        "SELECT users.username, users.temp, connections.service_user FROM users "
+        + "JOIN connections ON connections.user=users.id WHERE users.temp=1 ORDER BY users.id"
+    ).fetchall()
+    assert [tuple(user) for user in users] == [('service:a', 1, 'a'), ('service:b', 1, 'b'), ('service:c', 1, 'c')]
+
+
+def test_register_temp_users_bad_request(call_route, service, db):
+    assert register(call_route, 'wrong', ['a']) == (403, 'Service name or key is incorrect.')
+    assert register(call_route, service, []) == (400, 'No users provided.')
+    assert register(call_route, service, 'not json') == (400, 'No users provided.')
+    assert register(call_route, service, ['a'] * 1001) == (400, 'Too many users.')
+    for user in (None, '', 1, ['a'], {'a': 1}):
+        assert register(call_route, service, ['a', user]) == (400, 'Invalid user.')
+    assert db.execute("SELECT COUNT(*) FROM users WHERE temp=1").fetchone()[0] == 0
@@ -0,0 +1,129 @@
+import sqlite3
+import time
+
+import pytest
+
+from ekn.helpers import update_session_key, verify_session_key
+from ekn.sessions import flush_session_keys, known_expiries, pending_keys, refresh_session_key, sweep_session_keys
+
+
+@pytest.fixture
+def users(db):
+    # user0 uses connection keys, user1 session keys and user2 neither
+    for security in (0, 1, 2):
+        db.execute(
+            "INSERT INTO users (id, username, security) VALUES (?, ?, ?)",
+            (security + 1, f"user{security}", security)
+        )
+    db.commit()
+
+
+def get_session(db, user):
+    result = db.execute("SELECT key, expires FROM session_keys WHERE user=:user", {"user": user})
+    return result.fetchone()
+
+
+@pytest.mark.parametrize('batch_size', (1, 2, 3, 100))
+def test_sweep_session_keys(db, batch_size):
+    now = int(time.time())
+    db.executemany(
+        "INSERT INTO session_keys (user, key, expires) VALUES (?, ?, ?)",
+        [(i, f"key{i}", now + (100 if i % 2 else -100)) for i in range(1, 11)]
+    )
+    assert sweep_session_keys(db, batch_size) == 5
+    result = db.execute("SELECT user FROM session_keys")
+    assert sorted(row["user"] for row in result.fetchall()) == [1, 3, 5, 7, 9]
+    assert sweep_session_keys(db, batch_size) == 0
+
+
+def test_update_session_key(db, users):
+    update_session_key("user1")
+    assert flush_session_keys(db) == 1
+    key, expires = get_session(db, 2)
+    assert expires == pytest.approx(time.time() + 86_400, abs=5)
+
+    # Valid keys are kept
+    update_session_key("user1")
+    assert flush_session_keys(db) == 0
+    assert tuple(get_session(db, 2)) == (key, expires)
+
+    # Expired keys are replaced
+    db.execute("UPDATE session_keys SET expires=1")
+    db.commit()
+    known_expiries.invalidate()
+    update_session_key("user1")
+    assert flush_session_keys(db) == 1
+    new_key, new_expires = get_session(db, 2)
+    assert new_key != key
+    assert new_expires >= expires
+
+
+def test_update_session_key_known_valid(db, users):
+    update_session_key("user1")
+    flush_session_keys(db)
+    db.execute("DELETE FROM session_keys")
+    db.commit()
+
+    # Keys known to be valid aren't looked up again
+    update_session_key("user1")
+    assert pending_keys == {}
+    known_expiries.invalidate()
+    update_session_key("user1")
+    assert 2 in pending_keys
+
+
+def test_flush_session_keys_keeps_newer_keys(db, users):
+    refresh_session_key({"id": 2, "username": "user1", "security": 1}, None)
+    db.execute(
+        "INSERT INTO session_keys (user, key, expires) VALUES (2, 'newer', :expires)",
+        {"expires": int(time.time()) + 100},
+    )
+    assert flush_session_keys(db) == 1
+    assert get_session(db, 2)["key"] == "newer"
+
+
+def test_flush_session_keys_failed_write(db, users, monkeypatch):
+    update_session_key("user1")
+    queued = dict(pending_keys)
+
+    def locked(*args):
+        raise sqlite3.OperationalError("database is locked")
+
+    with monkeypatch.context() as patch:
+        patch.setattr(db, "executemany", locked)
+        with pytest.raises(sqlite3.OperationalError):
+            flush_session_keys(db)
+    # Still queued, so written by the next flush
+    assert pending_keys == queued
+    assert flush_session_keys(db) == 1
+    assert get_session(db, 2)["key"] == queued[2][0]
+    assert pending_keys == {}
+
+
+def test_update_session_key_no_sessions(db, users):
+    update_session_key("user2")
+    assert get_session(db, 3) is None
+
+
+def test_verify_session_key(db, users):
+    for username in ("user0", "user1"):
+        update_session_key(username)
+    flush_session_keys(db)
+    db.commit()
+    key0 = get_session(db, 1)["key"]
+    key1 = get_session(db, 2)["key"]
+
+    assert verify_session_key("user0", key0)["id"] == 1
+    assert verify_session_key("user1", key1)["id"] == 2
+    assert verify_session_key("user1", key0) is None
+    assert verify_session_key("user3", key1) is None
+
+    db.execute("UPDATE session_keys SET expires=1 WHERE user=2")
+    db.commit()
+    assert verify_session_key("user1", key1) is None
+
+
+def test_verify_session_key_no_sessions(db, users):
+    db.execute("INSERT INTO session_keys (user, key, expires) VALUES (3, 'key', :expires)", {"expires": int(time.time()) + 100})
+    db.commit()
+    assert verify_session_key("user2", "key") is None
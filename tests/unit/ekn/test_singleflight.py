@@ -0,0 +1,199 @@
+import asyncio
+import threading
+import time
+
+import pytest
+
+from ekn import singleflight
+from ekn.admission import ScoreRejected
+from ekn.database import DatabaseManager
+from ekn.singleflight import SingleFlight, across_workers, peek_flight, sweep_flights
+
+
+def run_together(flight, function, count=3):
+    """Calls flight.do from `count` threads while the first call is still running."""
+    started = threading.Event()
+    finish = threading.Event()
+    results = []
+
+    def leader():
+        started.set()
+        finish.wait(5)
+        return function()
+
+    def call(fn):
+        try:
+            results.append(flight.do('key', fn))
+        except Exception as e:
+            results.append(e)
+
+    threads = [threading.Thread(target=call, args=(leader,))]
+    threads[0].start()
+    started.wait(5)
+    threads += [threading.Thread(target=call, args=(pytest.fail,)) for _ in range(count - 1)]
+    for thread in threads[1:]:
+        thread.start()
+    while flight.stats()['shared'] < count - 1:
+        time.sleep(0.01)
+    finish.set()
+    for thread in threads:
+        thread.join(5)
+    return results
+
+
+def test_single_flight_shares_result():
+    flight = SingleFlight()
+    assert run_together(flight, lambda: 1.5) == [1.5, 1.5, 1.5]
+    assert flight.stats() == {'led': 1, 'shared': 2}
+    assert flight.flights == {}
+    # Later calls run again
+    assert flight.do('key', lambda: 2) == 2
+
+
+def test_single_flight_shares_exception():
+    error = ValueError('boom')
+    flight = SingleFlight()
+
+    def fail():
+        raise error
+
+    assert run_together(flight, fail) == [error, error, error]
+    assert flight.flights == {}
+
+
+def test_single_flight_async():
+    flight = SingleFlight()
+    calls = []
+
+    async def score(value):
+        calls.append(value)
+        await asyncio.sleep(0.01)
+        return value
+
+    async def main():
+        return await asyncio.gather(*(flight.do_async('key', score, i) for i in range(3)))
+
+    assert asyncio.run(main()) == [0, 0, 0]
+    assert calls == [0]
+
+
+@pytest.mark.parametrize('cancel', [0, 1])
+def test_single_flight_async_cancelled_waiter(cancel):
+    flight = SingleFlight()
+    release = asyncio.Event()
+
+    async def score():
+        await release.wait()
+        return 1.5
+
+    async def main():
+        waiters = [asyncio.ensure_future(flight.do_async('key', score)) for _ in range(2)]
+        await asyncio.sleep(0)
+        # One client goes away, whether it started the calculation or not
+        waiters[cancel].cancel()
+        await asyncio.sleep(0)
+        release.set()
+        with pytest.raises(asyncio.CancelledError):
+            await waiters[cancel]
+        return await waiters[1 - cancel]
+
+    assert asyncio.run(main()) == 1.5
+    assert flight.flights == {}
+
+
+@pytest.fixture
+def flights(db, monkeypatch):
+    monkeypatch.setattr('ekn.singleflight.DatabaseManager', lambda read_only=False: DatabaseManager(db.path, read_only))
+    return db
+
+
+def test_across_workers_publishes_result(flights):
+    calls = []
+
+    def score():
+        calls.append(1)
+        return 0.5
+
+    assert across_workers('1:2:general', score) == 0.5
+    assert peek_flight('1:2:general') == ('done', 0.5)
+    # Another worker asking within RESULT_TTL gets the published result
+    assert across_workers('1:2:general', pytest.fail) == 0.5
+    assert calls == [1]
+    assert peek_flight('2:1:general') == ('missing', None)
+
+
+def test_across_workers_waits_for_other_worker(flights, monkeypatch):
+    flights.execute(
+        "INSERT INTO score_flights (key, owner, expires) VALUES ('k', 'other', :expires)",
+        {'expires': time.time() + 60},
+    )
+    flights.commit()
+    assert peek_flight('k') == ('running', None)
+    polls = []
+
+    def sleep(seconds):
+        # The other worker finishes while this one is waiting
+        polls.append(seconds)
+        flights.execute("UPDATE score_flights SET result='3.0' WHERE key='k'")
+        flights.commit()
+
+    monkeypatch.setattr('ekn.singleflight.time.sleep', sleep)
+    assert across_workers('k', pytest.fail) == 3.0
+    assert len(polls) == 1
+
+
+def test_across_workers_takes_over_expired_lock(flights):
+    flights.execute("INSERT INTO score_flights (key, owner, expires) VALUES ('k', 'dead', 1)")
+    flights.commit()
+    assert across_workers('k', lambda: 2.0) == 2.0
+    assert flights.execute("SELECT owner FROM score_flights WHERE key='k'").fetchone()[0] != 'dead'
+
+
+def test_across_workers_releases_lock_on_error(flights):
+    def fail():
+        raise ValueError('boom')
+
+    with pytest.raises(ValueError):
+        across_workers('k', fail)
+    assert peek_flight('k') == ('missing', None)
+    assert flights.execute("SELECT COUNT(*) FROM score_flights").fetchone()[0] == 0
+
+
+def test_sweep_flights(flights):
+    flights.execute(
+        "INSERT INTO score_flights (key, owner, result, expires) VALUES ('old', 'a', '1', 1), ('new', 'b', NULL, :expires)",
+        {'expires': time.time() + 60},
+    )
+    assert sweep_flights(flights) == 1
+    assert [row[0] for row in flights.execute("SELECT key FROM score_flights")] == ['new']
+
+
+def test_coalesce_score_off(monkeypatch):
+    monkeypatch.setattr('ekn.singleflight.COALESCING', 'off')
+    assert singleflight.coalesce_score(('service', 1, 2, 'general'), lambda x: x, 4) == 4
+
+
+def test_coalesce_score_by_service():
+    started = threading.Event()
+    finish = threading.Event()
+    results = []
+
+    def rejected():
+        started.set()
+        finish.wait(5)
+        raise ScoreRejected('Too many scores are being calculated.')
+
+    def score_a():
+        try:
+            singleflight.coalesce_score(('a', 1, 2, 'general'), rejected)
+        except ScoreRejected:
+            results.append('rejected')
+
+    thread = threading.Thread(target=score_a)
+    thread.start()
+    started.wait(5)
+    # Another service's identical score isn't turned away with service a's
+    assert singleflight.coalesce_score(('b', 1, 2, 'general'), lambda: 1.5) == 1.5
+    finish.set()
+    thread.join(5)
+    assert results == ['rejected']
@@ -0,0 +1,102 @@
+import pytest
+
+from ekn.database import DatabaseManager
+from ekn.helpers import get_votes, DECAY
+from ekn.storage import MemoryStorage, SQLiteStorage
+
+
+@pytest.fixture(params=('memory', 'sqlite'))
+def storage(request):
+    if request.param == 'memory':
+        yield MemoryStorage()
+        return
+    database = DatabaseManager.memory()
+    yield SQLiteStorage(database)
+    database.drop()
+
+
+def test_users(storage):
+    user_id = storage.add_user('user1', 'hash', 'salt')
+    temp_id = storage.add_user('service:user2', None, None, temp=True)
+    assert user_id != temp_id
+
+    user = storage.get_user(user_id)
+    assert (user['username'], user['password'], user['salt'], user['temp']) == ('user1', 'hash', 'salt', 0)
+    assert storage.get_user_by_username('service:user2')['id'] == temp_id
+    assert storage.get_user_by_username('service:user2')['temp'] == 1
+    assert storage.get_user(1234) is None
+    assert storage.get_user_by_username('user3') is None
+
+
+def test_services_and_connections(storage):
+    service_id = storage.add_service('service', 'key', 'salt')
+    assert storage.get_service('service')['id'] == service_id
+    assert storage.get_service('other') is None
+
+    user_id = storage.add_user('user1', 'hash', 'salt')
+    storage.add_connection(service_id, 'service_user1', user_id, 'key')
+    connection = storage.get_connection(service_id, 'service_user1')
+    assert (connection['user'], connection['key']) == (user_id, 'key')
+    assert storage.get_connection(service_id, 'user1') is None
+
+
+def test_categories(storage):
+    categories = {row['category']: row for row in storage.get_categories()}
+    assert categories['general']['type'] == 'general'
+    assert categories['agi safety ecosystem development']['secondary_of'] == 'agi safety research'
+    assert storage.get_category('agi safety')['type'] == 'composite'
+    assert storage.get_category('bla') is None
+
+
+def test_votes(storage):
+    storage.add_votes([(1, 2, 'general', 1), (1, 2, 'general', 2), (1, 3, 'agi safety', 4), (2, 1, 'general', 5)])
+    assert storage.get_vote_count(1, 2, 'general') == 3
+    assert storage.get_vote_count(1, 3) == 4
+    assert storage.get_vote_count(3, 1) == 0
+
+    def edges(rows):
+        return sorted((row['user_from'], row['user_to'], row['category'], row['count']) for row in rows)
+
+    assert edges(storage.get_votes_from(1)) == [(1, 2, 'general', 3), (1, 3, 'agi safety', 4)]
+    assert edges(storage.get_votes_from(1, ['agi safety'])) == [(1, 3, 'agi safety', 4)]
+    assert edges(storage.get_votes_from(3)) == []
+
+
+def test_reachable(storage):
+    storage.add_votes([
+        (1, 2, 'general', 1), (2, 3, 'general', 1), (3, 1, 'general', 1), (1, 3, 'general', 1),
+        (3, 4, 'general', 1), (4, 5, 'agi safety', 1), (6, 1, 'general', 1),
+    ])
+    assert storage.get_reachable(1, None, None, 100) == {1, 2, 3, 4, 5}
+    assert storage.get_reachable(1, ['general'], None, 100) == {1, 2, 3, 4}
+    assert storage.get_reachable(1, None, 3, 100) == {1, 2, 3}
+    assert storage.get_reachable(7, None, None, 100) == {7}
+    assert len(storage.get_reachable(1, None, None, 3)) >= 3
+
+
+def test_reachable_long_chain(storage):
+    # However far away users are, like the Python walk
+    storage.add_votes([(i, i + 1, 'general', 1) for i in range(1, 40)])
+    assert storage.get_reachable(1, None, None, 100) == set(range(1, 41))
+
+
+def test_session_keys(storage):
+    assert storage.get_session_key(1) is None
+    storage.set_session_key(1, 'key', 123)
+    storage.set_session_key(1, 'new key', 456)
+    session = storage.get_session_key(1)
+    assert (session['key'], session['expires']) == ('new key', 456)
+
+
+def test_storage_context_reuses_connection(storage):
+    with storage:
+        with storage:
+            storage.add_votes([(1, 2, 'general', 1)])
+        assert storage.get_vote_count(1, 2) == 1
+
+
+def test_get_votes_with_storage(storage):
+    storage.add_votes([(2, 1, 'general', 5), (3, 2, 'general', 1)])
+    assert get_votes(1, 2, 'general', storage) == 5 * (1 - DECAY)
+    assert get_votes(1, 3, 'general', storage) == pytest.approx(6 * (1 - DECAY) ** 2, 0.01)
+    assert get_votes(2, 1, 'general', storage) == 0.0
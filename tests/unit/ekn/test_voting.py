@@ -0,0 +1,132 @@
+from ekn.routes import voting, votes
+
+
+def vote(to, _from='one', password='password', **extra):
+    return {'to': to, 'from': _from, 'password': password, **extra}
+
+
+def test_votes_mixed(call_route, service, db):
+    status, results = call_route(votes, {'service_name': 'service', 'service_key': service, 'votes': [
+        vote('two'),
+        vote(['two']),
+        vote('three', password={'a': 1}),
+        vote('two', flavor=['general']),
+        'not a vote',
+        vote('one'),
+        vote('nobody'),
+        vote('two', flavor='nope'),
+        vote('three', amount='x'),
+        vote('three', password='wrong'),
+        vote('three', amount=2),
+    ]})
+    assert status == 200
+    assert [(result['status'], result['message']) for result in results] == [
+        (200, 'Success.'),
+        (400, 'Invalid vote.'),
+        (400, 'Invalid vote.'),
+        (400, 'Invalid vote.'),
+        (400, 'Invalid vote.'),
+        (400, 'User cannot vote for themselves.'),
+        (404, "'to' is not connected to this service."),
+        (404, 'Flavor does not exist.'),
+        (400, 'Invalid amount.'),
+        (403, 'Username or Password is incorrect.'),
+        (200, 'Success.'),
+    ]
+    events = db.execute("SELECT user_from, user_to, category, amount FROM vote_events ORDER BY seq").fetchall()
+    assert [tuple(event) for event in events] == [(1, 2, 'general', 1), (1, 3, 'general', 2)]
+    # Folded into the votes table straight away, so scores see them
+    votes_table = db.execute("SELECT user_from, user_to, category, count FROM votes ORDER BY user_to").fetchall()
+    assert [tuple(row) for row in votes_table] == [(1, 2, 'general', 1), (1, 3, 'general', 2)]
+
+
+def test_votes_repeated_credentials(call_route, service, monkeypatch):
+    checked = []
+    verify = voting.verify_credentials
+
+    def verify_credentials(*args):
+        checked.append(args[0])
+        return verify(*args)
+
+    monkeypatch.setattr('ekn.routes.voting.verify_credentials', verify_credentials)
+    status, results = call_route(votes, {'service_name': 'service', 'service_key': service, 'votes': [
+        vote('two'), vote('three'), vote('two', amount=3), vote('one', _from='two'),
+    ]})
+    assert [result['status'] for result in results] == [200, 200, 200, 200]
+    assert checked == ['one', 'two']
+
+
+def test_votes_negative_total(call_route, service):
+    status, results = call_route(votes, {'service_name': 'service', 'service_key': service, 'votes': [
+        vote('two', amount=2), vote('two', amount=-3), vote('two', amount=-2), vote('two', amount=-1),
+    ]})
+    assert [result['status'] for result in results] == [200, 400, 200, 400]
+    assert results[1]['message'] == 'Cannot have a negative amount of trust.'
+
+
+def test_votes_bad_request(call_route, service):
+    assert call_route(votes, {'service_name': 'service', 'service_key': 'wrong', 'votes': [vote('two')]}) == (
+        403, 'Service name or key is incorrect.'
+    )
+    assert call_route(votes, {'service_name': 'service', 'service_key': service, 'votes': []}) == (
+        400, 'No votes provided.'
+    )
+    assert call_route(votes, {'service_name': 'service', 'service_key': service, 'votes': [vote('two')] * 101}) == (
+        400, 'Too many votes.'
+    )
+
+
+def get_counts(call_route, key, _for, flavor=None):
+    return call_route(voting.get_vote_count, {
+        'service_name': 'service', 'service_key': key, 'for': _for, 'from': 'one', 'password': 'password',
+        'flavor': flavor,
+    })
+
+
+def test_get_vote_counts(call_route, service, db):
+    call_route(votes, {'service_name': 'service', 'service_key': service, 'votes': [
+        vote('two', amount=2), vote('three', flavor='agi safety research'),
+    ]})
+    status, results = get_counts(call_route, service, ['two', 'three', 'one', 'nobody'])
+    assert status == 200
+    assert [(result['for'], result['status'], result.get('votes')) for result in results] == [
+        ('two', 200, 2), ('three', 200, 1), ('one', 400, None), ('nobody', 404, None),
+    ]
+    status, results = get_counts(call_route, service, 'three', ['general', 'agi safety research'])
+    assert [(result['flavor'], result['votes']) for result in results] == [('general', 0), ('agi safety research', 1)]
+
+
+def test_get_vote_counts_bad_request(call_route, service):
+    assert get_counts(call_route, service, ['two', ['three']]) == (400, "Invalid 'for'.")
+    assert get_counts(call_route, service, [{'a': 1}]) == (400, "Invalid 'for'.")
+    assert get_counts(call_route, service, ['two'], [['general']]) == (400, 'Invalid flavor.')
+    assert get_counts(call_route, service, []) == (400, 'No users provided.')
+    assert get_counts(call_route, service, ['two'], ['nope']) == (404, 'Flavor does not exist.')
+
+
+def test_get_score_etag(call_route, service, make_network, monkeypatch):
+    monkeypatch.setattr('ekn.admission.SCORE_EXECUTOR', 'inline')
+    make_network([(1, 2)])
+    body = {'service_name': 'service', 'service_key': service, 'for': 'two', 'from': 'one', 'password': 'password'}
+    etag = []
+    monkeypatch.setattr('ekn.routes.voting.make_etag', lambda *parts: etag.append(parts) or 'tag')
+    assert call_route(voting.get_score, body)[0] == 200
+    # The names are echoed in the body, so are part of the tag along with the ids
+    assert etag[0][-5:] == (2, 1, 'two', 'one', 'general')
+    assert call_route(voting.get_score, body, {'If-None-Match': '"tag"'}) == (304, '')
+    assert call_route(voting.get_score, body, {'If-None-Match': '*'})[0] == 200
+    assert call_route(voting.get_score, {**body, 'password': 'wrong'}, {'If-None-Match': '"tag"'})[0] == 403
+
+
+def test_get_score_coalesced_by_data_version(call_route, service, make_network, monkeypatch):
+    monkeypatch.setattr('ekn.admission.SCORE_EXECUTOR', 'inline')
+    make_network([(1, 2)])
+    keys = []
+    monkeypatch.setattr('ekn.routes.voting.coalesce_score', lambda key, *args: keys.append(key) or 1.0)
+    body = {'service_name': 'service', 'service_key': service, 'for': 'two', 'from': 'one', 'password': 'password'}
+    call_route(voting.get_score, body)
+    call_route(votes, {'service_name': 'service', 'service_key': service, 'votes': [vote('three')]})
+    call_route(voting.get_score, body)
+    # A vote in between means the second score can't share the first's calculation
+    assert keys[0][:4] == keys[1][:4] == ('service', 2, 1, 'general')
+    assert keys[0] != keys[1]